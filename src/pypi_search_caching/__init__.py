@@ -3,6 +3,13 @@ from .pypi_search_caching import (
     get_packages,
     fetch_project_details,
     fetch_all_package_names,
+    iter_simple_index_names,
+    fetch_package_index,
+    parse_simple_index_json,
+    fetch_changelog_since_serial,
+    apply_changelog,
+    normalize_name,
+    refresh_packages_incremental,
     is_cache_valid,
     load_cached_packages,
     save_packages_to_cache,
@@ -30,6 +37,13 @@ __all__ = [
     'get_packages',
     'fetch_project_details',
     'fetch_all_package_names',
+    'iter_simple_index_names',
+    'fetch_package_index',
+    'parse_simple_index_json',
+    'fetch_changelog_since_serial',
+    'apply_changelog',
+    'normalize_name',
+    'refresh_packages_incremental',
     'is_cache_valid',
     'load_cached_packages',
     'save_packages_to_cache',
@@ -24,7 +24,10 @@ import sys
 import re
 import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import math
 import os
 import logging
 import msgpack
@@ -41,16 +44,87 @@ import zlib
 import json
 import struct
 import base64
-from typing import Dict, Any, Optional, List
+import mmap
+import xmlrpc.client
+import email.utils
+import hashlib
+import types
+import concurrent.futures
+import contextlib
+import multiprocessing
+import threading
+import socket
+import socketserver
+from multiprocessing import shared_memory
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from itertools import accumulate
+from array import array
+from html import unescape
+from typing import Dict, Any, Optional, List, Iterable, Iterator, NamedTuple
+
+try:
+    from re import _parser as _sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse as _sre_parse
+
+try:  # optional: much faster decoding of the ~750k-project JSON index
+    import orjson
+
+    _fast_json_loads = orjson.loads
+except ImportError:
+    _fast_json_loads = json.loads
 
 PYPI_SIMPLE_URL = "https://pypi.org/simple"
+PYPI_SIMPLE_JSON_TYPE = "application/vnd.pypi.simple.v1+json"
+# PEP 691 content negotiation: prefer JSON, accept HTML as a fallback
+PYPI_SIMPLE_ACCEPT = f"{PYPI_SIMPLE_JSON_TYPE}, text/html;q=0.01"
 PYPI_JSON_URL = "https://pypi.org/pypi/{package_name}/json"
+PYPI_XMLRPC_URL = "https://pypi.org/pypi"  # changelog_since_serial()
 CACHE_DIR = Path.home() / ".cache" / "pypi_search"
 CACHE_FILE = CACHE_DIR / "pypi_search.cache"
+NAMES_BUFFER_FILE = CACHE_DIR / "pypi_names.buf"  # newline-delimited names, mmapped for search
+NAMES_INDEX_FILE = CACHE_DIR / "pypi_names.idx"  # line offsets + lowercase order for prefix lookups
+TRIGRAM_INDEX_FILE = CACHE_DIR / "pypi_names.tri"  # lowercase trigram -> line posting lists
+NAMES_NORM_FILE = CACHE_DIR / "pypi_names.norm"  # PEP 503 normalized names, line-parallel to the buffer
+DAEMON_SOCKET = CACHE_DIR / "pypi_search.sock"  # `--serve` listens here
 CACHE_MAX_AGE_SECONDS = 23 * 3600  # 23 hours
 
+SIMPLE_STREAM_CHUNK_SIZE = 64 * 1024  # bytes per iter_content() chunk
+_SIMPLE_ANCHOR_RE = re.compile(rb"<a\b[^>]*>([^<]*)</a\s*>", re.IGNORECASE)
+
 LMDB_DIR = CACHE_DIR / "lmdb"
+CONFIG_FILE = Path.home() / ".config" / "pypi_search" / "config.toml"  # [lmdb] table, see lmdb_settings
+# Environment settings; overridden by CONFIG_FILE, then by PYPI_SEARCH_LMDB_<NAME> variables
+LMDB_DEFAULTS: Dict[str, Any] = {
+    "map_size": 64 * 1024**2,  # initial map; doubled on MapFullError...
+    "max_map_size": 10 * 1024**3,  # ...up to this ceiling
+    "writemap": False,
+    "readahead": False,
+    "max_readers": 126,  # reader table slots shared by every process using the cache
+    "lock": True,  # LMDB's lock file; only turn off when a single process (and thread) uses the cache
+}
 LMDB_CACHE_MAX_AGE_SECONDS = 7 * 24 * 3600  # 7 days
+LMDB_WRITE_BATCH_SIZE = 64  # records buffered by CacheManager.batch() before a commit
+LMDB_WRITE_BATCH_INTERVAL_SECONDS = 1.0  # ...or once the oldest buffered record is this old
+# Details cache sub-databases, all keyed by normalized project name. Their
+# names live in the main database and start with "_", unlike any project key.
+LMDB_EXPIRY_DB = b"_expiry"  # (timestamp, key) index of the details entries
+LMDB_META_DB = b"_meta"  # fixed-layout meta record, see encode_details_meta
+LMDB_JSON_DB = b"_json"  # compressed PyPI JSON
+LMDB_MD_DB = b"_md"  # compressed rendered Markdown (only stored with -f)
+LMDB_DESC_DB = b"_desc"  # compressed info.description text
+LMDB_DICT_DB = b"_dicts"  # trained zstd dictionaries by ">I" id, b"current" -> id of the one in use
+LMDB_RENDERED_DB = b"_rendered"  # displayed -d Markdown by key + b"\0d" / b"\0f" (-f), see store_rendered_details
+LMDB_DETAILS_DBS = (
+    LMDB_EXPIRY_DB, LMDB_META_DB, LMDB_JSON_DB, LMDB_MD_DB, LMDB_DESC_DB, LMDB_DICT_DB, LMDB_RENDERED_DB
+)
+LMDB_DICT_SIZE = 64 * 1024  # bytes of trained zstd dictionary
+LMDB_DICT_SAMPLES = 2000  # cached JSON documents sampled to train it
+LMDB_DICT_MIN_SAMPLES = 100  # fewer cached projects than this: no dictionary
+LMDB_DICT_SAMPLE_BYTES = 4096  # leading bytes of each sample; trains faster and on the shared shape
+LMDB_PRUNE_INTERVAL_SECONDS = 3600  # CacheManager.prune_expired() runs at most this often
+FETCH_CONCURRENCY = 8  # --concurrency default: PyPI JSON requests in flight for -d and --search
 
 from pygments.style import Style
 from pygments.token import Token
@@ -250,27 +324,562 @@ def rich_table_to_markdown(table: Table, console: Console = None) -> str:
     return "\n".join(lines)
 
 
+# Post-processing of the details Markdown before display (clean_details_markdown)
+_DETAILS_MD_DROP_PREFIXES = (".. image::", "   :height: ", "   :width: ", "   :alt: ", ":raw-html-m2r:", "   :target: ")
+_DETAILS_MD_SUBS = [
+    (re.compile(pattern, re.MULTILINE), repl)
+    for pattern, repl in (
+        (r"\\?\s*:raw-html-m2r:\s*(`[^`]+`)\\?\s*", r"\1"),
+        (r"`<br>`", r"\n\n"),
+        (r"#\.", r"*"),
+        (r"\\ ", r" "),
+        (r"(^\.\.\s+([^:]+\:)\s+(https?://[^\s]+))", r" - \2 `\3`"),
+        (r"<#", r"<\#"),
+        (r">_", r">"),
+        (r">`_", r">`"),
+        (r"` (?=\W)", r"`"),
+    )
+]
+
+
+def clean_details_markdown(md: str) -> str:
+    """Drop RST image/raw-html lines and fix leftover RST markup in the details Markdown."""
+    md = "\n".join(
+        line for line in md.split("\n") if not (line.startswith(_DETAILS_MD_DROP_PREFIXES) or line == "|")
+    )
+    for regex, repl in _DETAILS_MD_SUBS:
+        md = regex.sub(repl, md)
+    return md
+
+
+# Binary all_packages record:
+#   header  ">4sBBIdI": magic, version, codec, count, timestamp, meta_len
+#   meta    msgpack {etag, last_modified, last_serial}
+#   ">I" + codec(serials as int64 array, -1 = unknown)   (length 0 if none)
+#   ">I" + codec(newline-separated UTF-8 names)
+NAMES_RECORD_MAGIC = b"PSNR"
+NAMES_RECORD_VERSION = 1
+_NAMES_HEADER = struct.Struct(">4sBBIdI")
+_NAMES_TIMESTAMP_OFFSET = 10  # magic(4) + version(1) + codec(1) + count(4)
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_ZSTD_DICT = 3  # zstd with a trained dictionary, named by the frame's dict id
+ZSTD_LEVEL = 9  # names record: one large blob, written once a day
+DETAILS_ZSTD_LEVEL = 3  # details parts: ~4x faster than 9 per record, ~4% larger
+
+try:  # optional: zstd decompresses the names blob several times faster than zlib
+    import zstandard
+
+    _CODEC_ERRORS = (zlib.error, ValueError, zstandard.ZstdError)
+except ImportError:
+    zstandard = None
+    _CODEC_ERRORS = (zlib.error, ValueError)
+
+# zstd contexts are reused (they keep their work buffers and digested
+# dictionary) but not thread-safe, hence one set per thread.
+_zstd_local = threading.local()
+
+
+def _zstd_context(compress: bool, dictionary=None, level: int = ZSTD_LEVEL):
+    contexts = getattr(_zstd_local, "contexts", None)
+    if contexts is None:
+        contexts = _zstd_local.contexts = {}
+    key = (compress, dictionary.dict_id() if dictionary is not None else 0, level if compress else 0)
+    ctx = contexts.get(key)
+    if ctx is None:
+        if compress:
+            ctx = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+        else:
+            ctx = zstandard.ZstdDecompressor(dict_data=dictionary)
+        contexts[key] = ctx
+    return ctx
+
+
+def compress_blob(data: bytes, codec: int, dictionary=None, level: int = ZSTD_LEVEL) -> bytes:
+    if codec in (CODEC_ZSTD, CODEC_ZSTD_DICT):
+        return _zstd_context(True, dictionary if codec == CODEC_ZSTD_DICT else None, level).compress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data)
+    return data
+
+
+def decompress_blob(data: bytes, codec: int, dictionary=None) -> bytes:
+    if codec in (CODEC_ZSTD, CODEC_ZSTD_DICT):
+        if zstandard is None:
+            raise ValueError("zstd-compressed record but zstandard is not installed")
+        if codec == CODEC_ZSTD_DICT and dictionary is None:
+            raise ValueError("zstd dictionary record but no dictionary given")
+        return _zstd_context(False, dictionary if codec == CODEC_ZSTD_DICT else None).decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    return data
+
+
+def zstd_frame_dict_id(data: bytes) -> int:
+    """Id of the dictionary a zstd frame was compressed with (0 for none)."""
+    if zstandard is None:
+        raise ValueError("zstd-compressed record but zstandard is not installed")
+    return zstandard.get_frame_parameters(data).dict_id
+
+
+def default_codec() -> int:
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+def encode_names_record(
+    packages: List[str],
+    timestamp: float,
+    serials: Optional[Dict[str, int]] = None,
+    meta: Optional[Dict[str, Any]] = None,
+    codec: Optional[int] = None,
+) -> bytes:
+    """Encode package names (plus serials and validators) as a binary all_packages record."""
+    codec = default_codec() if codec is None else codec
+    raw_names = "\n".join(packages).encode("utf-8")
+    meta = dict(meta or {})
+    meta["names_size"] = len(raw_names)
+    meta_bytes = msgpack.packb(meta)
+    names_blob = compress_blob(raw_names, codec)
+    serials_blob = b""
+    if serials:
+        arr = array("q", (serials.get(n, -1) for n in packages))
+        if sys.byteorder != "big":
+            arr.byteswap()
+        serials_blob = compress_blob(arr.tobytes(), codec)
+    return (
+        _NAMES_HEADER.pack(
+            NAMES_RECORD_MAGIC,
+            NAMES_RECORD_VERSION,
+            codec,
+            len(packages),
+            timestamp,
+            len(meta_bytes),
+        )
+        + meta_bytes
+        + struct.pack(">I", len(serials_blob))
+        + serials_blob
+        + struct.pack(">I", len(names_blob))
+        + names_blob
+    )
+
+
+def _decode_legacy_names_entry(value: bytes, with_names: bool) -> Dict[str, Any]:
+    # Pre-binary record: JSON {"data": b64(zlib(json(names))), "timestamp", ...}
+    cache_entry = json.loads(value.decode("utf-8"))
+    record = {
+        "legacy": True,
+        "timestamp": cache_entry["timestamp"],
+        "etag": cache_entry.get("etag"),
+        "last_modified": cache_entry.get("last_modified"),
+        "last_serial": cache_entry.get("last_serial"),
+        "names_size": None,
+        "buffer_mtime_ns": None,
+        "names_blob": None,
+        "names": None,
+        "serials": None,
+    }
+    if with_names:
+        names = json.loads(zlib.decompress(base64.b64decode(cache_entry["data"])))
+        record["names"] = names
+        if cache_entry.get("serials"):
+            serial_list = json.loads(
+                zlib.decompress(base64.b64decode(cache_entry["serials"]))
+            )
+            record["serials"] = {
+                n: s for n, s in zip(names, serial_list) if s is not None
+            }
+    return record
+
+
+def decode_names_record(value: bytes, with_names: bool = True) -> Dict[str, Any]:
+    """Decode an all_packages record (binary or legacy JSON).
+
+    Only the fixed header and meta are parsed unless `with_names` is set;
+    then "names_blob" holds the newline-separated UTF-8 names, "names" the
+    decoded list and "serials" the {name: serial} map (if recorded).
+    """
+    value = bytes(value)
+    if value[:4] != NAMES_RECORD_MAGIC:
+        return _decode_legacy_names_entry(value, with_names)
+
+    _, version, codec, count, timestamp, meta_len = _NAMES_HEADER.unpack_from(value)
+    if version != NAMES_RECORD_VERSION:
+        raise ValueError(f"Unsupported names record version {version}")
+    pos = _NAMES_HEADER.size
+    meta = msgpack.unpackb(value[pos:pos + meta_len], raw=False)
+    pos += meta_len
+    record = {
+        "legacy": False,
+        "codec": codec,
+        "count": count,
+        "timestamp": timestamp,
+        "etag": meta.get("etag"),
+        "last_modified": meta.get("last_modified"),
+        "last_serial": meta.get("last_serial"),
+        "names_size": meta.get("names_size"),
+        "buffer_mtime_ns": meta.get("buffer_mtime_ns"),
+        "names_blob": None,
+        "names": None,
+        "serials": None,
+    }
+    if not with_names:
+        return record
+
+    (len_s,) = struct.unpack_from(">I", value, pos)
+    pos += 4
+    serials_blob = value[pos:pos + len_s]
+    pos += len_s
+    (len_n,) = struct.unpack_from(">I", value, pos)
+    pos += 4
+    names_blob = decompress_blob(value[pos:pos + len_n], codec)
+    names = names_blob.decode("utf-8").split("\n") if count else []
+    if len(names) != count:
+        raise ValueError(f"Names record count mismatch ({len(names)} != {count})")
+    record["names_blob"] = names_blob
+    record["names"] = names
+    if len_s:
+        arr = array("q")
+        arr.frombytes(decompress_blob(serials_blob, codec))
+        if sys.byteorder != "big":
+            arr.byteswap()
+        record["serials"] = {n: s for n, s in zip(names, arr) if s >= 0}
+    return record
+
+
+def _record_meta(cache_entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        k: cache_entry[k]
+        for k in ("etag", "last_modified", "last_serial")
+        if cache_entry[k] is not None
+    }
+
+
 class CacheManager:
+    """Names cache record, plus the process-wide LMDB environment.
+
+    The environment is opened once per process (per LMDB_DIR) and shared
+    by every CacheManager and the details cache, so its read transactions
+    are recycled: lmdb resets a finished read transaction and renews it on
+    the next `begin()`. `batch()` buffers puts so a run of stores commits
+    in one write transaction, and `prune_expired()` drops expired details
+    entries at most once per LMDB_PRUNE_INTERVAL_SECONDS.
+    """
+
+    full_json = False  # cache whole PyPI JSON documents (--full-json), not their projection
+    sync = True  # fsync every commit; False (--no-sync) syncs once when a batch ends
+    _env: Optional[lmdb.Environment] = None
+    _env_dir: Optional[Path] = None
+    _env_sync = True
+    _details_dbs: Optional[Dict[bytes, Any]] = None
+    _pruned_at: Optional[float] = None
+    _zstd_dicts: Optional[tuple] = None
+    _env_lock = threading.Lock()
+    _local = threading.local()
+
     def __init__(self):
         self.env = None
 
     def _get_env(self):
         if self.env is None:
-            self.env = init_lmdb_env()
+            self.env = self.shared_env()
         return self.env
 
-    def load(self) -> Optional[List[str]]:
+    @classmethod
+    def shared_env(cls) -> lmdb.Environment:
+        """Return the process-wide environment, opening it on first use."""
+        with cls._env_lock:
+            if cls._env is not None and cls._env_dir != LMDB_DIR:
+                cls._close_env()
+            if cls._env is None:
+                env = init_lmdb_env()
+                cls._details_dbs = open_details_dbs(env)
+                cls._env, cls._env_dir, cls._env_sync = env, LMDB_DIR, cls.sync
+            return cls._env
+
+    @classmethod
+    def close_shared_env(cls):
+        """Close the shared environment; the next use reopens it."""
+        with cls._env_lock:
+            cls._close_env()
+
+    @classmethod
+    def _close_env(cls):
+        if cls._env is not None:
+            if not cls._env_sync:
+                cls._env.sync(True)
+            cls._env.close()
+        cls._env = None
+        cls._env_dir = None
+        cls._details_dbs = None
+        cls._pruned_at = None
+        cls._zstd_dicts = None
+
+    @classmethod
+    def details_dbs(cls, env: Optional[lmdb.Environment] = None) -> Dict[bytes, Any]:
+        """Return {name: handle} of the details sub-databases of `env` (default: the shared environment)."""
+        env = cls.shared_env() if env is None else env
+        return cls._details_dbs if env is cls._env else open_details_dbs(env)
+
+    @classmethod
+    def zstd_dictionaries(cls, env: Optional[lmdb.Environment] = None, reload: bool = False) -> tuple:
+        """Return ({dict_id: dictionary}, current id or None) of `env`, loaded once for the shared environment."""
+        env = cls.shared_env() if env is None else env
+        if env is not cls._env:
+            return load_zstd_dictionaries(env)
+        dicts = cls._zstd_dicts
+        if dicts is None or reload:
+            # Loaded outside _env_lock: callers may be inside a transaction (see TxnGate)
+            dicts = load_zstd_dictionaries(env)
+            with cls._env_lock:
+                cls._zstd_dicts = dicts
+        return dicts
+
+    @classmethod
+    def details_codec(cls, env: Optional[lmdb.Environment] = None) -> tuple:
+        """(codec, dictionary) new details entries are stored with."""
+        dicts, current = cls.zstd_dictionaries(env)
+        if current in dicts:
+            return CODEC_ZSTD_DICT, dicts[current]
+        return default_codec(), None
+
+    @classmethod
+    def prune_expired(cls, verbose=False) -> int:
+        """Prune the shared environment unless that already happened in the last LMDB_PRUNE_INTERVAL_SECONDS."""
+        env = cls.shared_env()
+        with cls._env_lock:
+            now = time.time()
+            if cls._pruned_at is not None and now - cls._pruned_at < LMDB_PRUNE_INTERVAL_SECONDS:
+                return 0
+            cls._pruned_at = now
+        return prune_lmdb_cache(env, verbose=verbose)
+
+    @classmethod
+    @contextlib.contextmanager
+    def read_txn(cls, env: Optional[lmdb.Environment] = None):
+        """Yield a read transaction on `env` (default: the shared environment)."""
+        env = cls.shared_env() if env is None else env
+        with txn_gate.shared():
+            try:
+                txn = env.begin()
+            except lmdb.ReadersFullError:
+                # Slots of crashed processes are only freed by a reader check
+                env.reader_check()
+                txn = env.begin()
+            with txn:
+                yield txn
+
+    @classmethod
+    def get(
+        cls, key: bytes, env: Optional[lmdb.Environment] = None, db: Optional[bytes] = None
+    ) -> Optional[bytes]:
+        """Return the value of `key` in sub-database `db` (default: main), pending batch puts included."""
+        return cls.get_many([(db, key)], env=env)[0]
+
+    @classmethod
+    def get_many(cls, items, env: Optional[lmdb.Environment] = None) -> List[Optional[bytes]]:
+        """Return the values of (db, key) `items` read in one transaction, so they are consistent."""
+        pending = None
+        if env is None or env is cls._env:
+            pending = getattr(cls._local, "pending", None)
+        dbs = cls.details_dbs(env) if any(db is not None for db, _ in items) else {}
+        values = []
+        with cls.read_txn(env) as txn:
+            for db, key in items:
+                if pending and (db, key) in pending:
+                    values.append(pending[(db, key)])
+                    continue
+                value = txn.get(key, db=dbs[db] if db is not None else None)
+                values.append(bytes(value) if value is not None else None)
+        return values
+
+    @classmethod
+    def put(
+        cls,
+        key: bytes,
+        value: Optional[bytes],
+        env: Optional[lmdb.Environment] = None,
+        db: Optional[bytes] = None,
+    ):
+        """Store `value` (None deletes) under `key` in sub-database `db` (default: main)."""
+        cls.put_many([(db, key, value)], env=env)
+
+    @classmethod
+    def put_many(cls, items, env: Optional[lmdb.Environment] = None):
+        """Apply (db, key, value) puts, one record, in one write transaction.
+
+        Deferred to the batch commit when `batch()` is active in this thread.
+        """
+        if env is None or env is cls._env:
+            local = cls._local
+            if getattr(local, "pending", None) is not None:
+                items = list(items)
+                for db, key, value in items:
+                    local.pending[(db, key)] = value
+                if local.deferred is not None:
+                    local.deferred.append(items)
+                    return
+                if not local.records:
+                    local.oldest = time.monotonic()
+                local.records += 1
+                if (
+                    local.records >= local.batch_size
+                    or time.monotonic() - local.oldest >= local.interval
+                ):
+                    cls._flush()
+                return
+        cls._commit(items, env)
+
+    @classmethod
+    def _commit(cls, items, env: Optional[lmdb.Environment] = None):
+        """Write (db, key, value) puts in one write transaction now, also inside batch()."""
+        env = cls.shared_env() if env is None else env
+        dbs = cls.details_dbs(env) if any(db is not None for db, _, _ in items) else {}
+
+        def put(txn):
+            for db, key, value in items:
+                _put_entry(txn, dbs, db, key, value)
+
+        write_with_growth(env, put)
+
+    @classmethod
+    def _flush(cls):
+        pending = cls._local.pending
+        if pending:
+
+            def put(txn):
+                for (db, key), value in pending.items():
+                    _put_entry(txn, cls._details_dbs, db, key, value)
+
+            write_with_growth(cls.shared_env(), put)
+            pending.clear()
+        cls._local.records = 0
+
+    @classmethod
+    @contextlib.contextmanager
+    def batch(cls, size: int = LMDB_WRITE_BATCH_SIZE, interval: float = LMDB_WRITE_BATCH_INTERVAL_SECONDS):
+        """Buffer this thread's records and commit them in one write transaction.
+
+        A commit happens every `size` records, or on the first record stored
+        `interval` seconds after the oldest buffered one, and always when the
+        block exits, including on an exception or Ctrl-C. An environment
+        opened without `sync` is synced to disk once at that point.
+        """
+        if getattr(cls._local, "pending", None) is not None:
+            yield  # already batching
+            return
+        local = cls._local
+        local.pending, local.records, local.batch_size, local.interval = {}, 0, size, interval
+        local.deferred = None
+        try:
+            yield
+        finally:
+            try:
+                cls._flush()
+            finally:
+                local.pending = None
+                env = cls._env
+                if env is not None and not cls._env_sync:
+                    env.sync(True)
+
+    @classmethod
+    def batching(cls) -> bool:
+        """True when this thread is inside `batch()`."""
+        return getattr(cls._local, "pending", None) is not None
+
+    @classmethod
+    def run_deferred(cls, fn, *args) -> tuple:
+        """Return (fn(*args), puts), holding back the shared-environment puts fn makes.
+
+        `puts` lists the put_many() items in order, for the thread that owns
+        a batch() to store, so they join its commits; fn reads its own puts
+        meanwhile. If fn raises, its puts are written before the error
+        propagates.
+        """
+        if cls.batching():
+            return fn(*args), []  # already batching in this thread
+        local = cls._local
+        local.pending, local.deferred = {}, []
+        puts = local.deferred
+        try:
+            return fn(*args), puts
+        except BaseException:
+            local.pending = local.deferred = None
+            for items in puts:
+                cls.put_many(items)
+            raise
+        finally:
+            local.pending = local.deferred = None
+
+    def _read_raw(self) -> Optional[bytes]:
+        return self.get(b"all_packages", env=self._get_env())
+
+    def _read_entry(self, with_names: bool = False) -> Optional[Dict[str, Any]]:
+        value = self._read_raw()
+        if value:
+            return decode_names_record(value, with_names=with_names)
+        return None
+
+    def _put_record(self, value: bytes):
+        # Never deferred by batch(): the names buffer files are replaced
+        # already, and readers match them against the committed record
+        self._commit([(None, b"all_packages", value)], env=self._get_env())
+
+    def _write(
+        self,
+        packages: List[str],
+        timestamp: float,
+        serials: Optional[Dict[str, int]] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> List[str]:
+        # Names are kept sorted so prefix queries can bisect the buffer
+        packages = sorted(packages)
+        # The record remembers which names buffer file matches it
+        meta = dict(meta or {})
+        meta["buffer_mtime_ns"] = write_names_buffer(packages)
+        value = encode_names_record(packages, timestamp, serials=serials, meta=meta)
+        self._put_record(value)
+        return packages
+
+    def rebuild_names_buffer(self) -> Optional[Dict[str, Any]]:
+        """Rewrite the names buffer file from the LMDB record; returns the new header."""
+        cache_entry = self._read_entry(with_names=True)
+        if not cache_entry:
+            return None
+        self._write(
+            cache_entry["names"],
+            cache_entry["timestamp"],
+            serials=cache_entry["serials"],
+            meta=_record_meta(cache_entry),
+        )
+        return self._read_entry()
+
+    def load_header(self) -> Optional[Dict[str, Any]]:
+        """Return the all_packages record header (timestamp, count, meta) without decoding names."""
+        try:
+            return self._read_entry()
+        except Exception as e:
+            logging.warning(f"LMDB load error: {e}")
+            return None
+
+    def _read_fresh(self, allow_stale: bool) -> Optional[Dict[str, Any]]:
+        # Freshness is decided from the fixed header before touching the names
+        value = self._read_raw()
+        if not value:
+            return None
+        cache_entry = decode_names_record(value, with_names=False)
+        if allow_stale or time.time() - cache_entry["timestamp"] < CACHE_MAX_AGE_SECONDS:
+            return decode_names_record(value, with_names=True)
+        return None
+
+    def load(self, allow_stale: bool = False) -> Optional[List[str]]:
         try:
-            env = self._get_env()
-            with env.begin() as txn:
-                value = txn.get(b"all_packages")
-                if value:
-                    cache_entry = json.loads(value.decode("utf-8"))
-                    compressed = base64.b64decode(cache_entry["data"])
-                    ts = cache_entry["timestamp"]
-                    if time.time() - ts < CACHE_MAX_AGE_SECONDS:
-                        packages_json = zlib.decompress(compressed).decode("utf-8")
-                        return json.loads(packages_json)
+            cache_entry = self._read_fresh(allow_stale)
+            if cache_entry:
+                if cache_entry["legacy"]:
+                    self._migrate(cache_entry)
+                return cache_entry["names"]
         except Exception as e:
             logging.warning(f"LMDB load error: {e}")
 
@@ -285,18 +894,110 @@ class CacheManager:
 
         return None
 
-    def save(self, packages: List[str]):
+    def _migrate(self, cache_entry: Dict[str, Any]):
+        """Rewrite a legacy JSON/base64 all_packages record in the binary format."""
         try:
-            packages_json = json.dumps(packages).encode("utf-8")
-            compressed = zlib.compress(packages_json)
-            cache_entry = {
-                "data": base64.b64encode(compressed).decode("utf-8"),
-                "timestamp": time.time(),
-            }
-            value = json.dumps(cache_entry).encode("utf-8")
-            env = self._get_env()
-            with env.begin(write=True) as txn:
-                txn.put(b"all_packages", value)
+            self._write(
+                cache_entry["names"],
+                cache_entry["timestamp"],
+                serials=cache_entry["serials"],
+                meta=_record_meta(cache_entry),
+            )
+            logging.info("Migrated all_packages record to the binary format")
+        except Exception as e:
+            logging.warning(f"LMDB names migration error: {e}")
+
+    def load_blob(self, allow_stale: bool = False) -> Optional[bytes]:
+        """Return the cached names as one newline-separated UTF-8 buffer."""
+        try:
+            cache_entry = self._read_fresh(allow_stale)
+            if cache_entry:
+                if cache_entry["names_blob"] is not None:
+                    return cache_entry["names_blob"]
+                return "\n".join(cache_entry["names"]).encode("utf-8")
+        except Exception as e:
+            logging.warning(f"LMDB load error: {e}")
+        return None
+
+    def load_serials(self) -> Optional[Dict[str, int]]:
+        """Return {name: _last-serial} from the names cache, or None if not recorded."""
+        try:
+            cache_entry = self._read_entry(with_names=True)
+            if cache_entry and cache_entry["serials"]:
+                return cache_entry["serials"]
+        except Exception as e:
+            logging.warning(f"LMDB serials load error: {e}")
+        return None
+
+    def load_last_serial(self) -> Optional[int]:
+        """Return the index-wide PyPI serial recorded with the names cache."""
+        try:
+            cache_entry = self._read_entry()
+            if cache_entry:
+                return cache_entry["last_serial"]
+        except Exception as e:
+            logging.warning(f"LMDB serials load error: {e}")
+        return None
+
+    def load_validators(self) -> Optional[Dict[str, Any]]:
+        """Return the ETag / Last-Modified of the /simple response the names came from."""
+        try:
+            cache_entry = self._read_entry()
+            if cache_entry and (cache_entry["etag"] or cache_entry["last_modified"]):
+                return {
+                    "etag": cache_entry["etag"],
+                    "last_modified": cache_entry["last_modified"],
+                }
+        except Exception as e:
+            logging.warning(f"LMDB validators load error: {e}")
+        return None
+
+    def touch(self) -> bool:
+        """Mark the cached names as fresh without rewriting them (after a 304)."""
+        try:
+            value = self._read_raw()
+            if not value:
+                return False
+            now = time.time()
+            if value[:4] == NAMES_RECORD_MAGIC:
+                # Patch the fixed-offset timestamp; names stay compressed as-is
+                value = (
+                    value[:_NAMES_TIMESTAMP_OFFSET]
+                    + struct.pack(">d", now)
+                    + value[_NAMES_TIMESTAMP_OFFSET + 8:]
+                )
+                self._put_record(value)
+            else:
+                cache_entry = decode_names_record(value, with_names=True)
+                cache_entry["timestamp"] = now
+                self._migrate(cache_entry)
+            return True
+        except Exception as e:
+            logging.warning(f"LMDB touch error: {e}")
+            return False
+
+    def save(
+        self,
+        packages: Iterable[str],
+        serials: Optional[Dict[str, int]] = None,
+        last_serial: Optional[int] = None,
+        validators: Optional[Dict[str, Any]] = None,
+    ) -> List[str]:
+        """Persist package names; accepts any iterable (e.g. a streaming generator) and returns the stored (sorted) list.
+
+        `serials` ({name: _last-serial}, from the JSON Simple API) is stored
+        alongside the names as a parallel array. `validators` holds the
+        etag / last_modified of the /simple response for conditional refresh.
+        """
+        packages = list(packages)
+        try:
+            meta = {}
+            if last_serial is not None:
+                meta["last_serial"] = last_serial
+            if validators:
+                meta["etag"] = validators.get("etag")
+                meta["last_modified"] = validators.get("last_modified")
+            packages = self._write(packages, time.time(), serials=serials, meta=meta)
             # Delete legacy if exists
             if CACHE_FILE.exists():
                 CACHE_FILE.unlink()
@@ -305,188 +1006,2098 @@ class CacheManager:
             logging.warning(f"LMDB save error: {e}")
             # Fallback to legacy
             save_packages_to_cache(packages)
+        return packages
 
 
-def ensure_cache_dir():
-    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+def write_names_buffer(packages: List[str]) -> Optional[int]:
+    """Write the flat newline-delimited names file used by the mmap search engine.
 
+    Returns the file's st_mtime_ns, which the all_packages record keeps to
+    recognise a matching buffer, or None if it could not be written.
+    """
+    try:
+        NAMES_BUFFER_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = NAMES_BUFFER_FILE.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            if packages:
+                f.write("\n".join(packages).encode("utf-8") + b"\n")
+        os.replace(tmp, NAMES_BUFFER_FILE)
+        st = NAMES_BUFFER_FILE.stat()
+    except OSError as e:
+        logging.warning(f"Names buffer write error: {e}")
+        return None
+    write_names_index(packages, st.st_size, st.st_mtime_ns)
+    write_trigram_index(packages, st.st_size, st.st_mtime_ns)
+    return st.st_mtime_ns
 
-def is_cache_valid():
-    if not CACHE_FILE.exists():
-        return False
-    mtime = CACHE_FILE.stat().st_mtime
-    age = time.time() - mtime
-    return age < CACHE_MAX_AGE_SECONDS
 
+_NORMALIZE_RE = re.compile(r"[-_.]+")
 
-def load_cached_packages():
-    with CACHE_FILE.open("r", encoding="utf-8") as f:
-        return [line.strip() for line in f if line.strip()]
 
+def normalize_name(name: str) -> str:
+    """PEP 503 normalized form of a project name (`Flask_SQLAlchemy` -> `flask-sqlalchemy`)."""
+    return _NORMALIZE_RE.sub("-", name).lower()
 
-def save_packages_to_cache(packages):
-    with CACHE_FILE.open("w", encoding="utf-8") as f:
-        for pkg in sorted(packages):
-            f.write(pkg + "\n")
 
+# Names index file: header, then uint32 arrays: line offsets into the names
+# buffer (count + 1), line numbers ordered by lowercased name (count), line
+# offsets into NAMES_NORM_FILE (count + 1), line numbers ordered by
+# normalized name (count)
+NAMES_INDEX_MAGIC = b"PSNI"
+NAMES_INDEX_VERSION = 3
+# magic, version, count, buffer size, buffer mtime_ns, non-ASCII names
+_NAMES_INDEX_HEADER = struct.Struct("=4sB3xIQqI")
 
-def init_lmdb_env() -> lmdb.Environment:
-    """Initialize and return an LMDB environment for caching package data."""
-    LMDB_DIR.mkdir(parents=True, exist_ok=True)
-    env = lmdb.open(
-        str(LMDB_DIR),
-        map_size=10 * 1024**3,
-        readonly=False,
-        lock=False,
-        readahead=False,
-        meminit=False,
-    )
-    return env
 
+class NamesIndex(NamedTuple):
+    """Memory-mapped lookup structures over the names buffer (see write_names_index)."""
 
-def prune_lmdb_cache(env: lmdb.Environment, verbose=False) -> int:
-    """Prune old entries from LMDB cache based on timestamp."""
-    now = time.time()
-    deleted = 0
-    with env.begin(write=True) as txn:
-        cursor = txn.cursor()
-        to_delete = []
-        for key, value in cursor:
-            if key == b"all_packages":
-                continue
-            try:
-                pos = 0
-                (len_h,) = struct.unpack(">I", value[pos : pos + 4])
-                pos += 4
-                headers_bytes = value[pos : pos + len_h]
-                headers = msgpack.unpackb(headers_bytes, raw=False)
-                timestamp = headers.get("timestamp")
-                if timestamp is None or now - timestamp > LMDB_CACHE_MAX_AGE_SECONDS:
-                    to_delete.append(key)
-            except (struct.error, msgpack.ExtraData, ValueError):
-                # Invalid entry, delete it
-                to_delete.append(key)
-        for key in to_delete:
-            txn.delete(key)
-            deleted += 1
-    if verbose:
-        logging.info(f"Pruned {deleted} old entries from LMDB cache")
-    return deleted
+    offsets: memoryview
+    lower_order: memoryview
+    norm_offsets: memoryview
+    norm_order: memoryview
+    norm_buf: Any
+    non_ascii: int  # names with non-ASCII characters, which bytes matching misreads
 
 
-def extract_headers(resp: requests.Response) -> Dict[str, Any]:
-    """Extract relevant headers from a requests response for caching."""
-    etag = resp.headers.get("ETag", "")
-    last_modified = resp.headers.get("Last-Modified")
-    return {
-        "etag": etag if etag else None,
-        "last_modified": last_modified,
-        "timestamp": time.time(),
-    }
+def write_names_index(packages: List[str], buffer_size: int, buffer_mtime_ns: int) -> bool:
+    """Write NAMES_NORM_FILE and NAMES_INDEX_FILE for a sorted names buffer of `buffer_size` bytes."""
+    encoded = [name.encode("utf-8") for name in packages]
+    offsets = array("I", accumulate((len(name) + 1 for name in encoded), initial=0))
+    lowered = [name.lower() for name in encoded]
+    lower_order = array("I", sorted(range(len(encoded)), key=lowered.__getitem__))
+    normalized = [normalize_name(name).encode("utf-8") for name in packages]
+    norm_offsets = array("I", accumulate((len(name) + 1 for name in normalized), initial=0))
+    norm_order = array("I", sorted(range(len(normalized)), key=normalized.__getitem__))
+    non_ascii = sum(not name.isascii() for name in packages)
+    try:
+        tmp = NAMES_NORM_FILE.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            if normalized:
+                f.write(b"\n".join(normalized) + b"\n")
+        os.replace(tmp, NAMES_NORM_FILE)
+        tmp = NAMES_INDEX_FILE.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            f.write(
+                _NAMES_INDEX_HEADER.pack(
+                    NAMES_INDEX_MAGIC, NAMES_INDEX_VERSION, len(encoded), buffer_size, buffer_mtime_ns, non_ascii
+                )
+            )
+            for part in (offsets, lower_order, norm_offsets, norm_order):
+                f.write(part.tobytes())
+        os.replace(tmp, NAMES_INDEX_FILE)
+        return True
+    except OSError as e:
+        logging.warning(f"Names index write error: {e}")
+        return False
 
 
-def store_package_data(
-    env: lmdb.Environment,
-    package_name: str,
-    headers: Dict[str, Any],
-    json_data: str,
-    md_data: Optional[str] = None,
-    verbose=False,
-):
-    """Store package JSON data and optional Markdown in LMDB with headers, using compression and length-prefixing."""
+def _read_names_index(st) -> Optional[NamesIndex]:
     try:
-        with env.begin(write=True) as txn:
-            key = package_name.encode("utf-8")
-            headers_bytes = msgpack.packb(headers)
-            json_compressed = zlib.compress(json_data.encode("utf-8"))
-            if md_data:
-                md_compressed = zlib.compress(md_data.encode("utf-8"))
-            else:
-                md_compressed = b""
-
-            value = (
-                struct.pack(">I", len(headers_bytes))
-                + headers_bytes
-                + struct.pack(">I", len(json_compressed))
-                + json_compressed
-                + struct.pack(">I", len(md_compressed))
-                + md_compressed
-            )
-            txn.put(key, value)
-        if verbose:
-            logging.info(f"Stored {package_name} in LMDB cache")
-    except Exception:
-        logging.warning(f"Failed to store {package_name} in LMDB cache")
-        raise
+        with NAMES_INDEX_FILE.open("rb") as f:
+            header = f.read(_NAMES_INDEX_HEADER.size)
+            if len(header) != _NAMES_INDEX_HEADER.size:
+                return None
+            magic, version, count, size, mtime_ns, non_ascii = _NAMES_INDEX_HEADER.unpack(header)
+            expected = _NAMES_INDEX_HEADER.size + 4 * (4 * count + 2)
+            if (
+                magic != NAMES_INDEX_MAGIC
+                or version != NAMES_INDEX_VERSION
+                or size != st.st_size
+                or mtime_ns != st.st_mtime_ns
+                or os.fstat(f.fileno()).st_size != expected
+            ):
+                return None
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)[_NAMES_INDEX_HEADER.size:].cast("I")
+        norm_offsets = view[2 * count + 1:3 * count + 2]
+        with NAMES_NORM_FILE.open("rb") as f:
+            if os.fstat(f.fileno()).st_size != norm_offsets[count]:
+                return None
+            norm_buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, struct.error):
+        return None
+    return NamesIndex(
+        offsets=view[: count + 1],
+        lower_order=view[count + 1:2 * count + 1],
+        norm_offsets=norm_offsets,
+        norm_order=view[3 * count + 2:],
+        norm_buf=norm_buf,
+        non_ascii=non_ascii,
+    )
 
 
-def retrieve_package_data(
-    env: lmdb.Environment, package_name: str
-) -> Optional[Dict[str, Any]]:
-    """Retrieve cached package data from LMDB, decompressing and parsing as needed."""
-    with env.begin() as txn:
-        key = package_name.encode("utf-8")
-        value = txn.get(key)
-        if value is None:
+def open_names_index(buf) -> Optional[NamesIndex]:
+    """Return the NamesIndex over NAMES_INDEX_FILE for the mmapped names `buf`.
+
+    A missing or outdated index is rebuilt from the buffer. Returns None
+    for an empty or unsorted buffer, or when the index cannot be written.
+    """
+    if not buf:
+        return None
+    try:
+        st = NAMES_BUFFER_FILE.stat()
+    except OSError:
+        return None
+    if st.st_size != len(buf):
+        return None
+    index = _read_names_index(st)
+    if index is None:
+        names = bytes(buf).decode("utf-8").split("\n")[:-1]
+        if any(a > b for a, b in zip(names, names[1:])):
+            return None
+        if not write_names_index(names, st.st_size, st.st_mtime_ns):
             return None
+        index = _read_names_index(st)
+    return index
+
+
+def open_names_buffer(header: Dict[str, Any]):
+    """Memory-map NAMES_BUFFER_FILE if it matches the all_packages record `header`.
 
-        pos = 0
-        (len_h,) = struct.unpack(">I", value[pos : pos + 4])
-        pos += 4
-        headers_bytes = value[pos : pos + len_h]
-        pos += len_h
+    Returns an mmap (or b"" for an empty index), or None when the file is
+    missing or was written for a different record.
+    """
+    if header.get("names_size") is None or header.get("buffer_mtime_ns") is None:
+        return None
+    expected = header["names_size"] + 1 if header["count"] else 0
+    try:
+        st = NAMES_BUFFER_FILE.stat()
+        if st.st_size != expected or st.st_mtime_ns != header["buffer_mtime_ns"]:
+            return None
+        if expected == 0:
+            return b""
+        with NAMES_BUFFER_FILE.open("rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
 
-        (len_j,) = struct.unpack(">I", value[pos : pos + 4])
-        pos += 4
-        json_compressed = value[pos : pos + len_j]
-        pos += len_j
 
-        (len_m,) = struct.unpack(">I", value[pos : pos + 4])
-        pos += 4
-        md_compressed = value[pos : pos + len_m]
+def get_names_buffer(refresh_cache=False):
+    """Return the cached names as one mmapped newline-delimited buffer.
 
+    Returns None when the names cache must be (re)loaded through
+    get_packages: a refresh was requested, the cache is missing or
+    expired, or it is still in the legacy format.
+    """
+    if refresh_cache:
+        return None
+    ensure_cache_dir()
+    cm = CacheManager()
+    header = cm.load_header()
+    if (
+        not header
+        or header["legacy"]
+        or time.time() - header["timestamp"] >= CACHE_MAX_AGE_SECONDS
+    ):
+        return None
+    buf = open_names_buffer(header)
+    if buf is None:
+        # Missing or out of date: rebuild it from the LMDB record
         try:
-            headers = msgpack.unpackb(headers_bytes, raw=False)
-        except msgpack.ExtraData:
+            header = cm.rebuild_names_buffer()
+        except Exception as e:
+            logging.warning(f"Names buffer rebuild error: {e}")
             return None
-        try:
-            json_data = zlib.decompress(json_compressed).decode("utf-8")
-        except zlib.error:
+        buf = open_names_buffer(header) if header else None
+        if buf is None:
             return None
-        md_data = None
-        if len_m > 0:
-            try:
-                md_data = zlib.decompress(md_compressed).decode("utf-8")
-            except zlib.error:
-                logging.warning(
-                    f"Invalid MD compression for {package_name}, using json only"
+    run_stats.count("names", "hit")
+    print(f"Using cache: {header['count']:,} pkgs", file=sys.stderr)
+    return buf
+
+
+# Constructs that can match (or look across) a newline, or that behave
+# differently on bytes; such patterns use the per-name scan instead.
+_BUFFER_UNSAFE_RE = re.compile(r"\\[sWDnAZxuUNtrfv0]|\[\^|\(\?[a-zA-Z]*s|\(\?<?[=!]|[\x00-\x1f]")
+# Constructs that read a non-ASCII name differently as bytes: wildcards,
+# Unicode-aware classes and boundaries, and inline -i (İ ı K ſ fold to ASCII)
+_BUFFER_UNICODE_RE = re.compile(r"\.|\\[wbBSd]|\(\?[a-zA-Z]*i")
+_NON_ASCII_BYTE_RE = re.compile(rb"[\x80-\xff]")
+
+
+def compile_buffer_regex(pattern: str, flags: int = 0) -> Optional[re.Pattern]:
+    """Compile `^{pattern}$` for a MULTILINE scan of the names buffer, or None if unsupported."""
+    if not pattern.isascii() or _BUFFER_UNSAFE_RE.search(pattern):
+        return None
+    try:
+        return re.compile(f"^{pattern}$".encode("ascii"), flags | re.MULTILINE)
+    except re.error:
+        return None
+
+
+def _non_ascii_names(buf) -> Iterator[tuple]:
+    """(line start, name) of each name in `buf` that holds a non-ASCII character."""
+    search = _NON_ASCII_BYTE_RE.search
+    pos = 0
+    while (m := search(buf, pos)) is not None:
+        start = buf.rfind(b"\n", 0, m.start()) + 1
+        pos = buf.find(b"\n", m.end()) + 1 or len(buf)
+        yield start, buf[start:pos].decode("utf-8").rstrip("\n")
+
+
+def _matches_non_ascii_as_str(buf, pattern: str, flags: int, ascii_only: Optional[bool]) -> bool:
+    """Whether bytes matching may misread `pattern` on non-ASCII names, and `buf` holds some."""
+    if not (flags & re.IGNORECASE or _BUFFER_UNICODE_RE.search(pattern)):
+        return False
+    return not (bytes(buf).isascii() if ascii_only is None else ascii_only)
+
+
+def _match_line(buf, start: int, end: int) -> tuple:
+    """(start, end, whole line) of the line holding the buffer match buf[start:end]."""
+    whole_line = True
+    # The match may cover only part of the line (e.g. "^a|b$")
+    if start and buf[start - 1] != 10:
+        start = buf.rfind(b"\n", 0, start) + 1
+        whole_line = False
+    if end < len(buf) and buf[end] != 10:
+        end = buf.find(b"\n", end)
+        if end == -1:
+            end = len(buf)
+        whole_line = False
+    return start, end, whole_line
+
+
+def search_names_buffer(buf, pattern: str, flags: int = 0, ascii_only: Optional[bool] = None) -> Optional[List[str]]:
+    """Match `pattern` against a newline-delimited names buffer in one regex pass.
+
+    Only matching lines are decoded to str; partial and non-ASCII hits
+    are re-checked with the normal `^{pattern}$` regex. Bytes matching
+    sees a non-ASCII character as several bytes and `\\w`, `\\b` and -i
+    as ASCII-only, so when the pattern relies on those the non-ASCII
+    names are matched as str instead; `ascii_only` (NamesIndex.non_ascii
+    == 0) spares looking for them. Returns None when the pattern cannot
+    be run on the buffer, so the caller falls back to the per-name scan.
+    """
+    bregex = compile_buffer_regex(pattern, flags)
+    if bregex is None:
+        return None
+    regex = re.compile(f"^{pattern}$", flags)
+    as_str = _matches_non_ascii_as_str(buf, pattern, flags, ascii_only)
+    matches = []
+    starts = []
+    search = bregex.search
+    size = len(buf)
+    pos = 0
+    while pos < size:
+        m = search(buf, pos)
+        if m is None:
+            break
+        start, end, whole_line = _match_line(buf, *m.span())
+        if start == end:
+            # An empty match past the final newline (e.g. "a*"); names are never empty
+            pos = end + 1
+            continue
+        name = buf[start:end].decode("utf-8")
+        if name.isascii():
+            hit = whole_line or regex.search(name)
+        else:
+            # Bytes and str matching can disagree on it; as_str names are matched below
+            hit = not as_str and regex.search(name)
+        if hit:
+            matches.append(name)
+            starts.append(start)
+        pos = end + 1
+    if as_str:
+        # Merged back into buffer order
+        extra = [(start, name) for start, name in _non_ascii_names(buf) if regex.search(name)]
+        if extra:
+            matches = [name for _, name in sorted([*zip(starts, matches), *extra])]
+    return matches
+
+
+# Trigram index file: header, then the sorted uint32 trigram keys (n),
+# uint32 posting start offsets (n + 1) and the uint32 line-number postings
+TRIGRAM_INDEX_MAGIC = b"PSNT"
+TRIGRAM_INDEX_VERSION = 1
+_TRIGRAM_INDEX_HEADER = struct.Struct("=4sB3xIIQq")  # magic, version, trigrams, count, buffer size, buffer mtime_ns
+# Above this share of all names a trigram query is not selective enough
+# to beat a single mmap pass
+TRIGRAM_MAX_CANDIDATE_RATIO = 0.25
+
+
+def write_trigram_index(packages: List[str], buffer_size: int, buffer_mtime_ns: int) -> bool:
+    """Write TRIGRAM_INDEX_FILE: posting lists of the lowercased byte trigrams of each name."""
+    postings = defaultdict(list)
+    for line, name in enumerate(packages):
+        lowered = name.encode("utf-8").lower()
+        for gram in {lowered[i:i + 3] for i in range(len(lowered) - 2)}:
+            postings[gram].append(line)
+    grams = sorted(postings)
+    keys = array("I", (int.from_bytes(gram, "big") for gram in grams))
+    starts = array("I", accumulate((len(postings[gram]) for gram in grams), initial=0))
+    try:
+        TRIGRAM_INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = TRIGRAM_INDEX_FILE.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            f.write(
+                _TRIGRAM_INDEX_HEADER.pack(
+                    TRIGRAM_INDEX_MAGIC,
+                    TRIGRAM_INDEX_VERSION,
+                    len(grams),
+                    len(packages),
+                    buffer_size,
+                    buffer_mtime_ns,
                 )
-                md_data = None
+            )
+            f.write(keys.tobytes())
+            f.write(starts.tobytes())
+            for gram in grams:
+                f.write(array("I", postings[gram]).tobytes())
+        os.replace(tmp, TRIGRAM_INDEX_FILE)
+        return True
+    except OSError as e:
+        logging.warning(f"Trigram index write error: {e}")
+        return False
+
 
-        return {"headers": headers, "json": json_data, "md": md_data}
+def _read_trigram_index(st):
+    try:
+        with TRIGRAM_INDEX_FILE.open("rb") as f:
+            header = f.read(_TRIGRAM_INDEX_HEADER.size)
+            if len(header) != _TRIGRAM_INDEX_HEADER.size:
+                return None
+            magic, version, ngrams, count, size, mtime_ns = _TRIGRAM_INDEX_HEADER.unpack(header)
+            if (
+                magic != TRIGRAM_INDEX_MAGIC
+                or version != TRIGRAM_INDEX_VERSION
+                or size != st.st_size
+                or mtime_ns != st.st_mtime_ns
+            ):
+                return None
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, struct.error):
+        return None
+    view = memoryview(mm)[_TRIGRAM_INDEX_HEADER.size:].cast("I")
+    if len(view) < 2 * ngrams + 1 or len(view) != 2 * ngrams + 1 + view[2 * ngrams]:
+        return None
+    return view[:ngrams], view[ngrams:2 * ngrams + 1], view[2 * ngrams + 1:], count
 
 
-def get_package_long_description(
-    package_name: str,
-    verbose: bool = False,
-    test_mode: bool = False,
-    validate_cache: bool = False,
-) -> str:
-    env: Optional[lmdb.Environment] = None
+def open_trigram_index(buf):
+    """Return the trigram index over TRIGRAM_INDEX_FILE for the mmapped names `buf`.
+
+    A missing or outdated index is rebuilt from the buffer. Returns None
+    for an empty buffer or when the index cannot be written.
+    """
+    if not buf:
+        return None
     try:
-        env = init_lmdb_env()
-        prune_lmdb_cache(env, verbose=verbose)
-        cached = retrieve_package_data(env, package_name)
-        fresh = (
-            cached
-            and (time.time() - cached["headers"]["timestamp"])
-            < LMDB_CACHE_MAX_AGE_SECONDS
+        st = NAMES_BUFFER_FILE.stat()
+    except OSError:
+        return None
+    if st.st_size != len(buf):
+        return None
+    index = _read_trigram_index(st)
+    if index is None:
+        names = bytes(buf).decode("utf-8").split("\n")[:-1]
+        if not write_trigram_index(names, st.st_size, st.st_mtime_ns):
+            return None
+        index = _read_trigram_index(st)
+    return index
+
+
+_REPEAT_OPS = tuple(
+    getattr(_sre_parse, op) for op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT") if hasattr(_sre_parse, op)
+)
+
+
+def _literal_trigrams(text: str):
+    """AND of the lowercase trigrams of a literal run (its non-ASCII characters split it)."""
+    grams = set()
+    for piece in re.split(r"[^\x00-\x7f]+", text):
+        piece = piece.lower().encode("ascii")
+        grams.update(piece[i:i + 3] for i in range(len(piece) - 2))
+    return ("and", sorted(grams)) if grams else None
+
+
+def _query_and(parts):
+    # Flatten nested ANDs so every trigram is intersected shortest-first
+    flat = []
+    for part in parts:
+        if part is None:
+            continue
+        if part[0] == "and":
+            flat.extend(gram for gram in part[1] if gram not in flat)
+        else:
+            flat.append(part)
+    if not flat:
+        return None
+    return flat[0] if len(flat) == 1 and flat[0][0] == "or" else ("and", flat)
+
+
+def _query_or(parts):
+    # One unconstrained alternative makes the whole alternation unconstrained
+    if not parts or any(part is None for part in parts):
+        return None
+    return ("or", parts)
+
+
+def _trigram_query(subpattern):
+    parts = []
+    run = []
+
+    def flush():
+        if run:
+            parts.append(_literal_trigrams("".join(run)))
+            run.clear()
+
+    for op, av in subpattern:
+        if op == _sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        flush()
+        if op == _sre_parse.SUBPATTERN:
+            parts.append(_trigram_query(av[-1]))
+        elif op == _sre_parse.BRANCH:
+            parts.append(_query_or([_trigram_query(branch) for branch in av[1]]))
+        elif op in _REPEAT_OPS and av[0] >= 1:
+            parts.append(_trigram_query(av[2]))
+        # Classes, wildcards, anchors, lookarounds and backreferences
+        # require no particular literal
+    flush()
+    return _query_and(parts)
+
+
+def plan_trigram_query(pattern: str, flags: int = 0):
+    """Turn the literals `pattern` requires into a trigram AND/OR query.
+
+    Leaves are 3-byte lowercase trigrams; nodes are ("and", [...]) or
+    ("or", [...]). Returns None when the pattern requires no trigram.
+    """
+    try:
+        return _trigram_query(_sre_parse.parse(pattern, flags))
+    except Exception:
+        return None
+
+
+def _run_trigram_query(query, index):
+    if isinstance(query, bytes):
+        keys, starts, postings, _ = index
+        key = int.from_bytes(query, "big")
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return ()
+        return postings[starts[i]:starts[i + 1]]
+    kind, parts = query
+    results = [_run_trigram_query(part, index) for part in parts]
+    if kind == "or":
+        union = set()
+        for result in results:
+            union.update(result)
+        return union
+    results.sort(key=len)
+    candidates = set(results[0])
+    for result in results[1:]:
+        # A few hundred candidates are cheaper to verify than to intersect further
+        if len(candidates) <= 256:
+            break
+        if not isinstance(result, set) and len(candidates) * 8 < len(result):
+            # Probe the long (sorted) posting list instead of walking it
+            candidates = {
+                line
+                for line in candidates
+                if (i := bisect_left(result, line)) < len(result) and result[i] == line
+            }
+        else:
+            candidates.intersection_update(result)
+    return candidates
+
+
+def trigram_candidates(index, pattern: str, flags: int = 0) -> Optional[List[int]]:
+    """Sorted line numbers that may match `pattern`, or None if the index cannot narrow it."""
+    query = plan_trigram_query(pattern, flags)
+    if query is None or index is None:
+        return None
+    return sorted(_run_trigram_query(query, index))
+
+
+# ASCII letters -i also matches to a non-ASCII character (İ ı K ſ), which
+# neither the lowercase trigrams nor the lowercase order file under them
+_NON_ASCII_FOLD_RE = re.compile(r"[iks]", re.IGNORECASE)
+
+
+def _non_ascii_fold(index: NamesIndex, pattern: str, flags: int) -> bool:
+    """Whether -i may match `pattern` to a non-ASCII name an index lookup misses."""
+    return bool(
+        index.non_ascii and (flags & re.IGNORECASE or "(?" in pattern) and _NON_ASCII_FOLD_RE.search(pattern)
+    )
+
+
+def search_names_trigram(buf, index, trigrams, pattern: str, flags: int = 0) -> Optional[List[str]]:
+    """Match `pattern` by verifying only the names that contain its required trigrams.
+
+    `index` is the NamesIndex from open_names_index and
+    `trigrams` the index from open_trigram_index. Returns None when the
+    pattern yields no trigram query or too many candidates.
+    """
+    if index is None or _non_ascii_fold(index, pattern, flags):
+        return None
+    candidates = trigram_candidates(trigrams, pattern, flags)
+    if candidates is None or len(candidates) > TRIGRAM_MAX_CANDIDATE_RATIO * trigrams[3]:
+        return None
+    regex = re.compile(f"^{pattern}$", flags)
+    offsets = index.offsets
+    matches = []
+    for line in candidates:
+        name = buf[offsets[line]:offsets[line + 1] - 1].decode("utf-8")
+        if regex.search(name):
+            matches.append(name)
+    return matches
+
+
+def _class_end(pattern: str, i: int) -> int:
+    """Index of the "]" closing the character class opened at pattern[i] (len(pattern) if none)."""
+    i += 1
+    # A leading "]" (or "^]") is literal
+    if pattern[i:i + 1] == "^":
+        i += 1
+    if pattern[i:i + 1] == "]":
+        i += 1
+    while i < len(pattern) and pattern[i] != "]":
+        if pattern[i] == "\\":
+            i += 1
+        i += 1
+    return i
+
+
+def _has_top_level_alternation(pattern: str) -> bool:
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 1
+        elif c == "[":
+            i = _class_end(pattern, i)
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def extract_literal_prefix(pattern: str) -> str:
+    """Return the literal text every match of `^{pattern}$` must start with ("" if none).
+
+    The planner is deliberately conservative: it stops at the first
+    metacharacter, drops a literal made optional by `?`, `*` or `{`, and
+    gives up on top-level alternation and inline flags.
+    """
+    if "(?" in pattern or _has_top_level_alternation(pattern):
+        return ""
+    prefix = []
+    i = 1 if pattern.startswith("^") else 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            literal = pattern[i + 1:i + 2]
+            # Escaped punctuation is literal; \d, \w, \b etc. are not
+            if not literal or literal.isalnum():
+                break
+            step = 2
+        elif c in ".^$*+?{}[]|()":
+            break
+        else:
+            literal, step = c, 1
+        quantifier = pattern[i + step:i + step + 1]
+        if quantifier in ("*", "?", "{"):
+            break
+        prefix.append(literal)
+        if quantifier == "+":
+            break
+        i += step
+    return "".join(prefix)
+
+
+def search_names_prefix(buf, index, pattern: str, flags: int = 0) -> Optional[List[str]]:
+    """Match `pattern` by bisecting the sorted names buffer on its literal prefix.
+
+    `index` is the NamesIndex from open_names_index; -i
+    queries bisect the lowercase order instead of the buffer order. Only
+    the names in the prefix range are run through the full regex. Returns
+    None when the pattern has no usable prefix, so the caller scans.
+    """
+    prefix = extract_literal_prefix(pattern)
+    if not prefix or not prefix.isascii() or index is None or _non_ascii_fold(index, pattern, flags):
+        return None
+    regex = re.compile(f"^{pattern}$", flags)
+    offsets, lower_order = index.offsets, index.lower_order
+    key = prefix.encode("ascii")
+    width = len(key)
+
+    def head(i):
+        start = offsets[i]
+        return buf[start:min(start + width, offsets[i + 1] - 1)]
+
+    if flags & re.IGNORECASE:
+        key = key.lower()
+        lo = bisect_left(lower_order, key, key=lambda i: head(i).lower())
+        hi = bisect_right(lower_order, key, lo=lo, key=lambda i: head(i).lower())
+        # Report hits in buffer order, like the other engines
+        candidates = [
+            buf[offsets[i]:offsets[i + 1] - 1].decode("utf-8") for i in sorted(lower_order[lo:hi])
+        ]
+    else:
+        lines = range(len(offsets) - 1)
+        lo = bisect_left(lines, key, key=head)
+        hi = bisect_right(lines, key, lo=lo, key=head)
+        candidates = buf[offsets[lo]:offsets[hi]].decode("utf-8").split("\n")[:-1]
+    return [name for name in candidates if regex.search(name)]
+
+
+# A pattern made only of project-name characters is taken as a name
+_PLAIN_NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+
+def normalize_pattern(pattern: str) -> str:
+    """Rewrite `pattern` to match PEP 503 normalized names.
+
+    Runs of literal `-`, `_` and `\\.` outside character classes become a
+    single `-`; a bare `.` stays a wildcard (which also matches `-`).
+    """
+    out = []
+    separator = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c in "-_" or (c == "\\" and pattern[i + 1:i + 2] in ("-", "_", ".")):
+            if not separator:
+                out.append("-")
+            separator = True
+            i += 1 if c in "-_" else 2
+            continue
+        separator = False
+        if c == "[":
+            # Copy the character class verbatim; a leading "]" (or "^]") is literal
+            j = i + 1
+            if pattern[j:j + 1] == "^":
+                j += 1
+            if pattern[j:j + 1] == "]":
+                j += 1
+            while j < len(pattern) and pattern[j] != "]":
+                if pattern[j] == "\\":
+                    j += 1
+                j += 1
+            out.append(pattern[i:j + 1])
+            i = j + 1
+        elif c == "\\":
+            out.append(pattern[i:i + 2])
+            i += 2
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out)
+
+
+def _normalized_lines(index: NamesIndex, key: bytes) -> range:
+    """Positions in index.norm_order of the lines whose normalized name equals `key`."""
+    norm_buf, norm_offsets, order = index.norm_buf, index.norm_offsets, index.norm_order
+
+    def line(i):
+        return norm_buf[norm_offsets[i]:norm_offsets[i + 1] - 1]
+
+    lo = bisect_left(order, key, key=line)
+    hi = bisect_right(order, key, lo=lo, key=line)
+    return range(lo, hi)
+
+
+def lookup_normalized(buf, index: Optional[NamesIndex], name: str) -> Optional[str]:
+    """Display name of the cached project whose PEP 503 form matches `name` (a bisect of the sorted index)."""
+    if index is None:
+        return None
+    found = _normalized_lines(index, normalize_name(name).encode("utf-8"))
+    if not found:
+        return None
+    line = index.norm_order[found[0]]
+    return buf[index.offsets[line]:index.offsets[line + 1] - 1].decode("utf-8")
+
+
+def search_names_normalized(buf, index: Optional[NamesIndex], pattern: str, flags: int = 0) -> Optional[List[str]]:
+    """Match `pattern` against the normalized names; returns display names in buffer order.
+
+    A plain project name is an exact lookup (`Flask_SQLAlchemy` finds
+    `Flask-SQLAlchemy`); anything else is rewritten with
+    normalize_pattern and matched case-insensitively. Returns None
+    without an index.
+    """
+    if index is None:
+        return None
+    if _PLAIN_NAME_RE.fullmatch(pattern):
+        found = _normalized_lines(index, normalize_name(pattern).encode("utf-8"))
+        lines = [index.norm_order[pos] for pos in found]
+    else:
+        npattern = normalize_pattern(pattern)
+        flags |= re.IGNORECASE
+        norm_matches = search_names_buffer(index.norm_buf, npattern, flags, not index.non_ascii)
+        if norm_matches is None:
+            regex = re.compile(f"^{npattern}$", flags)
+            norm_names = bytes(index.norm_buf).decode("utf-8").split("\n")[:-1]
+            norm_matches = [name for name in norm_names if regex.search(name)]
+        lines = []
+        for norm in dict.fromkeys(norm_matches):
+            lines.extend(index.norm_order[pos] for pos in _normalized_lines(index, norm.encode("utf-8")))
+    offsets = index.offsets
+    return [buf[offsets[line]:offsets[line + 1] - 1].decode("utf-8") for line in sorted(lines)]
+
+
+def scan_names_normalized(packages: Iterable[str], pattern: str, flags: int = 0) -> List[str]:
+    """search_names_normalized for a plain names list (no buffer or index available)."""
+    if _PLAIN_NAME_RE.fullmatch(pattern):
+        key = normalize_name(pattern)
+        return [pkg for pkg in packages if normalize_name(pkg) == key]
+    regex = re.compile(f"^{normalize_pattern(pattern)}$", flags | re.IGNORECASE)
+    return [pkg for pkg in packages if regex.search(normalize_name(pkg))]
+
+
+# Parallel scan: worker processes take ~50 ms to start (fork, 4 workers), so
+# `--jobs 0` (auto) only fans out when the sampled regex cost of a full
+# single-process scan is estimated above this
+PARALLEL_SCAN_MIN_SECONDS = 0.25
+PARALLEL_SAMPLE_NAMES = 256
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _sample_buffer_names(buf, n: int = PARALLEL_SAMPLE_NAMES) -> List[str]:
+    """Up to `n` whole names taken at evenly spaced points of a names buffer."""
+    sample = []
+    size = len(buf)
+    for k in range(n):
+        start = buf.rfind(b"\n", 0, k * size // n) + 1
+        end = buf.find(b"\n", start)
+        if end == -1:
+            break
+        sample.append(buf[start:end].decode("utf-8", "replace"))
+    return sample
+
+
+def plan_scan_jobs(sample: List[str], total: int, regex: re.Pattern, jobs: int = 0) -> int:
+    """Number of worker processes for a full scan of `total` names (1 = scan in-process).
+
+    `jobs` > 0 is taken as is; 0 times `regex` on `sample` and only uses
+    every available CPU when the estimated scan cost exceeds
+    PARALLEL_SCAN_MIN_SECONDS.
+    """
+    if jobs > 0:
+        return jobs
+    cpus = available_cpus()
+    if cpus < 2 or not sample or total < 2:
+        return 1
+    t0 = time.perf_counter()
+    for name in sample:
+        regex.search(name)
+    estimate = (time.perf_counter() - t0) / len(sample) * total
+    logging.debug(f"Estimated scan cost {estimate:.3f}s for {total:,} names")
+    return cpus if estimate > PARALLEL_SCAN_MIN_SECONDS else 1
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    try:
+        # Python 3.13+: the parent owns (and unlinks) the segment
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _scan_pool_context():
+    # fork is by far the cheapest start, but unsafe once threads are running
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+        return multiprocessing.get_context("fork")
+    if "forkserver" in methods:
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context()
+
+
+def _scan_names_shard(shm_name: str, start: int, end: int, pattern: str, flags: int) -> List[str]:
+    """Worker: match `^{pattern}$` against the names in shared memory [start, end)."""
+    shm = _attach_shared_memory(shm_name)
+    try:
+        names = bytes(shm.buf[start:end]).decode("utf-8").split("\n")[:-1]
+    finally:
+        shm.close()
+    regex = re.compile(f"^{pattern}$", flags)
+    return [name for name in names if regex.search(name)]
+
+
+def search_names_parallel(buf, pattern: str, flags: int = 0, jobs: int = 2) -> List[str]:
+    """Per-name scan of a names buffer split on line boundaries over `jobs` processes.
+
+    The buffer is copied once into multiprocessing.shared_memory; workers
+    get (offset, length) shards and the results are merged in buffer order.
+    """
+    size = len(buf)
+    if not size:
+        return []
+    bounds = [0]
+    for k in range(1, jobs):
+        cut = buf.find(b"\n", max(k * size // jobs, bounds[-1])) + 1
+        bounds.append(cut or size)
+    bounds.append(size)
+    shards = [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        shm.buf[:size] = buf
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=len(shards), mp_context=_scan_pool_context()
+        ) as pool:
+            results = pool.map(
+                _scan_names_shard,
+                [shm.name] * len(shards),
+                [lo for lo, _ in shards],
+                [hi for _, hi in shards],
+                [pattern] * len(shards),
+                [flags] * len(shards),
+            )
+            return [name for shard in results for name in shard]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def scan_names(packages: Iterable[str], pattern: str, flags: int = 0, jobs: int = 0) -> List[str]:
+    """Per-name `^{pattern}$` scan of `packages`, fanned out over processes when it pays off."""
+    packages = list(packages)
+    if not packages:
+        return []
+    regex = re.compile(f"^{pattern}$", flags)
+    step = max(1, len(packages) // PARALLEL_SAMPLE_NAMES)
+    jobs = plan_scan_jobs(packages[::step], len(packages), regex, jobs)
+    if jobs > 1:
+        return search_names_parallel(("\n".join(packages) + "\n").encode("utf-8"), pattern, flags, jobs)
+    return [pkg for pkg in packages if regex.search(pkg)]
+
+
+# Indexed engines in the order `--engine auto` tries them
+NAME_SEARCH_ENGINES = ["prefix", "trigram", "mmap"]
+
+
+def search_names(
+    buf,
+    pattern: str,
+    flags: int = 0,
+    engine: str = "auto",
+    jobs: int = 0,
+    index: Optional[NamesIndex] = None,
+    trigrams=None,
+) -> Optional[List[str]]:
+    """Run `pattern` on the mmapped names `buf`, starting at `engine` in NAME_SEARCH_ENGINES.
+
+    Each engine hands over to the next when it cannot run the pattern.
+    The full pass (mmap) goes to worker processes when plan_scan_jobs
+    says so for `jobs`. `index` / `trigrams` are opened on demand unless
+    given. Returns None when no engine can run the pattern, so the
+    caller scans the names list.
+    """
+    start = 0 if engine == "auto" else NAME_SEARCH_ENGINES.index(engine)
+    for name in NAME_SEARCH_ENGINES[start:]:
+        if name == "prefix":
+            index = index or open_names_index(buf)
+            matches = search_names_prefix(buf, index, pattern, flags)
+        elif name == "trigram":
+            index = index or open_names_index(buf)
+            trigrams = trigrams or open_trigram_index(buf)
+            matches = search_names_trigram(buf, index, trigrams, pattern, flags)
+        else:
+            sample = _sample_buffer_names(buf) if buf else []
+            total = len(buf) * len(sample) // (sum(len(n) + 1 for n in sample) or 1)
+            nprocs = plan_scan_jobs(sample, total, re.compile(f"^{pattern}$", flags), jobs)
+            if nprocs > 1:
+                return search_names_parallel(buf, pattern, flags, nprocs)
+            matches = search_names_buffer(buf, pattern, flags, None if index is None else not index.non_ascii)
+        if matches is not None:
+            return matches
+    return None
+
+
+def ensure_cache_dir():
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def is_cache_valid():
+    if not CACHE_FILE.exists():
+        return False
+    mtime = CACHE_FILE.stat().st_mtime
+    age = time.time() - mtime
+    return age < CACHE_MAX_AGE_SECONDS
+
+
+def load_cached_packages():
+    with CACHE_FILE.open("r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def save_packages_to_cache(packages):
+    with CACHE_FILE.open("w", encoding="utf-8") as f:
+        for pkg in sorted(packages):
+            f.write(pkg + "\n")
+
+
+_SIZE_SUFFIXES = {"k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def _parse_setting(name: str, value: Any) -> Any:
+    """Coerce a config / environment value to the type of LMDB_DEFAULTS[name]."""
+    default = LMDB_DEFAULTS[name]
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in ("1", "true", "yes", "on"):
+            return True
+        if text in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"expected a boolean, got {value!r}")
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().lower().removesuffix("ib").removesuffix("b")
+    factor = _SIZE_SUFFIXES.get(text[-1:], 1)
+    return int(text[:-1] if factor > 1 else text) * factor
+
+
+def lmdb_settings() -> Dict[str, Any]:
+    """LMDB_DEFAULTS overridden by the [lmdb] table of CONFIG_FILE, then PYPI_SEARCH_LMDB_* variables.
+
+    Sizes accept K/M/G/T suffixes ("512M", "20GiB"). Invalid values are
+    logged and ignored.
+    """
+    settings = dict(LMDB_DEFAULTS)
+    overrides = []
+    try:
+        with CONFIG_FILE.open("rb") as f:
+            table = tomllib.load(f).get("lmdb", {})
+        overrides += [(f"{CONFIG_FILE} [lmdb] {k}", k, v) for k, v in table.items()]
+    except FileNotFoundError:
+        pass
+    except (OSError, tomllib.TOMLDecodeError, AttributeError) as e:
+        logging.warning(f"Ignoring {CONFIG_FILE}: {e}")
+    for name in LMDB_DEFAULTS:
+        var = f"PYPI_SEARCH_LMDB_{name.upper()}"
+        if var in os.environ:
+            overrides.append((var, name, os.environ[var]))
+    for source, name, value in overrides:
+        if name not in LMDB_DEFAULTS:
+            logging.warning(f"Ignoring unknown LMDB setting {source}")
+            continue
+        try:
+            settings[name] = _parse_setting(name, value)
+        except (ValueError, IndexError) as e:
+            logging.warning(f"Ignoring {source}={value!r}: {e}")
+    settings["max_map_size"] = max(settings["max_map_size"], settings["map_size"])
+    return settings
+
+
+def init_lmdb_env() -> lmdb.Environment:
+    """Initialize and return an LMDB environment for caching package data.
+
+    The map starts at the `map_size` setting and grows on demand, see
+    write_with_growth. With `lock` (the default) several processes can
+    share the cache: LMDB serializes their write transactions and tracks
+    readers in a table of `max_readers` slots, from which the slots of
+    crashed processes are cleared here.
+    """
+    LMDB_DIR.mkdir(parents=True, exist_ok=True)
+    settings = lmdb_settings()
+    env = lmdb.open(
+        str(LMDB_DIR),
+        map_size=settings["map_size"],
+        readonly=False,
+        lock=settings["lock"],
+        readahead=settings["readahead"],
+        writemap=settings["writemap"],
+        max_readers=settings["max_readers"],
+        meminit=False,
+        sync=CacheManager.sync,  # False: commits skip fsync, CacheManager.batch() syncs at its end
+        metasync=CacheManager.sync,
+        max_spare_txns=4,  # finished read txns kept for reuse (reset/renew)
+        max_dbs=8,  # named sub-databases (LMDB_EXPIRY_DB)
+    )
+    if settings["lock"]:
+        stale = env.reader_check()
+        if stale:
+            logging.info(f"Cleared {stale} stale LMDB reader slots")
+    return env
+
+
+class TxnGate:
+    """Shared / exclusive lock between the LMDB transactions of this process and map resizes.
+
+    LMDB only allows set_mapsize() while no transaction is open in the
+    process. Transactions hold the gate shared (re-entrant per thread, so a
+    read inside a write is fine); a resize holds it exclusive, which waits
+    for the open transactions to end and holds new ones back meanwhile.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._resizers = 0  # waiting for exclusive: new transactions wait behind them
+        self._local = threading.local()
+
+    def held(self) -> bool:
+        """True when this thread is inside a transaction."""
+        return getattr(self._local, "depth", 0) > 0
+
+    @contextlib.contextmanager
+    def shared(self):
+        depth = getattr(self._local, "depth", 0)
+        if not depth:
+            with self._cond:
+                while self._exclusive or self._resizers:
+                    self._cond.wait()
+                self._shared += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if not depth:
+                with self._cond:
+                    self._shared -= 1
+                    if not self._shared:
+                        self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        if self.held():
+            raise RuntimeError("LMDB map resize inside a transaction")
+        with self._cond:
+            self._resizers += 1
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._resizers -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+txn_gate = TxnGate()
+
+
+def grow_map_size(env: lmdb.Environment, seen: Optional[int] = None) -> bool:
+    """Double the map size of `env`, up to `max_map_size`; False when already there.
+
+    Waits for the transactions of other threads to end (see TxnGate). When
+    the map is already past `seen`, another thread grew it meanwhile and it
+    is left as it is.
+    """
+    ceiling = lmdb_settings()["max_map_size"]
+    with txn_gate.exclusive():
+        current = env.info()["map_size"]
+        if seen is not None and current > seen:
+            return True
+        if current >= ceiling:
+            return False
+        env.set_mapsize(min(current * 2, ceiling))
+    logging.info(f"Grew the LMDB map from {current:,} to {env.info()['map_size']:,} bytes")
+    return True
+
+
+def write_with_growth(env: lmdb.Environment, fn):
+    """Return fn(txn) run in a write transaction, growing the map and retrying when it is full.
+
+    The transaction is aborted before the map is resized, so `fn` must only
+    write through `txn`. A map grown by another process is adopted the same
+    way. MapFullError is raised once the map is at `max_map_size`, or when
+    this thread has another transaction open, which would block the resize.
+    """
+    while True:
+        seen = env.info()["map_size"]
+        try:
+            with txn_gate.shared(), run_stats.timed("lmdb.commit"), env.begin(write=True) as txn:
+                return fn(txn)
+        except lmdb.MapResizedError:
+            if txn_gate.held():
+                raise
+            with txn_gate.exclusive():
+                env.set_mapsize(0)  # adopt the size another process set
+        except lmdb.MapFullError:
+            if txn_gate.held() or not grow_map_size(env, seen):
+                raise
+
+
+def _expiry_key(timestamp: float, key: bytes) -> bytes:
+    # Big-endian doubles sort like the (non-negative) timestamps they encode
+    return struct.pack(">d", timestamp) + key
+
+
+# Details meta record (LMDB_META_DB): fixed header, then the strings.
+#   ">BdBBHHH": version, timestamp, codec of the other parts, flags (which
+#   headers were given), etag / last_modified / project version lengths;
+#   _META_NONE as a length stores None.
+DETAILS_META_VERSION = 1
+_DETAILS_META = struct.Struct(">BdBBHHH")
+_META_NONE = 0xFFFF
+_META_HAS_ETAG = 1
+_META_HAS_LAST_MODIFIED = 2
+
+
+def encode_details_meta(headers: Dict[str, Any], version: str, codec: int) -> bytes:
+    etag = headers.get("etag")
+    last_modified = headers.get("last_modified")
+    fields = [None if v is None else str(v).encode("utf-8") for v in (etag, last_modified, version)]
+    flags = (_META_HAS_ETAG if "etag" in headers else 0) | (
+        _META_HAS_LAST_MODIFIED if "last_modified" in headers else 0
+    )
+    return _DETAILS_META.pack(
+        DETAILS_META_VERSION,
+        headers.get("timestamp") or 0.0,
+        codec,
+        flags,
+        *(_META_NONE if f is None else len(f) for f in fields),
+    ) + b"".join(f for f in fields if f)
+
+
+def decode_details_meta(value: bytes) -> Dict[str, Any]:
+    """Inverse of encode_details_meta: {headers, version, codec}."""
+    _, timestamp, codec, flags, *lengths = _DETAILS_META.unpack_from(value)
+    pos = _DETAILS_META.size
+    fields = []
+    for n in lengths:
+        if n == _META_NONE:
+            fields.append(None)
+        else:
+            fields.append(bytes(value[pos:pos + n]).decode("utf-8"))
+            pos += n
+    headers: Dict[str, Any] = {"timestamp": timestamp}
+    if flags & _META_HAS_ETAG:
+        headers["etag"] = fields[0]
+    if flags & _META_HAS_LAST_MODIFIED:
+        headers["last_modified"] = fields[1]
+    return {"headers": headers, "version": fields[2], "codec": codec}
+
+
+def _meta_timestamp(value: bytes) -> float:
+    return struct.unpack_from(">d", value, 1)[0]
+
+
+def _details_items(
+    key: bytes,
+    headers: Dict[str, Any],
+    json_data: str,
+    md_data: Optional[str] = None,
+    codec: int = CODEC_ZLIB,
+    dictionary=None,
+) -> List[tuple]:
+    """(db, key, value) puts that store one project's details; no Markdown deletes a stale one."""
+    try:
+        info = json.loads(json_data).get("info") or {}
+    except (ValueError, AttributeError):
+        info = {}
+    version = info.get("version")
+    description = info.get("description") or ""
+    return [
+        (LMDB_META_DB, key, encode_details_meta(headers, version, codec)),
+        (LMDB_JSON_DB, key, compress_blob(json_data.encode("utf-8"), codec, dictionary, DETAILS_ZSTD_LEVEL)),
+        (
+            LMDB_MD_DB,
+            key,
+            compress_blob(md_data.encode("utf-8"), codec, dictionary, DETAILS_ZSTD_LEVEL) if md_data else None,
+        ),
+        (LMDB_DESC_DB, key, compress_blob(description.encode("utf-8"), codec, dictionary, DETAILS_ZSTD_LEVEL)),
+    ]
+
+
+def _put_entry(txn, dbs: Dict[bytes, Any], db: Optional[bytes], key: bytes, value: Optional[bytes]):
+    handle = dbs[db] if db is not None else None
+    if db == LMDB_META_DB:
+        # Keep the expiry index in step with the meta record's timestamp
+        old = txn.get(key, db=handle)
+        if old is not None:
+            txn.delete(_expiry_key(_meta_timestamp(old), key), db=dbs[LMDB_EXPIRY_DB])
+        if value is not None:
+            txn.put(_expiry_key(_meta_timestamp(value), key), b"", db=dbs[LMDB_EXPIRY_DB])
+    if value is None:
+        txn.delete(key, db=handle)
+    else:
+        txn.put(key, value, db=handle)
+
+
+def _is_legacy_details_key(key: bytes) -> bool:
+    # Main-database keys that hold pre-sub-database details entries
+    return key != b"all_packages" and not key.startswith(b"_")
+
+
+def _legacy_entry_timestamp(value: bytes) -> float:
+    """Timestamp from a legacy entry's headers; 0.0 (expire first) if missing or invalid."""
+    try:
+        (len_h,) = struct.unpack(">I", value[:4])
+        headers = msgpack.unpackb(value[4:4 + len_h], raw=False)
+        return headers.get("timestamp") or 0.0
+    except (struct.error, msgpack.ExtraData, ValueError, AttributeError):
+        return 0.0
+
+
+def _index_legacy_details(txn, dbs: Dict[bytes, Any]):
+    """Add the main database's legacy details entries to a new expiry index, by header timestamp."""
+    for key, value in txn.cursor():
+        if _is_legacy_details_key(key):
+            txn.put(_expiry_key(_legacy_entry_timestamp(value), key), b"", db=dbs[LMDB_EXPIRY_DB])
+
+
+def _legacy_details_parts(value: bytes) -> Optional[List[bytes]]:
+    """The three length-prefixed parts of a legacy entry, or None if it is truncated."""
+    parts = []
+    pos = 0
+    try:
+        for _ in range(3):
+            (length,) = struct.unpack(">I", value[pos:pos + 4])
+            pos += 4
+            parts.append(value[pos:pos + length])
+            pos += length
+    except struct.error:
+        return None
+    return parts
+
+
+def decode_legacy_details(value: bytes, package_name: str = "") -> Optional[Dict[str, Any]]:
+    """Decode a legacy length-prefixed entry (msgpack headers, zlib JSON, zlib Markdown)."""
+    parts = _legacy_details_parts(value)
+    if parts is None:
+        return None
+    headers_bytes, json_compressed, md_compressed = parts
+
+    try:
+        headers = msgpack.unpackb(headers_bytes, raw=False)
+    except (msgpack.ExtraData, ValueError):
+        return None
+    if not isinstance(headers, dict):
+        return None
+    try:
+        json_data = zlib.decompress(json_compressed).decode("utf-8")
+    except zlib.error:
+        return None
+    md_data = None
+    if md_compressed:
+        try:
+            md_data = zlib.decompress(md_compressed).decode("utf-8")
+        except zlib.error:
+            logging.warning(
+                f"Invalid MD compression for {package_name}, using json only"
+            )
+            md_data = None
+
+    return {"headers": headers, "json": json_data, "md": md_data}
+
+
+def _migrate_legacy_details(txn, dbs: Dict[bytes, Any]) -> int:
+    """Split the main database's readable legacy details entries into the sub-databases.
+
+    Returns the number of entries migrated; a spelling whose normalized
+    name is already migrated is dropped.
+    """
+    legacy = [(bytes(k), bytes(v)) for k, v in txn.cursor() if _is_legacy_details_key(k)]
+    migrated = 0
+    for key, value in legacy:
+        entry = decode_legacy_details(value, key.decode("utf-8", "replace"))
+        if entry is None:
+            continue
+        txn.delete(_expiry_key(_legacy_entry_timestamp(value), key), db=dbs[LMDB_EXPIRY_DB])
+        txn.delete(key)
+        name = normalize_name(key.decode("utf-8")).encode("utf-8")
+        if txn.get(name, db=dbs[LMDB_META_DB]) is not None:
+            continue  # another spelling was migrated already
+        for item in _details_items(name, entry["headers"], entry["json"], entry["md"]):
+            _put_entry(txn, dbs, *item)
+        migrated += 1
+    return migrated
+
+
+def open_details_dbs(env: lmdb.Environment) -> Dict[bytes, Any]:
+    """Open the details sub-databases, creating them and migrating old entries on first use.
+
+    Entries in the legacy one-value format are split into the sub-databases
+    under their normalized name; unreadable ones stay in the main database
+    (indexed by their header timestamp, or 0) until the next prune.
+    """
+    def open_dbs(txn):
+        missing = {name for name in LMDB_DETAILS_DBS if txn.get(name) is None}
+        dbs = {name: env.open_db(name, txn=txn) for name in LMDB_DETAILS_DBS}
+        if LMDB_EXPIRY_DB in missing:
+            _index_legacy_details(txn, dbs)
+        if LMDB_META_DB in missing:
+            migrated = _migrate_legacy_details(txn, dbs)
+            if migrated:
+                logging.info(f"Migrated {migrated} details entries to the sub-database layout")
+        return dbs
+
+    return write_with_growth(env, open_dbs)
+
+
+def load_zstd_dictionaries(env: lmdb.Environment) -> tuple:
+    """({dict_id: ZstdCompressionDict}, current id or None) from LMDB_DICT_DB."""
+    dicts: Dict[int, Any] = {}
+    current = None
+    if zstandard is None:
+        return dicts, current
+    handle = CacheManager.details_dbs(env)[LMDB_DICT_DB]
+    with CacheManager.read_txn(env) as txn:
+        for key, value in txn.cursor(db=handle):
+            if key == b"current":
+                (current,) = struct.unpack(">I", value)
+            else:
+                dicts[struct.unpack(">I", key)[0]] = zstandard.ZstdCompressionDict(bytes(value))
+    return dicts, current
+
+
+def decompress_details(value: bytes, codec: int, env: Optional[lmdb.Environment] = None) -> bytes:
+    """Decompress a details part, looking up the zstd dictionary it names if it has one."""
+    dictionary = None
+    if codec == CODEC_ZSTD_DICT:
+        dict_id = zstd_frame_dict_id(value)
+        dicts, _ = CacheManager.zstd_dictionaries(env)
+        if dict_id not in dicts:  # trained by another process since we loaded them
+            dicts, _ = CacheManager.zstd_dictionaries(env, reload=True)
+        dictionary = dicts.get(dict_id)
+    return decompress_blob(value, codec, dictionary)
+
+
+def train_details_dictionary(
+    env: lmdb.Environment, samples: int = LMDB_DICT_SAMPLES, size: int = LMDB_DICT_SIZE
+) -> Optional[int]:
+    """Train a zstd dictionary on cached JSON documents and make it current.
+
+    Samples are spread evenly over the cache and cut to their first
+    LMDB_DICT_SAMPLE_BYTES, where the documents share most structure. Returns the dictionary id, or
+    None without zstandard or with fewer than LMDB_DICT_MIN_SAMPLES entries.
+    Older dictionaries are kept, so entries compressed with them stay readable.
+    """
+    if zstandard is None:
+        return None
+    dbs = CacheManager.details_dbs(env)
+    docs = []
+    with CacheManager.read_txn(env) as txn:
+        step = max(1, txn.stat(dbs[LMDB_JSON_DB])["entries"] // samples)
+        for i, (key, value) in enumerate(txn.cursor(db=dbs[LMDB_JSON_DB])):
+            meta = txn.get(key, db=dbs[LMDB_META_DB]) if i % step == 0 else None
+            if meta is None:
+                continue
+            try:
+                doc = decompress_details(bytes(value), decode_details_meta(meta)["codec"], env)
+                docs.append(doc[:LMDB_DICT_SAMPLE_BYTES])
+            except _CODEC_ERRORS + (struct.error,):
+                continue
+    if len(docs) < LMDB_DICT_MIN_SAMPLES:
+        return None
+    try:
+        dictionary = zstandard.train_dictionary(size, docs, level=DETAILS_ZSTD_LEVEL)
+    except zstandard.ZstdError as e:
+        logging.warning(f"zstd dictionary training failed: {e}")
+        return None
+    dict_id = struct.pack(">I", dictionary.dict_id())
+
+    def store(txn):
+        txn.put(dict_id, dictionary.as_bytes(), db=dbs[LMDB_DICT_DB])
+        txn.put(b"current", dict_id, db=dbs[LMDB_DICT_DB])
+
+    write_with_growth(env, store)
+    CacheManager.zstd_dictionaries(env, reload=True)
+    return dictionary.dict_id()
+
+
+def _recompress_parts(
+    values: Dict[bytes, Optional[bytes]], old_codec: int, codec: int, dictionary, env: lmdb.Environment
+) -> Optional[Dict[bytes, bytes]]:
+    """The stored parts of `values` ({db: part}) recompressed with `codec`; None when they already are."""
+    present = {db: v for db, v in values.items() if v is not None}
+    dict_id = dictionary.dict_id() if dictionary is not None else 0
+    if old_codec == codec and (
+        codec != CODEC_ZSTD_DICT or all(zstd_frame_dict_id(v) == dict_id for v in present.values())
+    ):
+        return None
+    return {
+        db: compress_blob(decompress_details(bytes(v), old_codec, env), codec, dictionary, DETAILS_ZSTD_LEVEL)
+        for db, v in present.items()
+    }
+
+
+def recompress_details_cache(
+    env: lmdb.Environment, train: bool = True, chunk: int = 500
+) -> Dict[str, int]:
+    """Rewrite every details entry with the current codec, in place.
+
+    With `train`, a dictionary is first trained on the cache. Entries are
+    rewritten `chunk` per write transaction; unreadable ones are left as
+    they are. Returns {entries, recompressed, bytes_before, bytes_after}.
+    """
+    if train:
+        train_details_dictionary(env)
+    codec, dictionary = CacheManager.details_codec(env)
+    dbs = CacheManager.details_dbs(env)
+    parts = (LMDB_JSON_DB, LMDB_MD_DB, LMDB_DESC_DB)
+    with CacheManager.read_txn(env) as txn:
+        keys = list(txn.cursor(db=dbs[LMDB_META_DB]).iternext(values=False))
+
+    def rewrite(txn, chunk_keys):
+        stats = dict.fromkeys(("entries", "recompressed", "bytes_before", "bytes_after"), 0)
+        for key in chunk_keys:
+            meta_value = txn.get(key, db=dbs[LMDB_META_DB])
+            if meta_value is None:
+                continue
+            stats["entries"] += 1
+            values = {db: txn.get(key, db=dbs[db]) for db in parts}
+            size = sum(len(v) for v in values.values() if v is not None)
+            stats["bytes_before"] += size
+            try:
+                meta = decode_details_meta(meta_value)
+                values = _recompress_parts(values, meta["codec"], codec, dictionary, env)
+            except _CODEC_ERRORS + (struct.error, UnicodeDecodeError):
+                values = None  # unreadable: keep it until it expires
+            if values is None:
+                stats["bytes_after"] += size
+                continue
+            for db, value in values.items():
+                txn.put(key, value, db=dbs[db])
+            # Same timestamp, so the expiry index is unchanged
+            txn.put(key, encode_details_meta(meta["headers"], meta["version"], codec), db=dbs[LMDB_META_DB])
+            stats["recompressed"] += 1
+            stats["bytes_after"] += sum(len(v) for v in values.values())
+        return stats
+
+    totals = dict.fromkeys(("entries", "recompressed", "bytes_before", "bytes_after"), 0)
+    for start in range(0, len(keys), chunk):
+        stats = write_with_growth(env, lambda txn: rewrite(txn, keys[start:start + chunk]))
+        totals = {name: totals[name] + stats[name] for name in totals}
+    return totals
+
+
+def prune_lmdb_cache(env: lmdb.Environment, verbose=False) -> int:
+    """Delete the details entries older than LMDB_CACHE_MAX_AGE_SECONDS.
+
+    Seeks the expiry index to the cutoff, so only the expired entries are
+    visited. Entries without a valid timestamp are indexed at 0 and go first.
+    """
+    cutoff = struct.pack(">d", time.time() - LMDB_CACHE_MAX_AGE_SECONDS)
+    dbs = CacheManager.details_dbs(env)
+
+    def prune(txn):
+        deleted = 0
+        cursor = txn.cursor(db=dbs[LMDB_EXPIRY_DB])
+        key = cursor.key() if cursor.first() else b""
+        while key and key[:8] < cutoff:
+            name = key[8:]
+            found = txn.delete(name)  # unreadable legacy entry
+            for db in (LMDB_META_DB, LMDB_JSON_DB, LMDB_MD_DB, LMDB_DESC_DB):
+                found |= txn.delete(name, db=dbs[db])
+            for include_desc in (False, True):
+                txn.delete(_rendered_key(name, include_desc), db=dbs[LMDB_RENDERED_DB])
+            deleted += found
+            cursor.delete()
+            key = cursor.key()
+        return deleted
+
+    deleted = write_with_growth(env, prune)
+    if verbose:
+        logging.info(f"Pruned {deleted} old entries from LMDB cache")
+    return deleted
+
+
+# `info` fields the details renderer and the description filter read
+DETAILS_INFO_FIELDS = (
+    "name",
+    "version",
+    "summary",
+    "description",
+    "requires_python",
+    "home_page",
+    "project_urls",
+    "release_url",
+    "classifiers",
+)
+
+
+def project_package_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Slim a PyPI JSON document down to what the details cache uses.
+
+    Keeps DETAILS_INFO_FIELDS of `info` and replaces `releases` (every file
+    of every version) by `release_times`: {version: first upload time, or
+    None for a release without files}, in PyPI's order.
+    """
+    info = data.get("info") or {}
+    release_times = {}
+    for version, files in (data.get("releases") or {}).items():
+        times = [
+            f.get("upload_time_iso_8601") or f.get("upload_time")
+            for f in files or ()
+            if isinstance(f, dict)
+        ]
+        times = [t for t in times if t]
+        release_times[version] = min(times) if times else None
+    return {
+        "info": {k: info[k] for k in DETAILS_INFO_FIELDS if k in info},
+        "release_times": release_times,
+    }
+
+
+def details_json(data: Dict[str, Any]) -> str:
+    """JSON text cached for a project: its projection, or all of it with CacheManager.full_json."""
+    return json.dumps(data if CacheManager.full_json else project_package_json(data))
+
+
+class RunStats:
+    """Cache and network counters of one run, reported by --stats / --stats-json.
+
+    Events are counted per area ("names", "details", "description"): hit,
+    miss, 304 (validated), 200 (refreshed by validation), 404 and error;
+    the "http" area counts the 429 and 503 answers the rate limiter saw.
+    Byte totals cover response bodies downloaded and cache parts
+    decompressed. Each timed stage keeps a latency histogram over
+    LATENCY_BUCKETS_MS. One process-wide instance, `run_stats`, is shared
+    by every thread.
+    """
+
+    EVENTS = ("hit", "miss", "304", "200", "404", "429", "503", "error")
+    LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters: Dict[str, int] = defaultdict(int)
+            self.bytes: Dict[str, int] = defaultdict(int)
+            # stage -> [count, total ms, max ms, per-bucket counts (last: over the top bucket)]
+            self.latency: Dict[str, list] = {}
+
+    def count(self, area: str, event: str, n: int = 1):
+        with self._lock:
+            self.counters[f"{area}.{event}"] += n
+
+    def add_bytes(self, kind: str, n: int):
+        with self._lock:
+            self.bytes[kind] += n
+
+    def observe(self, stage: str, seconds: float):
+        ms = seconds * 1e3
+        with self._lock:
+            entry = self.latency.get(stage)
+            if entry is None:
+                entry = self.latency[stage] = [0, 0.0, 0.0, [0] * (len(self.LATENCY_BUCKETS_MS) + 1)]
+            entry[0] += 1
+            entry[1] += ms
+            entry[2] = max(entry[2], ms)
+            entry[3][bisect_left(self.LATENCY_BUCKETS_MS, ms)] += 1
+
+    @contextlib.contextmanager
+    def timed(self, stage: str):
+        """Observe the wall time of the block under `stage`, also when it raises."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def _percentile(self, entry: list, q: float) -> float:
+        # Upper bound of the bucket holding the q-quantile sample, capped at the max seen
+        rank = q * entry[0]
+        for bound, seen in zip(accumulate(entry[3]), self.LATENCY_BUCKETS_MS + (entry[2],)):
+            if bound >= rank:
+                return min(seen, entry[2])
+        return entry[2]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The stats as plain JSON-serializable data."""
+        with self._lock:
+            latency = {}
+            for stage, entry in sorted(self.latency.items()):
+                count, total, peak, buckets = entry
+                latency[stage] = {
+                    "count": count,
+                    "total_ms": round(total, 3),
+                    "mean_ms": round(total / count, 3),
+                    "p50_ms": round(self._percentile(entry, 0.5), 3),
+                    "p95_ms": round(self._percentile(entry, 0.95), 3),
+                    "max_ms": round(peak, 3),
+                    "buckets_ms": dict(zip([str(b) for b in self.LATENCY_BUCKETS_MS] + ["inf"], buckets)),
+                }
+            return {
+                "timestamp": time.time(),
+                "elapsed_seconds": round(time.time() - self.started, 3),
+                "counters": dict(sorted(self.counters.items())),
+                "bytes": dict(sorted(self.bytes.items())),
+                "latency": latency,
+            }
+
+    def format(self) -> str:
+        """A plain-text summary of the stats."""
+        snap = self.snapshot()
+        counters = snap["counters"]
+        areas = sorted({name.split(".")[0] for name in counters})
+        lines = [f"Run stats ({snap['elapsed_seconds']:.2f} s)"]
+        if areas:
+            lines.append(f"  {'':12}" + "".join(f"{event:>7}" for event in self.EVENTS))
+            for area in areas:
+                lines.append(
+                    f"  {area:12}" + "".join(f"{counters.get(f'{area}.{event}', 0):>7,}" for event in self.EVENTS)
+                )
+        for kind, n in snap["bytes"].items():
+            lines.append(f"  bytes {kind:15} {n:>14,}")
+        if snap["latency"]:
+            lines.append(f"  {'latency (ms)':18}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+            for stage, lat in snap["latency"].items():
+                lines.append(
+                    f"  {stage:18}{lat['count']:>7,}{lat['mean_ms']:>10.2f}{lat['p50_ms']:>10.2f}"
+                    f"{lat['p95_ms']:>10.2f}{lat['max_ms']:>10.2f}"
+                )
+        return "\n".join(lines)
+
+    @contextlib.contextmanager
+    def reporting(self, show: bool = False, json_path: Optional[str] = None):
+        """Count from a clean slate in the block, then print (`show`) and/or write the stats to `json_path`."""
+        self.reset()
+        try:
+            yield self
+        finally:
+            if show:
+                print(self.format(), file=sys.stderr)
+            if json_path:
+                try:
+                    Path(json_path).write_text(json.dumps(self.snapshot(), indent=2) + "\n")
+                except OSError as e:
+                    logging.warning(f"Failed to write stats to {json_path}: {e}")
+
+
+run_stats = RunStats()
+
+
+# Shared HTTP client: every PyPI request goes through one pooled, keep-alive
+# requests.Session per process, so connections and TLS sessions are reused
+HTTP_RETRIES = 3  # retries of connection errors, read errors and HTTP_RETRY_STATUSES answers
+HTTP_BACKOFF_SECONDS = 0.5  # delay before the first retry; doubles with each further one
+HTTP_RETRY_STATUSES = (500, 502, 504)  # 429 and 503 go to the rate limiter instead
+HTTP_TIMEOUT = (5, 15)  # (connect, read) seconds for requests that name none
+# Client-side rate limiting (RateLimiter): every fetcher slows down together
+HTTP_THROTTLE_STATUSES = (429, 503)
+HTTP_THROTTLE_RETRIES = 5  # times a throttled request is sent again after the pause
+HTTP_THROTTLE_PAUSE = 1.0  # seconds paused without a Retry-After; doubles per consecutive throttling answer
+HTTP_RETRY_AFTER_MAX = 60.0  # longest Retry-After honoured
+HTTP_RATE_MIN = 0.5  # requests per second the adaptive rate never drops below
+HTTP_BURST = 10  # --burst default
+
+_http_session: Optional[requests.Session] = None
+_http_pool_size = 0
+_http_lock = threading.Lock()
+
+
+def http_retry() -> Retry:
+    """The urllib3 retry policy of the shared session.
+
+    The last answer of an exhausted status retry is returned, not raised,
+    so callers see the final 5xx as before. The changelog's XML-RPC POST is
+    a read and is retried like the GETs. Retry-After (429, 503) is left to
+    the rate limiter, which pauses every fetcher, not just this one.
+    """
+    return Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_SECONDS,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+
+
+def http_session(pool_size: int = FETCH_CONCURRENCY) -> requests.Session:
+    """Return the process-wide Session, with room for `pool_size` connections per host.
+
+    Asking for a larger pool than the current one remounts the adapters;
+    main() sizes it to --concurrency before any fetch.
+    """
+    global _http_session, _http_pool_size
+    with _http_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+        if pool_size > _http_pool_size:
+            adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=http_retry())
+            _http_session.mount("https://", adapter)
+            _http_session.mount("http://", adapter)
+            _http_pool_size = pool_size
+        return _http_session
+
+
+def close_http_session():
+    """Close the shared Session and its connections; the next request opens a new one."""
+    global _http_session, _http_pool_size
+    with _http_lock:
+        if _http_session is not None:
+            _http_session.close()
+        _http_session = None
+        _http_pool_size = 0
+
+
+class RateLimiter:
+    """Token bucket shared by every fetch thread of the process.
+
+    `acquire()` takes a token before each request: up to `burst` at once,
+    then `rate` per second (0: no limit until the server pushes back). A
+    429 or 503 answer (`throttled()`) pauses every fetcher for its
+    Retry-After, or for HTTP_THROTTLE_PAUSE doubling per consecutive
+    answer, and halves the rate from the one sent at over the last second.
+    Later successes bring it back to 90% of that rate within about a
+    second, then raise it by about one request per second every second,
+    up to the configured rate. One process-wide
+    instance, `rate_limiter`, is configured from --rate / --burst.
+    """
+
+    def __init__(self, rate: float = 0.0, burst: int = HTTP_BURST):
+        self._lock = threading.Lock()
+        self.configure(rate, burst)
+
+    def configure(self, rate: float = 0.0, burst: int = HTTP_BURST):
+        with self._lock:
+            self.max_rate = rate if rate > 0 else math.inf
+            self.rate = self.max_rate
+            self.burst = max(1, burst)
+            self.tokens = float(self.burst)
+            self.updated = time.monotonic()
+            self.paused_until = 0.0
+            self.ceiling = math.inf  # the rate last throttled
+            self.strikes = 0  # throttling answers since the last success
+            self._sent: deque = deque()  # send times within the last second
+
+    def acquire(self) -> float:
+        """Wait until a request may be sent; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    if now > self.updated and math.isfinite(self.rate):
+                        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = max(now, self.updated)
+                    if self.tokens >= 1 or not math.isfinite(self.rate):
+                        self.tokens = max(0.0, self.tokens - 1)
+                        self._sent.append(now)
+                        while self._sent[0] < now - 1:
+                            self._sent.popleft()
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """The server answered 429/503: pause everyone and slow down."""
+        with self._lock:
+            now = time.monotonic()
+            pause = HTTP_THROTTLE_PAUSE * 2 ** min(self.strikes, 6) if retry_after is None else retry_after
+            self.strikes += 1
+            # The other requests in flight when the first answer came are
+            # throttled too; only that first answer cuts the rate
+            if now >= self.paused_until:
+                while self._sent and self._sent[0] < now - 1:
+                    self._sent.popleft()
+                span = max(now - self._sent[0], 0.1) if self._sent else 1.0
+                self.ceiling = min(self.rate, len(self._sent) / span)
+                self.rate = max(HTTP_RATE_MIN, self.ceiling / 2)
+            self.paused_until = max(self.paused_until, now + min(pause, HTTP_RETRY_AFTER_MAX))
+            self.tokens = 1.0  # one request probes the server when the pause ends
+            self.updated = self.paused_until
+
+    def succeeded(self):
+        """A request went through: speed back up towards the configured rate."""
+        with self._lock:
+            self.strikes = 0
+            if self.rate < self.max_rate:
+                # Within about a second back to 90% of the rate that was
+                # throttled, then probing by ~1 request/s every second
+                target = 0.9 * self.ceiling
+                step = (target - self.rate if self.rate < target else 1) / self.rate
+                self.rate = min(self.max_rate, self.rate + step)
+
+
+rate_limiter = RateLimiter()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delay-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def http_request(method: str, stage: str, url: str, **kwargs) -> requests.Response:
+    """Send `method` ("get" / "post") to `url` with the shared session, paced by `rate_limiter`.
+
+    Each attempt is timed under `stage` in run_stats (a streamed request to
+    its response headers), and time spent waiting for the limiter under
+    "http.wait". 429 and 503 answers are retried HTTP_THROTTLE_RETRIES
+    times after the limiter's pause; the last one is returned. The body
+    size of a non-streamed response is added to the "downloaded" bytes
+    (streamed bodies are counted as they are read). Without a `timeout`,
+    HTTP_TIMEOUT applies.
+    """
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    for attempt in range(HTTP_THROTTLE_RETRIES + 1):
+        waited = rate_limiter.acquire()
+        if waited:
+            run_stats.observe("http.wait", waited)
+        with run_stats.timed(stage):
+            resp = getattr(http_session(), method)(url, **kwargs)
+        if resp.status_code not in HTTP_THROTTLE_STATUSES:
+            rate_limiter.succeeded()
+            break
+        run_stats.count("http", str(resp.status_code))
+        rate_limiter.throttled(parse_retry_after(resp.headers.get("Retry-After")))
+        if attempt < HTTP_THROTTLE_RETRIES:
+            resp.close()
+    if not kwargs.get("stream"):
+        run_stats.add_bytes("downloaded", len(resp.content or b""))
+    return resp
+
+
+def http_get(stage: str, url: str, **kwargs) -> requests.Response:
+    """GET `url` through http_request()."""
+    return http_request("get", stage, url, **kwargs)
+
+
+def extract_headers(resp: requests.Response) -> Dict[str, Any]:
+    """Extract relevant headers from a requests response for caching."""
+    etag = resp.headers.get("ETag", "")
+    last_modified = resp.headers.get("Last-Modified")
+    return {
+        "etag": etag if etag else None,
+        "last_modified": last_modified,
+        "timestamp": time.time(),
+    }
+
+
+def store_package_data(
+    env: lmdb.Environment,
+    package_name: str,
+    headers: Dict[str, Any],
+    json_data: str,
+    md_data: Optional[str] = None,
+    verbose=False,
+):
+    """Store package JSON data and optional Markdown in LMDB with headers.
+
+    Entries are keyed by the PEP 503 normalized name, so every spelling of a
+    project shares one entry. The meta record, JSON, Markdown and the
+    extracted description each go to their own sub-database.
+    """
+    try:
+        key = normalize_name(package_name).encode("utf-8")
+        codec, dictionary = CacheManager.details_codec(env)
+        CacheManager.put_many(_details_items(key, headers, json_data, md_data, codec, dictionary), env=env)
+        if verbose:
+            logging.info(f"Stored {package_name} in LMDB cache")
+    except lmdb.MapFullError:
+        logging.warning(
+            f"Failed to store {package_name}: the LMDB cache reached max_map_size "
+            f"({lmdb_settings()['max_map_size']:,} bytes), raise it in {CONFIG_FILE} "
+            "or PYPI_SEARCH_LMDB_MAX_MAP_SIZE"
+        )
+        raise
+    except Exception:
+        logging.warning(f"Failed to store {package_name} in LMDB cache")
+        raise
+
+
+def touch_package_data(env: lmdb.Environment, package_name: str, headers: Dict[str, Any]) -> bool:
+    """Replace the headers of a cached entry (after a 304) without rewriting its data."""
+    key = normalize_name(package_name).encode("utf-8")
+    value = CacheManager.get(key, env=env, db=LMDB_META_DB)
+    if value is None:
+        return False
+    meta = decode_details_meta(value)
+    CacheManager.put(
+        key, encode_details_meta(headers, meta["version"], meta["codec"]), env=env, db=LMDB_META_DB
+    )
+    return True
+
+
+_DETAILS_PART_DBS = {"json": LMDB_JSON_DB, "md": LMDB_MD_DB, "desc": LMDB_DESC_DB}
+
+
+def retrieve_package_data(
+    env: lmdb.Environment, package_name: str, parts: Iterable[str] = ("json", "md")
+) -> Optional[Dict[str, Any]]:
+    """Retrieve cached package data from LMDB, decompressing and parsing as needed.
+
+    Only the meta record and the requested `parts` ("json", "md", "desc")
+    are read; the others are None. Returns None when the entry is missing
+    or a requested JSON / description part is unreadable.
+    """
+    with run_stats.timed("lmdb.read"):
+        return _retrieve_package_data(env, package_name, parts)
+
+
+def _retrieve_package_data(
+    env: lmdb.Environment, package_name: str, parts: Iterable[str]
+) -> Optional[Dict[str, Any]]:
+    key = normalize_name(package_name).encode("utf-8")
+    parts = list(parts)
+    # One read transaction: a concurrent store or prune cannot pair this
+    # meta record with another version's parts
+    value, *values = CacheManager.get_many(
+        [(LMDB_META_DB, key)] + [(_DETAILS_PART_DBS[part], key) for part in parts], env=env
+    )
+    if value is None:
+        return None
+    try:
+        meta = decode_details_meta(value)
+    except (struct.error, UnicodeDecodeError):
+        return None
+    cached = {"headers": meta["headers"], "version": meta["version"], "json": None, "md": None, "desc": None}
+    for part, value in zip(parts, values):
+        if value is None:
+            if part == "md":
+                continue
+            return None
+        try:
+            data = decompress_details(value, meta["codec"], env)
+            run_stats.add_bytes("decompressed", len(data))
+            cached[part] = data.decode("utf-8")
+        except _CODEC_ERRORS:
+            if part != "md":
+                return None
+            logging.warning(f"Invalid MD compression for {package_name}, using json only")
+    return cached
+
+
+# Rendered details record (LMDB_RENDERED_DB): ">IBH" renderer fingerprint,
+# codec, project version length (_META_NONE: None), the version, then the
+# compressed Markdown.
+_RENDERED_HEADER = struct.Struct(">IBH")
+_renderer_fingerprint: Optional[int] = None
+
+
+def _hash_code(h, code: types.CodeType):
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(h, const)  # nested functions and comprehensions
+        elif isinstance(const, frozenset):
+            h.update(repr(sorted(map(repr, const))).encode("utf-8"))  # set order varies per process
+        else:
+            h.update(repr(const).encode("utf-8"))
+    h.update(repr(code.co_names).encode("utf-8"))
+
+
+def renderer_fingerprint() -> int:
+    """32-bit hash of the code and patterns that produce the displayed details Markdown.
+
+    Any change to them (or to html2text) invalidates the rendered cache.
+    """
+    global _renderer_fingerprint
+    if _renderer_fingerprint is None:
+        h = hashlib.blake2b(digest_size=4)
+        for fn in (
+            details_markdown,
+            clean_details_markdown,
+            convert_rst_table,
+            parse_simple_rst_list_table,
+            rich_table_to_markdown,
+            extract_raw_html_blocks,
+        ):
+            _hash_code(h, fn.__code__)
+        h.update(repr([(regex.pattern, repl) for regex, repl in _DETAILS_MD_SUBS]).encode("utf-8"))
+        h.update(repr((_DETAILS_MD_DROP_PREFIXES, html2text.__version__)).encode("utf-8"))
+        _renderer_fingerprint = int.from_bytes(h.digest(), "big")
+    return _renderer_fingerprint
+
+
+def _rendered_key(key: bytes, include_desc: bool) -> bytes:
+    return key + (b"\0f" if include_desc else b"\0d")
+
+
+def store_rendered_details(package_name: str, include_desc: bool, md: str) -> bool:
+    """Cache the displayed details Markdown of a project for its cached release version.
+
+    Does nothing (False) when the project's details are not cached.
+    """
+    env = CacheManager.shared_env()
+    key = normalize_name(package_name).encode("utf-8")
+    value = CacheManager.get(key, env=env, db=LMDB_META_DB)
+    if value is None:
+        return False
+    version = decode_details_meta(value)["version"]
+    version_bytes = b"" if version is None else version.encode("utf-8")
+    codec, dictionary = CacheManager.details_codec(env)
+    record = (
+        _RENDERED_HEADER.pack(renderer_fingerprint(), codec, _META_NONE if version is None else len(version_bytes))
+        + version_bytes
+        + compress_blob(md.encode("utf-8"), codec, dictionary, DETAILS_ZSTD_LEVEL)
+    )
+    CacheManager.put(_rendered_key(key, include_desc), record, env=env, db=LMDB_RENDERED_DB)
+    return True
+
+
+def load_rendered_details(package_name: str, include_desc: bool) -> Optional[str]:
+    """The cached displayed details Markdown, or None.
+
+    A rendered entry is only used while the project's details entry is
+    fresh, for the release version it was rendered from, and by the
+    current renderer (renderer_fingerprint).
+    """
+    try:
+        env = CacheManager.shared_env()
+        key = normalize_name(package_name).encode("utf-8")
+        meta_value = CacheManager.get(key, env=env, db=LMDB_META_DB)
+        value = CacheManager.get(_rendered_key(key, include_desc), env=env, db=LMDB_RENDERED_DB)
+        if meta_value is None or value is None:
+            return None
+        meta = decode_details_meta(meta_value)
+        if time.time() - meta["headers"]["timestamp"] >= LMDB_CACHE_MAX_AGE_SECONDS:
+            return None
+        fingerprint, codec, n = _RENDERED_HEADER.unpack_from(value)
+        pos = _RENDERED_HEADER.size
+        version = None if n == _META_NONE else value[pos:pos + n].decode("utf-8")
+        if fingerprint != renderer_fingerprint() or version != meta["version"]:
+            return None
+        pos += 0 if n == _META_NONE else n
+        md = decompress_details(value[pos:], codec, env)
+        run_stats.add_bytes("decompressed", len(md))
+        return md.decode("utf-8")
+    except (lmdb.Error, struct.error, UnicodeDecodeError) + _CODEC_ERRORS:
+        return None
+
+
+def get_package_long_description(
+    package_name: str,
+    verbose: bool = False,
+    test_mode: bool = False,
+    validate_cache: bool = False,
+) -> str:
+    try:
+        env = CacheManager.shared_env()
+        CacheManager.prune_expired(verbose=verbose)
+        cached = retrieve_package_data(env, package_name, parts=("desc",))
+        fresh = (
+            cached
+            and (time.time() - cached["headers"]["timestamp"])
+            < LMDB_CACHE_MAX_AGE_SECONDS
         )
         if fresh:
-            data_str = cached["json"]
-            data = json.loads(data_str)
-            desc = data.get("info", {}).get("description", "")
+            desc = cached["desc"]
             if not validate_cache:
+                run_stats.count("description", "hit")
                 if verbose or test_mode:
                     logging.info(f"Cache hit for {package_name}")
                 return desc
@@ -499,20 +3110,20 @@ def get_package_long_description(
             if lmod:
                 req_headers["If-Modified-Since"] = lmod
             url = PYPI_JSON_URL.format(package_name=package_name)
-            resp = requests.get(
-                url, headers=req_headers if req_headers else None, timeout=10
+            resp = http_get(
+                "http.json", url, headers=req_headers if req_headers else None, timeout=10
             )
             if resp.status_code == 304:
+                run_stats.count("description", "304")
                 if verbose or test_mode:
                     logging.info(
                         f"Cache validated (304) for {package_name}"
                     )
                 cached["headers"]["timestamp"] = time.time()
-                store_package_data(
-                    env, package_name, cached["headers"], data_str, verbose=verbose
-                )
+                touch_package_data(env, package_name, cached["headers"])
                 return desc
             elif resp.status_code == 200:
+                run_stats.count("description", "200")
                 if verbose or test_mode:
                     logging.info(
                         f"Cache updated (200) for description of {package_name}"
@@ -521,7 +3132,7 @@ def get_package_long_description(
                 data = resp.json()
                 desc = data.get("info", {}).get("description", "")
                 headers = extract_headers(resp)
-                json_data = json.dumps(data)
+                json_data = details_json(data)
                 store_package_data(
                     env, package_name, headers, json_data, verbose=verbose
                 )
@@ -532,6 +3143,7 @@ def get_package_long_description(
                         f"Precondition failed (412) for description of {package_name}, refetching unconditionally"
                     )
             else:
+                run_stats.count("description", "error")
                 if verbose or test_mode:
                     logging.warning(
                         f"Cache validation failed for description of {package_name} (status {resp.status_code}), using cache"
@@ -539,31 +3151,30 @@ def get_package_long_description(
                 return desc
         # fall through
     except Exception as e:
+        run_stats.count("description", "error")
         if verbose or test_mode:
             logging.warning(f"Cache error for {package_name}: {e}")
-    finally:
-        if env:
-            env.close()
 
+    run_stats.count("description", "miss")
     if verbose or test_mode:
         logging.info(f"Cache miss for {package_name}, fetching from PyPI")
 
     # unconditional fetch
     url = PYPI_JSON_URL.format(package_name=package_name)
     try:
-        resp = requests.get(url, timeout=10)
+        resp = http_get("http.json", url, timeout=10)
         if resp.status_code == 404:
+            run_stats.count("description", "404")
             return ""
         resp.raise_for_status()
         data = resp.json()
         desc = data.get("info", {}).get("description", "")
         # store
         try:
-            env = init_lmdb_env()
+            env = CacheManager.shared_env()
             headers = extract_headers(resp)
-            json_data = json.dumps(data)
+            json_data = details_json(data)
             store_package_data(env, package_name, headers, json_data, verbose=verbose)
-            env.close()
             if verbose or test_mode:
                 logging.info(f"Fetched and cached {package_name}")
         except Exception as e:
@@ -571,25 +3182,194 @@ def get_package_long_description(
                 logging.warning(f"Failed to cache description for {package_name}: {e}")
         return desc
     except requests.RequestException as e:
-        if verbose or test_mode:
-            logging.error(f"Failed to fetch description for {package_name}: {e}")
-        return ""
+        run_stats.count("description", "error")
+        if verbose or test_mode:
+            logging.error(f"Failed to fetch description for {package_name}: {e}")
+        return ""
+    except ValueError as e:
+        run_stats.count("description", "error")
+        if verbose or test_mode:
+            logging.error(f"Invalid JSON for {package_name}: {e}")
+        return ""
+
+
+def iter_simple_index_names(
+    resp: requests.Response, limit: Optional[int] = None
+) -> Iterator[str]:
+    """Yield package names from a streamed /simple response, chunk by chunk.
+
+    Only the unparsed tail of the previous chunk is kept between reads, so
+    memory stays flat regardless of index size. Stops reading once `limit`
+    names have been yielded.
+    """
+    buf = b""
+    count = 0
+    for chunk in resp.iter_content(chunk_size=SIMPLE_STREAM_CHUNK_SIZE):
+        if not chunk:
+            continue
+        run_stats.add_bytes("downloaded", len(chunk))
+        buf += chunk
+        end = 0
+        for m in _SIMPLE_ANCHOR_RE.finditer(buf):
+            end = m.end()
+            name = unescape(m.group(1).decode("utf-8", "replace")).strip().rstrip("/")
+            if name:
+                yield name
+                count += 1
+                if limit and count >= limit:
+                    return
+        # Keep only what may still be the start of an unfinished anchor
+        rest = buf[end:]
+        start = max(rest.rfind(b"<a"), rest.rfind(b"<A"))
+        if start == -1:
+            start = rest.rfind(b"<")  # "<" split from its "a"
+        buf = rest[start:] if start != -1 else b""
+
+
+def _stream_package_names(resp: requests.Response, limit=None) -> Iterator[str]:
+    count = 0
+    try:
+        for name in iter_simple_index_names(resp, limit=limit):
+            count += 1
+            yield name
+    finally:
+        resp.close()
+    print(f"Found {count:,} package names.", file=sys.stderr)
+
+
+def parse_simple_index_json(payload: bytes, limit=None) -> Dict[str, Any]:
+    """Parse a PEP 691 JSON /simple index into names, per-project serials and the index serial."""
+    data = _fast_json_loads(payload)
+    names = []
+    serials = {}
+    for project in data.get("projects", []):
+        name = project.get("name")
+        if not name:
+            continue
+        names.append(name)
+        serial = project.get("_last-serial")
+        if serial is not None:
+            serials[name] = serial
+        if limit and len(names) >= limit:
+            break
+    return {
+        "names": names,
+        "serials": serials,
+        "last_serial": data.get("meta", {}).get("_last-serial"),
+    }
+
+
+def _conditional_headers(validators: Dict[str, Any]) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since request headers for the etag / last_modified of a previous fetch."""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def fetch_package_index(
+    limit=None, validators: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Fetch the PyPI simple index, negotiating the PEP 691 JSON form.
+
+    Returns {"names", "serials", "last_serial", "etag", "last_modified",
+    "not_modified"}. When the server answers with HTML, "names" is a
+    generator over the streamed page and "serials" is None. `validators`
+    (etag / last_modified from a previous fetch) make the request
+    conditional; on a 304 "not_modified" is True and nothing is downloaded.
+    """
+    url = PYPI_SIMPLE_URL
+    print(
+        "Fetching fresh PyPI package index... (may take a few seconds)", file=sys.stderr
+    )
+
+    validators = validators or {}
+    req_headers = {"Accept": PYPI_SIMPLE_ACCEPT, **_conditional_headers(validators)}
+
+    try:
+        resp = http_get("http.index", url, headers=req_headers, timeout=15, stream=True)
+        if resp.status_code == 304:
+            resp.close()
+            run_stats.count("names", "304")
+            print("PyPI package index not modified (304).", file=sys.stderr)
+            return {
+                "names": None,
+                "serials": None,
+                "last_serial": None,
+                "etag": validators.get("etag"),
+                "last_modified": validators.get("last_modified"),
+                "not_modified": True,
+            }
+        resp.raise_for_status()
+    except requests.RequestException as e:
+        run_stats.count("names", "error")
+        print(f"Error downloading PyPI index: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    new_validators = extract_headers(resp)
+    # PyPI reports the index serial on both the HTML and JSON forms
+    header_serial = resp.headers.get("X-PyPI-Last-Serial")
+    header_serial = int(header_serial) if header_serial else None
+
+    index = _read_package_index(resp, limit)
+    if index["last_serial"] is None:
+        index["last_serial"] = header_serial
+    index["etag"] = new_validators["etag"]
+    index["last_modified"] = new_validators["last_modified"]
+    index["not_modified"] = False
+    return index
+
+
+def _read_package_index(resp: requests.Response, limit=None) -> Dict[str, Any]:
+    """{"names", "serials", "last_serial"} from a /simple response in whichever form the server chose."""
+    content_type = resp.headers.get("Content-Type", "")
+    if content_type.split(";")[0].strip() != PYPI_SIMPLE_JSON_TYPE:
+        return {"names": _stream_package_names(resp, limit=limit), "serials": None, "last_serial": None}
+    try:
+        run_stats.add_bytes("downloaded", len(resp.content))
+        index = parse_simple_index_json(resp.content, limit=limit)
     except ValueError as e:
-        if verbose or test_mode:
-            logging.error(f"Invalid JSON for {package_name}: {e}")
-        return ""
+        print(f"Error parsing PyPI JSON index: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        resp.close()
+    print(f"Found {len(index['names']):,} package names.", file=sys.stderr)
+    return index
+
+
+def fetch_all_package_names(limit=None, stream=False, negotiate=False):
+    """Fetch all package names from the PyPI simple index.
 
+    With stream=True a generator is returned that parses names from the
+    response chunks as they arrive, instead of building a full
+    BeautifulSoup tree of the whole page. With negotiate=True the PEP 691
+    JSON form is requested first (see fetch_package_index).
+    """
+    if negotiate:
+        return fetch_package_index(limit=limit)["names"]
 
-def fetch_all_package_names(limit=None):
     url = PYPI_SIMPLE_URL
     print(
         "Fetching fresh PyPI package index... (may take a few seconds)", file=sys.stderr
     )
 
+    if stream:
+        try:
+            resp = http_get("http.index", url, timeout=15, stream=True)
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            run_stats.count("names", "error")
+            print(f"Error downloading PyPI index: {e}", file=sys.stderr)
+            sys.exit(1)
+        return _stream_package_names(resp, limit=limit)
+
     try:
-        resp = requests.get(url, timeout=15)
+        resp = http_get("http.index", url, timeout=15)
         resp.raise_for_status()
     except requests.RequestException as e:
+        run_stats.count("names", "error")
         print(f"Error downloading PyPI index: {e}", file=sys.stderr)
         sys.exit(1)
 
@@ -608,22 +3388,188 @@ def fetch_all_package_names(limit=None):
     return packages
 
 
-def get_packages(refresh_cache):
+def fetch_changelog_since_serial(serial: int) -> Optional[List[list]]:
+    """Ask PyPI for the change events after `serial`.
+
+    Returns a list of [name, version, timestamp, action, serial] events, or
+    None when the delta is unavailable (network error, XML-RPC fault).
+    """
+    body = xmlrpc.client.dumps((serial,), "changelog_since_serial")
+    try:
+        resp = http_request(
+            "post",
+            "http.changelog",
+            PYPI_XMLRPC_URL,
+            data=body.encode("utf-8"),
+            headers={"Content-Type": "text/xml"},
+            timeout=15,
+        )
+        resp.raise_for_status()
+        (events,), _ = xmlrpc.client.loads(resp.content)
+        return events
+    except (requests.RequestException, xmlrpc.client.Error, ValueError) as e:
+        run_stats.count("names", "error")
+        logging.warning(f"Changelog since serial {serial} unavailable: {e}")
+        return None
+
+
+def apply_changelog(
+    packages: List[str], serials: Dict[str, int], events: List[list]
+) -> Dict[str, Any]:
+    """Apply PyPI changelog events to `packages` and `serials` in place.
+
+    Handles project creation, removal and renames; every other action just
+    bumps the project's serial. Returns {"added", "removed", "last_serial"}.
+    """
+    known = set(packages)
+    added: Dict[str, None] = {}  # insertion-ordered names new since the snapshot
+    removed = set()
+    last_serial = None
+
+    def drop(name):
+        if name in known:
+            known.discard(name)
+            if name in added:
+                del added[name]
+            else:
+                removed.add(name)
+        serials.pop(name, None)
+
+    for name, _version, _timestamp, action, serial in events:
+        last_serial = serial if last_serial is None else max(last_serial, serial)
+        if action == "remove project":
+            drop(name)
+            continue
+        if action.startswith("rename from "):
+            drop(action[len("rename from "):])
+        if name not in known:
+            known.add(name)
+            if name in removed:
+                removed.discard(name)
+            else:
+                added[name] = None
+        serials[name] = serial
+
+    if removed:
+        packages[:] = [p for p in packages if p not in removed]
+    packages.extend(added)
+    return {"added": len(added), "removed": len(removed), "last_serial": last_serial}
+
+
+def refresh_packages_incremental(cm: "CacheManager") -> Optional[List[str]]:
+    """Bring the names cache up to date from the PyPI changelog.
+
+    Returns the updated list, or None when a full refetch is needed (no
+    recorded serial, no cached names, or the delta is unavailable).
+    """
+    last_serial = cm.load_last_serial()
+    if last_serial is None:
+        return None
+    packages = cm.load(allow_stale=True)
+    if packages is None:
+        return None
+    events = fetch_changelog_since_serial(last_serial)
+    if events is None:
+        return None
+
+    serials = cm.load_serials() or {}
+    delta = apply_changelog(packages, serials, events)
+    new_serial = max(last_serial, delta["last_serial"] or last_serial)
+    packages = cm.save(
+        packages,
+        serials=serials,
+        last_serial=new_serial,
+        validators=cm.load_validators(),
+    )
+    print(
+        f"Incremental refresh: {len(events):,} events, +{delta['added']:,} "
+        f"-{delta['removed']:,} pkgs (serial {last_serial} -> {new_serial})",
+        file=sys.stderr,
+    )
+    return packages
+
+
+def get_packages(refresh_cache, incremental=True):
     ensure_cache_dir()
     cm = CacheManager()
     if not refresh_cache:
-        packages = cm.load()
+        with run_stats.timed("names.load"):
+            packages = cm.load()
         if packages is not None:
+            run_stats.count("names", "hit")
             print(f"Using cache: {len(packages):,} pkgs", file=sys.stderr)
             return packages
+    run_stats.count("names", "miss")
+
+    # Apply only the changes since the recorded serial when possible
+    if incremental:
+        packages = refresh_packages_incremental(cm)
+        if packages is not None:
+            run_stats.count("names", "200")  # a changelog delta counts as a refresh
+            print(f"Cache updated: {len(packages):,} pkgs.", file=sys.stderr)
+            return packages
+
+    # Conditional fetch: a 304 only bumps the cache timestamp
+    index = fetch_package_index(validators=cm.load_validators())
+    if index.get("not_modified"):
+        packages = cm.load() if cm.touch() else None
+        if packages is not None:
+            print(f"Cache revalidated: {len(packages):,} pkgs.", file=sys.stderr)
+            return packages
+        index = fetch_package_index()
 
-    # Fetch and save
-    packages = fetch_all_package_names()
-    cm.save(packages)
+    # Fetch and save (HTML names stream straight from the response into the cache)
+    run_stats.count("names", "200")
+    packages = cm.save(
+        index["names"],
+        serials=index["serials"],
+        last_serial=index["last_serial"],
+        validators=index,
+    )
     print(f"Cache updated: {len(packages):,} pkgs.", file=sys.stderr)
     return packages
 
 
+def details_markdown(
+    package_name: str,
+    info: Dict[str, Any],
+    include_desc: bool = False,
+    console: Optional[Console] = None,
+) -> str:
+    """The -d Markdown of a project from its PyPI JSON `info`; -f (`include_desc`) appends the description."""
+    md_parts = [f"## {package_name}"]
+    md_parts.append(f"**Version:** `{info.get('version', 'N/A')}`")
+    md_parts.append(f"**Requires Python:** {info.get('requires_python', 'N/A')}")
+    homepage = info.get("home_page")
+    if homepage:
+        md_parts.append(f"**Homepage:** [{homepage}]({homepage})")
+    project_urls = info.get("project_urls", {})
+    release_url = (
+        info.get("release_url")
+        or project_urls.get("Download URL")
+        or project_urls.get("Source")
+    )
+    if release_url:
+        md_parts.append(f"**Release:** [{release_url}]({release_url})")
+    bug_tracker = project_urls.get("Bug Tracker")
+    if bug_tracker:
+        md_parts.append(f"**Bug Tracker:** [{bug_tracker}]({bug_tracker})")
+    classifiers = info.get("classifiers", [])
+    if classifiers:
+        clf_md = "\n".join([f"- {c}" for c in classifiers[:15]])
+        md_parts.append(f"**Classifiers:**\n{clf_md}")
+    summary = info.get("summary", "")
+    if summary:
+        md_parts.append(f"**Summary:** {summary}")
+    if include_desc:
+        long_desc = info.get("description", "")
+        if long_desc:
+            long_desc = convert_rst_table(long_desc, console)
+            long_desc = extract_raw_html_blocks(long_desc)
+            md_parts.append(f"**Full Description:**\n{long_desc}...")
+    return "\n\n".join(md_parts)
+
+
 def fetch_project_details(
     package_name: str,
     console: Optional[Console] = None,
@@ -632,51 +3578,28 @@ def fetch_project_details(
     test_mode: bool = False,
     validate_cache: bool = False,
 ) -> Optional[str]:
-    env: Optional[lmdb.Environment] = None
     try:
-        env = init_lmdb_env()
-        prune_lmdb_cache(env, verbose=verbose)
-        cached = retrieve_package_data(env, package_name)
+        env = CacheManager.shared_env()
+        CacheManager.prune_expired(verbose=verbose)
+        # The stored Markdown (-f) or else the JSON to build it from
+        cached = retrieve_package_data(
+            env, package_name, parts=("md",) if include_desc else ("json",)
+        )
+        if cached and cached["json"] is None and not cached["md"]:
+            cached = retrieve_package_data(env, package_name, parts=("json",))
         fresh = (
             cached
             and (time.time() - cached["headers"]["timestamp"])
             < LMDB_CACHE_MAX_AGE_SECONDS
         )
         if fresh:
-            data_str = cached["json"]
-            data = json.loads(data_str)
-            info = data.get("info", {})
             if include_desc and cached["md"]:
                 md = cached["md"]
             else:
-                md_parts = [f"## {package_name}"]
-                md_parts.append(f"**Version:** `{info.get('version', 'N/A')}`")
-                md_parts.append(
-                    f"**Requires Python:** {info.get('requires_python', 'N/A')}"
-                )
-                homepage = info.get("home_page")
-                if homepage:
-                    md_parts.append(f"**Homepage:** [{homepage}]({homepage})")
-                project_urls = info.get("project_urls", {})
-                release_url = (
-                    info.get("release_url")
-                    or project_urls.get("Download URL")
-                    or project_urls.get("Source")
-                )
-                if release_url:
-                    md_parts.append(f"**Release:** [{release_url}]({release_url})")
-                bug_tracker = project_urls.get("Bug Tracker")
-                if bug_tracker:
-                    md_parts.append(f"**Bug Tracker:** [{bug_tracker}]({bug_tracker})")
-                classifiers = info.get("classifiers", [])
-                if classifiers:
-                    clf_md = "\n".join([f"- {c}" for c in classifiers[:15]])
-                    md_parts.append(f"**Classifiers:**\n{clf_md}")
-                summary = info.get("summary", "")
-                if summary:
-                    md_parts.append(f"**Summary:** {summary}")
-                md = "\n\n".join(md_parts)
+                info = json.loads(cached["json"]).get("info", {})
+                md = details_markdown(package_name, info)
             if not validate_cache:
+                run_stats.count("details", "hit")
                 if verbose or test_mode:
                     logging.info(f"Cache hit for {package_name}")
                 return md
@@ -689,65 +3612,26 @@ def fetch_project_details(
             if lmod:
                 req_headers["If-Modified-Since"] = lmod
             url = PYPI_JSON_URL.format(package_name=package_name)
-            resp = requests.get(
-                url, headers=req_headers if req_headers else None, timeout=10
+            resp = http_get(
+                "http.json", url, headers=req_headers if req_headers else None, timeout=10
             )
             if resp.status_code == 304:
+                run_stats.count("details", "304")
                 if verbose or test_mode:
                     logging.info(f"Cache validated (304) for {package_name}")
                 cached["headers"]["timestamp"] = time.time()
-                store_package_data(
-                    env,
-                    package_name,
-                    cached["headers"],
-                    data_str,
-                    cached.get("md"),
-                    verbose=verbose,
-                )
+                touch_package_data(env, package_name, cached["headers"])
                 return md
             elif resp.status_code == 200:
+                run_stats.count("details", "200")
                 if verbose or test_mode:
                     logging.info(f"Cache updated (200) for {package_name}")
                 resp.raise_for_status()
                 data = resp.json()
                 info = data.get("info", {})
-                json_data = json.dumps(data)
-                md_parts = [f"## {package_name}"]
-                md_parts.append(f"**Version:** `{info.get('version', 'N/A')}`")
-                md_parts.append(
-                    f"**Requires Python:** {info.get('requires_python', 'N/A')}"
-                )
-                homepage = info.get("home_page")
-                if homepage:
-                    md_parts.append(f"**Homepage:** [{homepage}]({homepage})")
-                project_urls = info.get("project_urls", {})
-                release_url = (
-                    info.get("release_url")
-                    or project_urls.get("Download URL")
-                    or project_urls.get("Source")
-                )
-                if release_url:
-                    md_parts.append(f"**Release:** [{release_url}]({release_url})")
-                bug_tracker = project_urls.get("Bug Tracker")
-                if bug_tracker:
-                    md_parts.append(f"**Bug Tracker:** [{bug_tracker}]({bug_tracker})")
-                classifiers = info.get("classifiers", [])
-                if classifiers:
-                    clf_md = "\n".join([f"- {c}" for c in classifiers[:15]])
-                    md_parts.append(f"**Classifiers:**\n{clf_md}")
-                summary = info.get("summary", "")
-                if summary:
-                    md_parts.append(f"**Summary:** {summary}")
-                full_md = "\n\n".join(md_parts)
-                md_to_store = None
-                if include_desc:
-                    long_desc = info.get("description", "")
-                    if long_desc:
-                        long_desc = convert_rst_table(long_desc, console)
-                        long_desc = extract_raw_html_blocks(long_desc)
-                        md_parts.append(f"**Full Description:**\n{long_desc}...")
-                        full_md = "\n\n".join(md_parts)
-                        md_to_store = full_md
+                json_data = details_json(data)
+                full_md = details_markdown(package_name, info, include_desc, console)
+                md_to_store = full_md if include_desc and info.get("description") else None
                 new_headers = extract_headers(resp)
                 store_package_data(
                     env,
@@ -759,6 +3643,8 @@ def fetch_project_details(
                 )
                 return full_md
             else:
+                if resp.status_code != 412:
+                    run_stats.count("details", "error")
                 if verbose or test_mode:
                     if resp.status_code == 412:
                         logging.info(
@@ -770,78 +3656,323 @@ def fetch_project_details(
                         )
                 return md
     except Exception as e:
+        run_stats.count("details", "error")
         if verbose or test_mode:
             logging.warning(
                 f"LMDB error for {package_name}: {e}, falling back to direct fetch"
             )
-    finally:
-        if env:
-            env.close()
 
+    run_stats.count("details", "miss")
     if verbose or test_mode:
         logging.info(f"Cache miss for {package_name}, fetching from PyPI")
 
     # unconditional fetch
     url = PYPI_JSON_URL.format(package_name=package_name)
     try:
-        resp = requests.get(url, timeout=10)
+        resp = http_get("http.json", url, timeout=10)
         if resp.status_code == 404:
+            run_stats.count("details", "404")
             return None
         resp.raise_for_status()
         data = resp.json()
         info = data.get("info", {})
-        md_parts = [f"## {package_name}"]
-        md_parts.append(f"**Version:** `{info.get('version', 'N/A')}`")
-        md_parts.append(f"**Requires Python:** {info.get('requires_python', 'N/A')}")
-        homepage = info.get("home_page")
-        if homepage:
-            md_parts.append(f"**Homepage:** [{homepage}]({homepage})")
-        project_urls = info.get("project_urls", {})
-        release_url = (
-            info.get("release_url")
-            or project_urls.get("Download URL")
-            or project_urls.get("Source")
-        )
-        if release_url:
-            md_parts.append(f"**Release:** [{release_url}]({release_url})")
-        bug_tracker = project_urls.get("Bug Tracker")
-        if bug_tracker:
-            md_parts.append(f"**Bug Tracker:** [{bug_tracker}]({bug_tracker})")
-        classifiers = info.get("classifiers", [])
-        if classifiers:
-            clf_md = "\n".join([f"- {c}" for c in classifiers[:15]])
-            md_parts.append(f"**Classifiers:**\n{clf_md}")
-        summary = info.get("summary", "")
-        if summary:
-            md_parts.append(f"**Summary:** {summary}")
-        full_md = "\n\n".join(md_parts)
-        json_data = json.dumps(data)
-        md_to_store = None
-        if include_desc:
-            long_desc = info.get("description", "")
-            if long_desc:
-                long_desc = convert_rst_table(long_desc, console)
-                long_desc = extract_raw_html_blocks(long_desc)
-                md_parts.append(f"**Full Description:**\n{long_desc}...")
-                full_md = "\n\n".join(md_parts)
-                md_to_store = full_md
+        full_md = details_markdown(package_name, info, include_desc, console)
+        json_data = details_json(data)
+        md_to_store = full_md if include_desc and info.get("description") else None
         # Store to LMDB on success
         try:
-            env = init_lmdb_env()
+            env = CacheManager.shared_env()
             headers = extract_headers(resp)
             store_package_data(
                 env, package_name, headers, json_data, md_to_store, verbose=verbose
             )
-            env.close()
         except Exception:
             logging.warning(f"Failed to store {package_name} in LMDB cache")
         return full_md
     except (requests.RequestException, ValueError) as e:
+        run_stats.count("details", "error")
         if verbose or test_mode:
             logging.error(f"Failed to fetch {package_name} from PyPI: {e}")
         return None
 
 
+def map_prefetched(fn, items: Iterable[Any], concurrency: int = FETCH_CONCURRENCY) -> Iterator[Any]:
+    """Yield fn(item) for `items` in order, running `concurrency` calls at once in threads.
+
+    At most 2 x `concurrency` calls are queued or running ahead of the
+    result last taken; the next one is submitted as each result is taken.
+    Results are yielded as soon as each is done and all earlier ones have
+    been taken. With concurrency 1 every call runs in the caller's thread
+    when its result is asked for. Closing the generator early cancels the
+    calls not started yet and waits for the running ones. When the caller
+    is inside CacheManager.batch(), the calls' stores join its batch.
+    """
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    # Inside a batch() the calls' LMDB puts are handed back and stored here,
+    # in the thread that owns the batch, so they share its commits
+    deferred = CacheManager.batching()
+    pool = concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(concurrency, len(items)), thread_name_prefix="pypi_search-fetch"
+    )
+    futures: deque = deque()
+    try:
+        for item in items:
+            futures.append(pool.submit(CacheManager.run_deferred, fn, item) if deferred else pool.submit(fn, item))
+            if len(futures) >= 2 * concurrency:
+                yield _prefetched_result(futures.popleft(), deferred)
+        while futures:
+            yield _prefetched_result(futures.popleft(), deferred)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _prefetched_result(future: concurrent.futures.Future, deferred: bool) -> Any:
+    if not deferred:
+        return future.result()
+    result, puts = future.result()
+    for items in puts:
+        CacheManager.put_many(items)
+    return result
+
+
+# Descriptions per task sent to a matcher process; the first chunk is also
+# the sample plan_scan_jobs times the --search regex on
+DESC_MATCH_CHUNK = 64
+
+
+def _match_descriptions_chunk(pattern: str, flags: int, texts: List[str]) -> List[bool]:
+    """Worker: whether `pattern` searches each of `texts`."""
+    regex = re.compile(pattern, flags)
+    return [bool(regex.search(text)) for text in texts]
+
+
+def match_descriptions(
+    describe,
+    names: Iterable[str],
+    regex: re.Pattern,
+    concurrency: int = FETCH_CONCURRENCY,
+    jobs: int = 0,
+) -> Iterator[bool]:
+    """Yield, for each of `names` in order, whether `regex` searches describe(name).
+
+    A two-stage pipeline: describe() runs up to `concurrency` names ahead
+    in threads (map_prefetched), and the descriptions are matched in
+    chunks of DESC_MATCH_CHUNK, in-process or by worker processes when
+    plan_scan_jobs, timed on the first chunk, says so for `jobs`.
+    """
+    names = list(names)
+    descs = map_prefetched(describe, names, concurrency)
+    pool = None
+    pending: deque = deque()
+    try:
+        for start in range(0, len(names), DESC_MATCH_CHUNK):
+            texts = [next(descs) or "" for _ in names[start:start + DESC_MATCH_CHUNK]]
+            if start == 0:
+                nprocs = plan_scan_jobs(texts, len(names), regex, jobs)
+                if nprocs > 1:
+                    pool = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=nprocs, mp_context=_scan_pool_context()
+                    )
+            if pool is None:
+                for text in texts:
+                    yield bool(regex.search(text))
+                continue
+            pending.append(pool.submit(_match_descriptions_chunk, regex.pattern, regex.flags, texts))
+            # Keep every worker busy while the fetchers fill the next chunk
+            while len(pending) > nprocs or pending[0].done():
+                yield from pending.popleft().result()
+                if not pending:
+                    break
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        descs.close()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+class SearchDaemon:
+    """Names buffer and indexes kept open for `--serve` clients.
+
+    The state is reloaded when the names buffer file is replaced or the
+    loaded record expires, so refreshes made by other processes (`-r`, a
+    cron job, an in-process fallback) are picked up without a restart.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.state: Optional[Dict[str, Any]] = None
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """Return the loaded {buf, index, trigrams, names, timestamp}, or None without a usable cache."""
+        with self.lock:
+            try:
+                st = NAMES_BUFFER_FILE.stat()
+                stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamp = None
+            if (
+                self.state is None
+                or stamp != self.stamp
+                or time.time() - self.state["timestamp"] >= CACHE_MAX_AGE_SECONDS
+            ):
+                self._load()
+            return self.state
+
+    def _load(self):
+        self.state = None
+        # None while the cache is missing or expired; clients then refresh it in-process
+        buf = get_names_buffer()
+        if buf is None:
+            return
+        header = CacheManager().load_header()
+        st = NAMES_BUFFER_FILE.stat()
+        self.stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        self.state = {
+            "buf": buf,
+            "index": open_names_index(buf),
+            "trigrams": open_trigram_index(buf),
+            "names": None,  # decoded on first per-name scan
+            "timestamp": header["timestamp"],
+        }
+        logging.info(f"Loaded {header['count']:,} package names")
+
+    def search(
+        self,
+        pattern: str,
+        ignore_case: bool = False,
+        normalized: bool = False,
+        engine: str = "auto",
+        jobs: int = 0,
+    ) -> Optional[List[str]]:
+        state = self.current()
+        if state is None:
+            return None
+        buf = state["buf"]
+        flags = re.IGNORECASE if ignore_case else 0
+        if normalized:
+            return search_names_normalized(buf, state["index"], pattern, flags)
+        matches = None
+        if engine != "scan":
+            matches = search_names(
+                buf, pattern, flags, engine, jobs, index=state["index"], trigrams=state["trigrams"]
+            )
+        if matches is None:
+            if state["names"] is None:
+                state["names"] = bytes(buf).decode("utf-8").split("\n")[:-1]
+            matches = scan_names(state["names"], pattern, flags, jobs)
+        return matches
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if op in ("search", "count"):
+            matches = self.search(
+                request["pattern"],
+                ignore_case=request.get("ignore_case", False),
+                normalized=request.get("normalized", False),
+                engine=request.get("engine", "auto"),
+                jobs=request.get("jobs", 0),
+            )
+            if matches is None:
+                return {"ok": False, "error": "names cache unavailable"}
+            if op == "count":
+                return {"ok": True, "count": len(matches)}
+            return {"ok": True, "matches": matches}
+        if op == "details":
+            md = fetch_project_details(
+                request["package"],
+                include_desc=request.get("include_desc", False),
+                validate_cache=request.get("validate_cache", False),
+            )
+            return {"ok": True, "md": md}
+        return {"ok": False, "error": f"unknown op {op!r}"}
+
+
+class _DaemonRequestHandler(socketserver.StreamRequestHandler):
+    # One JSON request per line, one JSON response per line
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.search_daemon.handle(json.loads(line))
+            except Exception as e:
+                logging.warning(f"Daemon request error: {e}")
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+
+    class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def make_daemon_server(socket_path: Optional[Path] = None):
+    """Bind the `--serve` Unix socket (replacing a stale one) and return the server."""
+    path = Path(socket_path or DAEMON_SOCKET)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        if daemon_request({"op": "ping"}, socket_path=path) is not None:
+            raise RuntimeError(f"A pypi_search daemon is already listening on {path}")
+        path.unlink()
+    server = _DaemonServer(str(path), _DaemonRequestHandler)
+    os.chmod(path, 0o600)
+    server.search_daemon = SearchDaemon()
+    return server
+
+
+def serve_daemon(socket_path: Optional[Path] = None):
+    """Run the search daemon in the foreground until interrupted."""
+    server = make_daemon_server(socket_path)
+    path = server.server_address
+    server.search_daemon.current()  # warm up before the first client
+    print(f"pypi_search daemon listening on {path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        Path(path).unlink(missing_ok=True)
+
+
+DAEMON_CONNECT_TIMEOUT = 0.5
+DAEMON_REQUEST_TIMEOUT = 120
+
+
+def daemon_request(
+    request: Dict[str, Any],
+    socket_path: Optional[Path] = None,
+    timeout: float = DAEMON_REQUEST_TIMEOUT,
+) -> Optional[Dict[str, Any]]:
+    """Send one request to a running `--serve` daemon.
+
+    Returns the response, or None when no daemon is listening or it
+    could not answer (the caller then works in-process).
+    """
+    path = Path(socket_path or DAEMON_SOCKET)
+    if not hasattr(socket, "AF_UNIX") or not path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+            sock.connect(str(path))
+            sock.settimeout(timeout)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as f:
+                response = json.loads(f.readline())
+    except (OSError, ValueError) as e:
+        logging.debug(f"Daemon unavailable: {e}")
+        return None
+    return response if response.get("ok") else None
+
+
 def get_version():
     try:
         version = importlib.metadata.version("pypi-search-caching")
@@ -869,7 +4000,9 @@ def main():
         sys.exit(1)
     parser = argparse.ArgumentParser(description="Search PyPI packages by regex")
     parser.add_argument("--version", "-V", action="version", version=get_version())
-    parser.add_argument("pattern", help="Regular expression to match package names")
+    parser.add_argument(
+        "pattern", nargs="?", help="Regular expression to match package names"
+    )
     parser.add_argument(
         "-i",
         "--ignore-case",
@@ -922,89 +4055,138 @@ def main():
         default=None,
         help="Regex pattern to filter by long description",
     )
+    parser.add_argument(
+        "--engine",
+        choices=["auto", "prefix", "trigram", "mmap", "scan"],
+        default="auto",
+        help="Name search engine: prefix (bisect the sorted names on the pattern's literal prefix), "
+        "trigram (verify only names containing the pattern's required trigrams), "
+        "mmap (one regex pass over the cached names buffer), scan (per-name loop); "
+        "each falls back to the next when it cannot run the pattern (auto = prefix)",
+    )
+    parser.add_argument(
+        "--normalized",
+        "-n",
+        action="store_true",
+        help="Match against PEP 503 normalized names (case, '-', '_' and '.' are equivalent); "
+        "a plain project name is an exact lookup",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Worker processes for full name scans and --search description matching; "
+        "0 (default) uses every CPU only when the pattern is expensive enough to pay "
+        "for process startup, 1 never",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run a search daemon on a local Unix socket that keeps the names and "
+        "indexes loaded; later invocations use it automatically",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Search in-process even if a --serve daemon is running",
+    )
+    parser.add_argument(
+        "--full-json",
+        action="store_true",
+        help="Cache the complete PyPI JSON of fetched projects instead of the "
+        "fields the details and description filter use plus release upload times",
+    )
+    parser.add_argument(
+        "--no-sync",
+        action="store_true",
+        help="Do not fsync the details cache on every commit; sync once at the end "
+        "of the run instead (a system crash can lose that run's cache writes)",
+    )
+    parser.add_argument(
+        "--recompress",
+        action="store_true",
+        help="Train a zstd dictionary on the details cache and recompress every "
+        "cached project with it in place (zlib/zstd without zstandard), then exit",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=FETCH_CONCURRENCY,
+        metavar="N",
+        help="Fetch the details (-d) or descriptions (--search) of up to N matches at once; "
+        f"results keep the match order (default: {FETCH_CONCURRENCY}, 1 fetches one at a time)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.0,
+        metavar="RPS",
+        help="Send at most RPS requests per second to PyPI (default: 0, no limit until "
+        "it answers 429 or 503; then every fetch slows down and honours Retry-After)",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=HTTP_BURST,
+        metavar="N",
+        help=f"Requests sent at once before --rate applies (default: {HTTP_BURST})",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print cache hits/misses/validations, bytes downloaded and decompressed "
+        "and per-stage latencies to stderr at the end of the run",
+    )
+    parser.add_argument(
+        "--stats-json",
+        default=None,
+        metavar="PATH",
+        help="Write the --stats report to PATH as JSON",
+    )
     parser.add_argument(
         "--test_mode",
         action="store_true",
         help="Use logger.info for progress instead of tqdm",
     )
     args = parser.parse_args()
+    CacheManager.full_json = args.full_json
+    CacheManager.sync = not args.no_sync
+    http_session(args.concurrency)  # a pooled connection per concurrent fetcher
+    rate_limiter.configure(args.rate, args.burst)
 
-    # Max number of descriptions fetched...
-    max_desc = args.max_desc
+    if args.serve:
+        serve_daemon()
+        return
+    if args.recompress:
+        run_recompress()
+        return
+    if args.pattern is None:
+        parser.error("the following arguments are required: pattern")
+
+    # Searches and details go through a --serve daemon when one is running
+    use_daemon = not args.no_daemon and not args.refresh_cache
 
-    # console = Console(force_terminal=True, theme=custom_theme)
-    no_color = args.no_color
     os.environ["LESS"] = "-R"
-    if no_color:
+    if args.no_color:
         console = Console(
-            no_color=no_color, force_terminal=False, theme=None, color_system=None
+            no_color=True, force_terminal=False, theme=None, color_system=None
         )
     else:
         console = Console(
             force_terminal=True, theme=custom_theme, color_system="truecolor"
         )
 
-    with console.pager(styles=True):
-
-        # Validate the incoming regexp
-        try:
-            flags = re.IGNORECASE if args.ignore_case else 0
-            # Strip '"' & '"' from args.pattern
-            args.pattern = args.pattern.strip('"').strip("'")
-            regex = re.compile(f"^{args.pattern}$", flags)
-        except re.error as e:
-            console.print(
-                f"[red][bold]\nThe Regular Expression Pattern is Invalid:[/bold][/red]\n"
-                + f"  [yellow]- {e}[/yellow]\n"
-            )
-            sys.exit(2)
-
-        all_packages = get_packages(args.refresh_cache)
-
-        if args.refresh_cache and args.pattern == "":
+    # Details and descriptions fetched below are stored in batched commits;
+    # the stats are reported once the pager and the last commit are done
+    with run_stats.reporting(args.stats, args.stats_json), console.pager(styles=True), CacheManager.batch():
+        matches = find_matches(args, console, use_daemon)
+        if matches is None:
             return
 
-        matches = [pkg for pkg in all_packages if regex.search(pkg)]
-
         if args.search:
-            try:
-                args.search = args.search.strip('"').strip("'")
-                search_flags = re.IGNORECASE if args.ignore_case else 0
-                search_regex = re.compile(args.search, search_flags)
-            except re.error as e:
-                console.print(f"[red]Invalid search regex: {e}[/red]")
-                sys.exit(2)
-
-            print("Filtering by description...", file=sys.stderr)
-            filtered_matches = []
-            if args.test_mode:
-                for i, pkg in enumerate(matches, 1):
-                    desc = get_package_long_description(
-                        pkg,
-                        verbose=args.verbose,
-                        test_mode=args.test_mode,
-                        validate_cache=args.validate_cache,
-                    )
-                    if search_regex.search(desc):
-                        filtered_matches.append(pkg)
-                    if args.verbose or args.test_mode:
-                        logging.info(f"Filtering description {i}/{len(matches)}: {pkg}")
-            else:
-                for pkg in tqdm(
-                    matches,
-                    desc="Filtering descriptions",
-                    disable=not sys.stdout.isatty(),
-                ):
-                    desc = get_package_long_description(
-                        pkg,
-                        verbose=args.verbose,
-                        test_mode=args.test_mode,
-                        validate_cache=args.validate_cache,
-                    )
-                    if search_regex.search(desc):
-                        filtered_matches.append(pkg)
-            matches = filtered_matches
-            print(f"After description filter: {len(matches)} matches", file=sys.stderr)
+            matches = filter_by_description(args, console, matches)
 
         if args.count_only:
             console.print(f"Found {len(matches):,} matching packages.")
@@ -1015,161 +4197,218 @@ def main():
             return
 
         console.print(f"[bold cyan]Found {len(matches):,} matches![/bold cyan]\n")
+        print_matches(args, console, matches, details_renderer(args, console, use_daemon))
 
-        if args.test_mode:
-            for i, pkg in enumerate(matches, 1):
-                if len(pkg) > 50:
-                    # Snip junk files...
-                    pkg = pkg[:50] + "..."
-                if i > max_desc and args.desc:
-                    console.print(f"[red] *** Max Descriptions Reached. *** [/red]")
-                    break
-                if args.desc:
-                    if args.verbose or args.test_mode:
-                        logging.info(f"Fetching details {i}/{len(matches)}: {pkg}")
-                    # String of i space padded to 4 digits
-                    console.rule(f"[cyan]{i}.[/] [bold]{pkg}[/bold]")
-                    details_md = fetch_project_details(
-                        pkg,
-                        console=console,
-                        include_desc=args.full_desc,
-                        verbose=args.verbose,
-                        test_mode=args.test_mode,
-                        validate_cache=args.validate_cache,
-                    )
-                    if details_md:
-                        # Filter out '.. image::' from details_md
-                        details_md = "\n".join(
-                            [
-                                line
-                                for line in details_md.split("\n")
-                                if not (
-                                    line.startswith(".. image::")
-                                    or line.startswith("   :height: ")
-                                    or line.startswith("   :width: ")
-                                    or line.startswith("   :alt: ")
-                                    or line.startswith(":raw-html-m2r:")
-                                    or line.startswith("   :target: ")
-                                    or line == "|"
-                                )
-                            ]
-                        )
-                        details_md = re.sub(
-                            r"\\?\s*:raw-html-m2r:\s*(`[^`]+`)\\?\s*",
-                            r"\1",
-                            details_md,
-                            flags=re.MULTILINE,
-                        )
-                        details_md = re.sub(
-                            r"`<br>`", r"\n\n", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(
-                            r"#\.", r"*", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(
-                            r"\\ ", r" ", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(
-                            r"(^\.\.\s+([^:]+\:)\s+(https?://[^\s]+))",
-                            r" - \2 `\3`",
-                            details_md,
-                            flags=re.MULTILINE,
-                        )
-                        details_md = re.sub(
-                            r"<#", r"<\#", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(r">_", r">", details_md, flags=re.MULTILINE)
-                        details_md = re.sub(
-                            r">`_", r">`", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(
-                            r"` (?=\W)", r"`", details_md, flags=re.MULTILINE
-                        )
-                        md = Markdown(details_md, code_theme=BrightBlueStyle)
-                        console.print(md)
-                else:
-                    console.print(f"[cyan]{i:>6}.[/] [bold]{pkg}[/bold]")
+
+def run_recompress():
+    """--recompress: recompress the details cache with a freshly trained dictionary."""
+    stats = recompress_details_cache(CacheManager.shared_env())
+    print(
+        f"Recompressed {stats['recompressed']:,} of {stats['entries']:,} cached projects: "
+        f"{stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes"
+    )
+
+
+def find_matches(args, console: Console, use_daemon: bool) -> Optional[List[str]]:
+    """The names matching args.pattern, from the daemon, the names buffer or the names list.
+
+    Returns None when there is nothing left to do: a --count-only answered
+    by the daemon, or a bare --refresh-cache.
+    """
+    # Validate the incoming regexp
+    try:
+        flags = re.IGNORECASE if args.ignore_case else 0
+        # Strip '"' & '"' from args.pattern
+        args.pattern = args.pattern.strip('"').strip("'")
+        re.compile(f"^{args.pattern}$", flags)  # the engines below compile their own
+    except re.error as e:
+        console.print(
+            f"[red][bold]\nThe Regular Expression Pattern is Invalid:[/bold][/red]\n"
+            + f"  [yellow]- {e}[/yellow]\n"
+        )
+        sys.exit(2)
+
+    if use_daemon:
+        request = {
+            "op": "search",
+            "pattern": args.pattern,
+            "ignore_case": args.ignore_case,
+            "normalized": args.normalized,
+            "engine": args.engine,
+            "jobs": args.jobs,
+        }
+        if args.count_only and not args.search:
+            reply = daemon_request(dict(request, op="count"))
+            if reply is not None:
+                console.print(f"Found {reply['count']:,} matching packages.")
+                return None
         else:
-            for i, pkg in tqdm(
-                enumerate(matches, 1),
-                total=len(matches),
-                desc="Processing matches",
-                disable=not sys.stdout.isatty(),
-            ):
-                if len(pkg) > 50:
-                    # Snip junk files...
-                    pkg = pkg[:50] + "..."
-                if i > max_desc and args.desc:
-                    console.print(f"[red] *** Max Descriptions Reached. *** [/red]")
-                    break
-                if args.desc:
-                    # String of i space padded to 4 digits
-                    console.rule(f"[cyan]{i}.[/] [bold]{pkg}[/bold]")
-                    details_md = fetch_project_details(
-                        pkg,
-                        console=console,
-                        include_desc=args.full_desc,
-                        verbose=args.verbose,
-                        test_mode=args.test_mode,
-                        validate_cache=args.validate_cache,
-                    )
-                    if details_md:
-                        # Filter out '.. image::' from details_md
-                        details_md = "\n".join(
-                            [
-                                line
-                                for line in details_md.split("\n")
-                                if not (
-                                    line.startswith(".. image::")
-                                    or line.startswith("   :height: ")
-                                    or line.startswith("   :width: ")
-                                    or line.startswith("   :alt: ")
-                                    or line.startswith(":raw-html-m2r:")
-                                    or line.startswith("   :target: ")
-                                    or line == "|"
-                                )
-                            ]
-                        )
-                        details_md = re.sub(
-                            r"\\?\s*:raw-html-m2r:\s*(`[^`]+`)\\?\s*",
-                            r"\1",
-                            details_md,
-                            flags=re.MULTILINE,
-                        )
-                        details_md = re.sub(
-                            r"`<br>`", r"\n\n", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(
-                            r"#\.", r"*", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(
-                            r"\\ ", r" ", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(
-                            r"(^\.\.\s+([^:]+\:)\s+(https?://[^\s]+))",
-                            r" - \2 `\3`",
-                            details_md,
-                            flags=re.MULTILINE,
-                        )
-                        details_md = re.sub(
-                            r"<#", r"<\#", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(r">_", r">", details_md, flags=re.MULTILINE)
-                        details_md = re.sub(
-                            r">`_", r">`", details_md, flags=re.MULTILINE
-                        )
-                        details_md = re.sub(
-                            r"` (?=\W)", r"`", details_md, flags=re.MULTILINE
-                        )
-                        md = Markdown(details_md, code_theme=BrightBlueStyle)
-                        console.print(md)
-                else:
-                    console.print(f"[cyan]{i:>6}.[/] [bold]{pkg}[/bold]")
+            reply = daemon_request(request)
+            if reply is not None:
+                return reply["matches"]
+    return search_local_names(args, flags)
+
+
+def search_local_names(args, flags: int) -> Optional[List[str]]:
+    """args.pattern run in-process on the names buffer, or on the names list when no engine can.
+
+    Returns None after a bare --refresh-cache.
+    """
+    if args.engine != "scan":
+        names_buf = get_names_buffer(args.refresh_cache)
+        if names_buf is not None:
+            if args.normalized:
+                matches = search_names_normalized(
+                    names_buf, open_names_index(names_buf), args.pattern, flags
+                )
+            else:
+                # Indexed lookups over the mmapped names, no list[str] of all names
+                matches = search_names(names_buf, args.pattern, flags, args.engine, args.jobs)
+            if matches is not None:
+                return matches
+
+    all_packages = get_packages(args.refresh_cache)
+
+    if args.refresh_cache and args.pattern == "":
+        return None
+
+    if args.normalized:
+        return scan_names_normalized(all_packages, args.pattern, flags)
+    return scan_names(all_packages, args.pattern, flags, args.jobs)
+
+
+def filter_by_description(args, console: Console, matches: List[str]) -> List[str]:
+    """--search: the `matches` whose long description args.search searches, in match order."""
+    try:
+        args.search = args.search.strip('"').strip("'")
+        search_flags = re.IGNORECASE if args.ignore_case else 0
+        search_regex = re.compile(args.search, search_flags)
+    except re.error as e:
+        console.print(f"[red]Invalid search regex: {e}[/red]")
+        sys.exit(2)
+
+    print("Filtering by description...", file=sys.stderr)
+    filtered_matches = []
+    # Descriptions are fetched --concurrency at a time and matched
+    # in match order, by --jobs processes when the regex is costly
+    hits = match_descriptions(
+        lambda pkg: get_package_long_description(
+            pkg,
+            verbose=args.verbose,
+            test_mode=args.test_mode,
+            validate_cache=args.validate_cache,
+        ),
+        matches,
+        search_regex,
+        args.concurrency if lmdb_settings()["lock"] else 1,
+        args.jobs,
+    )
+    if args.test_mode:
+        for i, pkg in enumerate(matches, 1):
+            if next(hits):
+                filtered_matches.append(pkg)
+            logging.info(f"Filtering description {i}/{len(matches)}: {pkg}")
+    else:
+        for pkg in tqdm(
+            matches,
+            desc="Filtering descriptions",
+            disable=not sys.stdout.isatty(),
+        ):
+            if next(hits):
+                filtered_matches.append(pkg)
+    hits.close()
+    print(f"After description filter: {len(filtered_matches)} matches", file=sys.stderr)
+    return filtered_matches
+
+
+def details_renderer(args, console: Console, use_daemon: bool):
+    """The function returning the displayed details Markdown of a project for -d."""
+
+    def project_details(pkg):
+        """The displayed details Markdown of `pkg`, from the rendered cache when it is current."""
+        if not args.validate_cache:
+            md = load_rendered_details(pkg, args.full_desc)
+            run_stats.count("rendered", "miss" if md is None else "hit")
+            if md is not None:
+                return md
+        md = project_details_markdown(pkg)
+        if md:
+            md = clean_details_markdown(md)
+            try:
+                store_rendered_details(pkg, args.full_desc, md)
+            except lmdb.Error as e:
+                logging.warning(f"Failed to cache rendered details of {pkg}: {e}")
+        return md
+
+    def project_details_markdown(pkg):
+        # The daemon caches with its own --full-json setting
+        if use_daemon and not args.full_json:
+            reply = daemon_request(
+                {
+                    "op": "details",
+                    "package": pkg,
+                    "include_desc": args.full_desc,
+                    "validate_cache": args.validate_cache,
+                }
+            )
+            if reply is not None:
+                return reply["md"]
+        return fetch_project_details(
+            pkg,
+            console=console,
+            include_desc=args.full_desc,
+            verbose=args.verbose,
+            test_mode=args.test_mode,
+            validate_cache=args.validate_cache,
+        )
+
+    return project_details
+
+
+def print_matches(args, console: Console, matches: List[str], project_details):
+    """Print the matches, with the details of the first args.max_desc of them under -d."""
+    # Max number of descriptions fetched...
+    max_desc = args.max_desc
+
+    # The details of the shown matches are fetched ahead, --concurrency at a time;
+    # without LMDB's lock nothing keeps those threads' transactions apart
+    shown = [pkg[:50] + "..." if len(pkg) > 50 else pkg for pkg in matches[:max_desc]]
+    concurrency = args.concurrency if lmdb_settings()["lock"] else 1
+    details = map_prefetched(project_details, shown if args.desc else [], concurrency)
+
+    numbered = enumerate(matches, 1)
+    if not args.test_mode:
+        numbered = tqdm(
+            numbered,
+            total=len(matches),
+            desc="Processing matches",
+            disable=not sys.stdout.isatty(),
+        )
+    for i, pkg in numbered:
+        if len(pkg) > 50:
+            # Snip junk files...
+            pkg = pkg[:50] + "..."
+        if i > max_desc and args.desc:
+            console.print(f"[red] *** Max Descriptions Reached. *** [/red]")
+            break
+        if args.desc:
+            if args.test_mode:
+                logging.info(f"Fetching details {i}/{len(matches)}: {pkg}")
+            # String of i space padded to 4 digits
+            console.rule(f"[cyan]{i}.[/] [bold]{pkg}[/bold]")
+            details_md = next(details)
+            if details_md:
+                md = Markdown(details_md, code_theme=BrightBlueStyle)
+                console.print(md)
+        else:
+            console.print(f"[cyan]{i:>6}.[/] [bold]{pkg}[/bold]")
+
+    details.close()
 
-        if len(matches) > max_desc and args.desc:
-            console.print(f"... and {len(matches) - max_desc} more matches")
+    if len(matches) > max_desc and args.desc:
+        console.print(f"... and {len(matches) - max_desc} more matches")
 
-        console.print(f"\n[bold]Total: {len(matches):,}[/bold]")
+    console.print(f"\n[bold]Total: {len(matches):,}[/bold]")
 
 
 if __name__ == "__main__":
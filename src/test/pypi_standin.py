@@ -0,0 +1,118 @@
+"""
+Local stand-in for PyPI's JSON API, for tests and benchmarks that need real HTTP.
+
+Serves /pypi/<name>/json from a thread per keep-alive connection, sleeping
+`latency` seconds before each answer to model the round trip to pypi.org
+and `handshake` seconds on each new connection to model the TCP and TLS
+set-up. Names not in `projects` get a 404; the first requests are
+answered with the statuses in `errors`, if any. With a `rate`, requests
+over `rate` per second (after a burst of `burst`) get a 429, with a
+`Retry-After: <retry_after>` header unless that is None. Point the code
+under test at it with
+
+    with PyPIStandIn(projects, latency=0.05) as server:
+        with patch.object(psc, "PYPI_JSON_URL", server.json_url):
+            ...
+
+`requests` counts the requests served, `throttled` the 429s among them,
+`connections` the connections accepted and `max_in_flight` the most
+requests answered at once.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def setup(self):
+        super().setup()
+        server = self.server.standin
+        with server.lock:
+            server.connections += 1
+        time.sleep(server.handshake)
+
+    def do_GET(self):
+        server = self.server.standin
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            error = server.errors.pop(0) if server.errors else None
+            if error is None and server.rate and not server.take_token():
+                error = 429
+                server.throttled += 1
+        try:
+            time.sleep(server.latency)
+            parts = self.path.strip("/").split("/")
+            doc = server.projects.get(parts[1]) if len(parts) == 3 and parts[0] == "pypi" else None
+            if error:
+                status, body = error, b'{"message": "Unavailable"}'
+            elif doc is None:
+                status, body = 404, b'{"message": "Not Found"}'
+            else:
+                status, body = 200, json.dumps(doc).encode()
+            self.send_response(status)
+            if status == 429 and server.retry_after is not None:
+                self.send_header("Retry-After", server.retry_after)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # concurrent clients connect at once
+
+
+class PyPIStandIn:
+    """A ThreadingHTTPServer on 127.0.0.1 answering for `projects` ({name: JSON document})."""
+
+    def __init__(self, projects: dict, latency: float = 0.0, handshake: float = 0.0, errors=(),
+                 rate: float = 0.0, burst: int = 1, retry_after: str = None):
+        self.projects = projects
+        self.latency = latency
+        self.handshake = handshake
+        self.errors = list(errors)
+        self.rate, self.burst, self.retry_after = rate, burst, retry_after
+        self.tokens, self.updated = float(burst), time.monotonic()
+        self.lock = threading.Lock()
+        self.requests = self.throttled = self.connections = self.in_flight = self.max_in_flight = 0
+        self._httpd = _Server(("127.0.0.1", 0), _Handler)
+        self._httpd.standin = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, args=(0.05,), daemon=True)
+
+    def take_token(self) -> bool:
+        """The server's own token bucket (called under `lock`)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    @property
+    def json_url(self) -> str:
+        """PYPI_JSON_URL for this server."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/pypi/{{package_name}}/json"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
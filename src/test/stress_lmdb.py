@@ -0,0 +1,183 @@
+"""
+Multi-process stress harness for the LMDB details cache.
+
+Starts N reader and M writer processes against one cache directory, then
+checks the environment's integrity and reports throughput. Writers store
+records in batches and prune the cache as they go; readers look records
+up at random and verify every hit decodes to what its writer stored.
+
+    python -m src.test.stress_lmdb --readers 8 --writers 4 --seconds 10
+
+The lock and reader table settings come from the usual config file and
+PYPI_SEARCH_LMDB_* variables (PYPI_SEARCH_LMDB_LOCK=0 shows what happens
+without locking). Used by TestConcurrentLMDBAccess and the benchmarks.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import src.pypi_search_caching.pypi_search_caching as psc
+
+EXPIRED_EVERY = 10  # every 10th record is stored already expired, for the prunes to delete
+PRUNE_EVERY = 200  # records between a writer's prune_lmdb_cache() calls
+
+
+def _record(wid: int, i: int) -> str:
+    words = " ".join(f"w{wid}r{i}" for _ in range(1 + i % 40))
+    return json.dumps({"info": {"name": f"w{wid}-{i}", "version": str(i), "description": words}})
+
+
+def _use_cache(cache_dir: str):
+    psc.LMDB_DIR = Path(cache_dir)
+    return psc.CacheManager.shared_env()
+
+
+def _writer(cache_dir: str, wid: int, seconds: float, results):
+    env = _use_cache(cache_dir)
+    deadline = time.monotonic() + seconds
+    i = 0
+    while time.monotonic() < deadline:
+        with psc.CacheManager.batch(size=16):
+            for _ in range(PRUNE_EVERY):
+                timestamp = 0.0 if i % EXPIRED_EVERY == 0 else time.time()
+                psc.store_package_data(env, f"w{wid}-{i}", {"timestamp": timestamp}, _record(wid, i))
+                i += 1
+        psc.prune_lmdb_cache(env)
+    results.put(("writer", wid, i))
+
+
+def _reader(cache_dir: str, rid: int, writers: int, seconds: float, results):
+    env = _use_cache(cache_dir)
+    rnd = random.Random(rid)
+    reads = hits = bad = 0
+    high = [PRUNE_EVERY] * writers  # record ids seen so far, per writer
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        wid = rnd.randrange(writers)
+        i = rnd.randrange(high[wid] * 2)
+        cached = psc.retrieve_package_data(env, f"w{wid}-{i}", parts=("json", "desc"))
+        reads += 1
+        if cached is not None:
+            hits += 1
+            high[wid] = max(high[wid], i)
+            expected = json.loads(_record(wid, i))["info"]
+            if json.loads(cached["json"])["info"] != expected or cached["desc"] != expected["description"]:
+                bad += 1
+    results.put(("reader", rid, (reads, hits, bad)))
+
+
+def _hold_read_txn(cache_dir: str, ready):
+    """Open a read transaction and wait to be killed, leaving a stale reader slot."""
+    env = _use_cache(cache_dir)
+    txn = env.begin()
+    txn.get(b"all_packages")
+    ready.set()
+    time.sleep(60)
+
+
+def _context():
+    # spawn, not fork: a forked child inherits the parent's open environment,
+    # which it can neither reopen nor close without breaking the parent's readers
+    return multiprocessing.get_context("spawn")
+
+
+def leave_stale_reader(cache_dir) -> int:
+    """Start a process that holds a read transaction, SIGKILL it and return its pid."""
+    ctx = _context()
+    ready = ctx.Event()
+    proc = ctx.Process(target=_hold_read_txn, args=(str(cache_dir), ready))
+    proc.start()
+    ready.wait(30)
+    os.kill(proc.pid, signal.SIGKILL)
+    proc.join()
+    return proc.pid
+
+
+def check_integrity(cache_dir, written) -> list:
+    """Problems found in the cache after a run; `written` is {writer id: records stored}."""
+    env = _use_cache(str(cache_dir))
+    try:
+        return _problems(env, written)
+    finally:
+        psc.CacheManager.close_shared_env()
+
+
+def _problems(env, written) -> list:
+    dbs = psc.CacheManager.details_dbs(env)
+    problems = []
+    with env.begin() as txn:
+        counts = {name: txn.stat(dbs[name])["entries"] for name in (psc.LMDB_META_DB, psc.LMDB_JSON_DB,
+                                                                    psc.LMDB_DESC_DB, psc.LMDB_EXPIRY_DB)}
+    if len(set(counts.values())) != 1:
+        problems.append(f"sub-database entry counts differ: {counts}")
+    for wid, n in written.items():
+        for i in range(n):
+            if i % EXPIRED_EVERY == 0:
+                continue
+            cached = psc.retrieve_package_data(env, f"w{wid}-{i}")
+            if cached is None or cached["json"] != _record(wid, i):
+                problems.append(f"w{wid}-{i} missing or corrupt")
+                if len(problems) > 20:
+                    return problems
+    return problems
+
+
+def run_stress(cache_dir, readers: int = 4, writers: int = 2, seconds: float = 5.0) -> dict:
+    """Run the readers and writers against `cache_dir` and check the result.
+
+    Returns {writes, reads, hits, bad_reads, problems, elapsed}; a healthy
+    run has no bad reads and no problems.
+    """
+    cache_dir = str(cache_dir)
+    _use_cache(cache_dir)  # create the environment and sub-databases up front
+    psc.CacheManager.close_shared_env()
+    ctx = _context()
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_writer, args=(cache_dir, w, seconds, results)) for w in range(writers)]
+    procs += [ctx.Process(target=_reader, args=(cache_dir, r, writers, seconds, results)) for r in range(readers)]
+    t0 = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    reports = [results.get(timeout=seconds + 120) for _ in procs]
+    for proc in procs:
+        proc.join()
+    elapsed = time.perf_counter() - t0
+    written = {wid: n for kind, wid, n in reports if kind == "writer"}
+    reads = [r for kind, _, r in reports if kind == "reader"]
+    return {
+        "writes": sum(written.values()),
+        "reads": sum(r[0] for r in reads),
+        "hits": sum(r[1] for r in reads),
+        "bad_reads": sum(r[2] for r in reads),
+        "problems": check_integrity(cache_dir, written),
+        "elapsed": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress the LMDB details cache from several processes")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--dir", help="Cache directory (default: a new temporary one)")
+    args = parser.parse_args()
+    cache_dir = args.dir or tempfile.mkdtemp(prefix="pypi_search_stress_")
+    stats = run_stress(cache_dir, args.readers, args.writers, args.seconds)
+    print(f"{args.readers} readers, {args.writers} writers, {stats['elapsed']:.1f} s, {cache_dir}")
+    print(f"  writes {stats['writes']:,} ({stats['writes'] / stats['elapsed']:,.0f}/s)")
+    print(f"  reads  {stats['reads']:,} ({stats['reads'] / stats['elapsed']:,.0f}/s), "
+          f"{stats['hits']:,} hits, {stats['bad_reads']} bad")
+    for problem in stats["problems"]:
+        print(f"  PROBLEM: {problem}")
+    sys.exit(1 if stats["bad_reads"] or stats["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,909 @@
+"""
+Performance comparisons for pypi_search_caching.
+
+Deselected by default (see pyproject.toml addopts). Run with:
+
+    pytest src/test/test_benchmarks.py -m benchmark -s
+
+Corpus size defaults to 200k synthetic names; set PYPI_SEARCH_BENCH_NAMES
+(e.g. to 750000) to match the real index size, or PYPI_SEARCH_BENCH_CORPUS=pypi
+to download the live /simple index and benchmark the real names (and
+PYPI_SEARCH_BENCH_DOCS project JSON documents, default 2000, for the codecs).
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+import json
+import re
+import base64
+import zlib
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.pypi_search_caching import (
+    fetch_all_package_names,
+    parse_simple_index_json,
+    CacheManager,
+)
+from src.pypi_search_caching.pypi_search_caching import (
+    encode_names_record,
+    decode_names_record,
+    CODEC_ZLIB,
+    CODEC_ZSTD,
+    zstandard,
+    get_names_buffer,
+    search_names_buffer,
+    open_names_index,
+    search_names_prefix,
+    open_trigram_index,
+    search_names_trigram,
+    trigram_candidates,
+    write_trigram_index,
+    search_names_parallel,
+    plan_scan_jobs,
+    available_cpus,
+)
+
+pytestmark = pytest.mark.benchmark
+
+BENCH_NAMES = int(os.environ.get("PYPI_SEARCH_BENCH_NAMES", "200000"))
+BENCH_CORPUS = os.environ.get("PYPI_SEARCH_BENCH_CORPUS", "synthetic")
+BENCH_DOCS = int(os.environ.get("PYPI_SEARCH_BENCH_DOCS", "2000"))
+LMDB_SETTING_VARS = ["PYPI_SEARCH_LMDB_MAP_SIZE", "PYPI_SEARCH_LMDB_MAX_MAP_SIZE", "PYPI_SEARCH_LMDB_WRITEMAP",
+                     "PYPI_SEARCH_LMDB_READAHEAD", "PYPI_SEARCH_LMDB_MAX_READERS", "PYPI_SEARCH_LMDB_LOCK"]
+
+
+@pytest.fixture(autouse=True)
+def mock_home(tmp_path, monkeypatch):
+    def mock_home(cls):
+        return tmp_path
+    monkeypatch.setattr('pathlib.Path.home', classmethod(mock_home))
+    cache_dir = tmp_path / ".cache" / "pypi_search"
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.CACHE_DIR', cache_dir)
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.CACHE_FILE', cache_dir / "pypi_search.cache")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.NAMES_BUFFER_FILE', cache_dir / "pypi_names.buf")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.NAMES_INDEX_FILE', cache_dir / "pypi_names.idx")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.TRIGRAM_INDEX_FILE', cache_dir / "pypi_names.tri")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.NAMES_NORM_FILE', cache_dir / "pypi_names.norm")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.DAEMON_SOCKET', cache_dir / "pypi_search.sock")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', cache_dir / "lmdb")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.CONFIG_FILE',
+                        tmp_path / ".config" / "pypi_search" / "config.toml")
+    for var in [v for v in os.environ if v.startswith("PYPI_SEARCH_LMDB_")]:
+        monkeypatch.delenv(var)
+    # The shared LMDB environment belongs to whichever LMDB_DIR opened it
+    CacheManager.close_shared_env()
+    yield
+    CacheManager.close_shared_env()
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """Deterministic, PyPI-shaped package names (or the live index, see module docstring)."""
+    if BENCH_CORPUS == "pypi":
+        return sorted(fetch_all_package_names(stream=True))
+    rnd = random.Random(42)
+    prefixes = ["aio", "django-", "flask-", "py", "torch", "pytest-", "types-"]
+    alphabet = string.ascii_lowercase + string.digits
+    names = set()
+    while len(names) < BENCH_NAMES:
+        stem = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(3, 14)))
+        sep = rnd.choice(["", "-", "_", "."])
+        tail = rnd.choice(["", "plugin", "utils", "client", "sdk"])
+        prefix = rnd.choice(prefixes) if rnd.random() < 0.1 else ""
+        names.add(f"{prefix}{stem}{sep if tail else ''}{tail}")
+    return sorted(names)
+
+
+def measure(fn, *args, **kwargs):
+    """Return (result, wall seconds, peak traced bytes) for one call."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def report(capsys, title, rows):
+    with capsys.disabled():
+        size = "live /simple index" if BENCH_CORPUS == "pypi" else f"{BENCH_NAMES:,} names"
+        print(f"\n== {title} ({size}) ==")
+        for row in rows:
+            print("  " + row)
+
+
+def best_of(fn, repeat=5):
+    """Best wall time over `repeat` calls (less noisy than a single run)."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def simple_index_html(names):
+    body = "\n".join(f'    <a href="/simple/{n}/">{n}</a><br/>' for n in names)
+    return f"<!DOCTYPE html>\n<html>\n  <body>\n{body}\n  </body>\n</html>\n"
+
+
+class TestSimpleIndexParsing:
+    def test_streaming_vs_beautifulsoup(self, corpus, capsys):
+        html = simple_index_html(corpus)
+        payload = html.encode()
+
+        def bs4_path():
+            resp = MagicMock(text=html, status_code=200, raise_for_status=lambda: None)
+            with patch('requests.Session.get', return_value=resp):
+                return fetch_all_package_names()
+
+        def stream_path():
+            resp = MagicMock(status_code=200, raise_for_status=lambda: None)
+            resp.iter_content.side_effect = lambda chunk_size: (
+                payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)
+            )
+            with patch('requests.Session.get', return_value=resp):
+                return list(fetch_all_package_names(stream=True))
+
+        bs4_names, bs4_t, bs4_peak = measure(bs4_path)
+        stream_names, stream_t, stream_peak = measure(stream_path)
+        assert stream_names == bs4_names == corpus
+
+        report(capsys, "/simple index parse", [
+            f"beautifulsoup: {bs4_t:8.3f}s  peak {bs4_peak / 2**20:8.1f} MiB",
+            f"streaming:     {stream_t:8.3f}s  peak {stream_peak / 2**20:8.1f} MiB",
+            f"speedup {bs4_t / stream_t:5.1f}x, peak memory {bs4_peak / stream_peak:5.1f}x lower",
+        ])
+        assert stream_t < bs4_t
+
+    def test_json_index_vs_beautifulsoup_cpu(self, corpus, capsys):
+        html = simple_index_html(corpus)
+        payload = json.dumps({
+            "meta": {"api-version": "1.1", "_last-serial": len(corpus)},
+            "projects": [{"name": n, "_last-serial": i} for i, n in enumerate(corpus)],
+        }).encode()
+
+        def bs4_path():
+            resp = MagicMock(text=html, status_code=200, raise_for_status=lambda: None)
+            with patch('requests.Session.get', return_value=resp):
+                return fetch_all_package_names()
+
+        t0 = time.process_time()
+        bs4_names = bs4_path()
+        bs4_cpu = time.process_time() - t0
+        t0 = time.process_time()
+        index = parse_simple_index_json(payload)
+        json_cpu = time.process_time() - t0
+        assert index["names"] == bs4_names == corpus
+        assert len(index["serials"]) == len(corpus)
+
+        report(capsys, "/simple index CPU: PEP 691 JSON vs HTML scrape", [
+            f"beautifulsoup: {bs4_cpu:8.3f}s cpu  ({len(html) / 2**20:6.1f} MiB html)",
+            f"json:          {json_cpu:8.3f}s cpu  ({len(payload) / 2**20:6.1f} MiB json, serials included)",
+            f"speedup {bs4_cpu / json_cpu:5.1f}x",
+        ])
+        assert json_cpu < bs4_cpu
+
+
+class TestNamesRecord:
+    def test_binary_vs_legacy_record(self, corpus, capsys):
+        serials = {n: i for i, n in enumerate(corpus)}
+        legacy = json.dumps({
+            "data": base64.b64encode(zlib.compress(json.dumps(corpus).encode())).decode(),
+            "timestamp": time.time(),
+        }).encode()
+
+        def legacy_load():
+            entry = json.loads(legacy.decode("utf-8"))
+            return json.loads(zlib.decompress(base64.b64decode(entry["data"])).decode("utf-8"))
+
+        rows = []
+        legacy_t = best_of(legacy_load)
+        rows.append(f"legacy json+zlib+b64+json: {len(legacy) / 2**20:7.2f} MiB  load {legacy_t * 1000:8.1f} ms")
+        codecs = [("zlib", CODEC_ZLIB)] + ([("zstd", CODEC_ZSTD)] if zstandard else [])
+        for label, codec in codecs:
+            value = encode_names_record(corpus, time.time(), codec=codec)
+            with_serials = encode_names_record(corpus, time.time(), serials=serials, codec=codec)
+            assert decode_names_record(value)["names"] == legacy_load()
+            header_t = best_of(lambda: decode_names_record(value, with_names=False))
+            binary_t = best_of(lambda: decode_names_record(value))
+            rows.append(
+                f"binary {label:4}:                {len(value) / 2**20:7.2f} MiB  load {binary_t * 1000:8.1f} ms"
+                f"  (freshness check {header_t * 1e6:6.1f} us, +serials {len(with_serials) / 2**20:5.2f} MiB)"
+            )
+            assert len(value) < len(legacy)
+        report(capsys, "all_packages record size / load time", rows)
+
+
+# Common query shapes: anchored prefix, unanchored substring, alternation, -i
+SEARCH_PATTERNS = [
+    ("aio.*", 0),
+    (".*django.*", 0),
+    ("flask|django", 0),
+    (".*pytest.*plugin.*", 0),
+    ("torch.*", re.IGNORECASE),
+]
+
+
+class TestNameSearchEngines:
+    def test_mmap_buffer_vs_list_scan(self, corpus, capsys):
+        CacheManager().save(corpus)
+        buf = get_names_buffer()
+        assert buf is not None
+
+        rows = []
+        for pattern, flags in SEARCH_PATTERNS:
+            regex = re.compile(f"^{pattern}$", flags)
+            expected = [pkg for pkg in corpus if regex.search(pkg)]
+            assert search_names_buffer(buf, pattern, flags) == expected
+            scan_t = best_of(lambda: [pkg for pkg in corpus if regex.search(pkg)])
+            mmap_t = best_of(lambda: search_names_buffer(buf, pattern, flags))
+            rows.append(
+                f"{pattern!r:24} -i={bool(flags):d} {len(expected):7,} hits  "
+                f"scan {scan_t * 1000:7.1f} ms  mmap {mmap_t * 1000:7.1f} ms  ({scan_t / mmap_t:4.1f}x)"
+            )
+        report(capsys, "name search: mmap buffer vs per-name scan", rows)
+
+    def test_prefix_bisect_vs_mmap_scan(self, corpus, capsys):
+        CacheManager().save(corpus)
+        buf = get_names_buffer()
+        index = open_names_index(buf)
+        assert index is not None
+
+        rows = []
+        for pattern, flags in SEARCH_PATTERNS:
+            regex = re.compile(f"^{pattern}$", flags)
+            expected = [pkg for pkg in corpus if regex.search(pkg)]
+            result = search_names_prefix(buf, index, pattern, flags)
+            if result is None:
+                rows.append(f"{pattern!r:24} -i={bool(flags):d} no literal prefix -> full scan")
+                continue
+            assert result == expected
+            mmap_t = best_of(lambda: search_names_buffer(buf, pattern, flags))
+            prefix_t = best_of(lambda: search_names_prefix(buf, index, pattern, flags))
+            rows.append(
+                f"{pattern!r:24} -i={bool(flags):d} {len(expected):7,} hits  "
+                f"mmap {mmap_t * 1000:7.2f} ms  prefix {prefix_t * 1000:7.2f} ms  ({mmap_t / prefix_t:6.1f}x)"
+            )
+        report(capsys, "name search: sorted-prefix bisect vs mmap scan", rows)
+
+
+# Pattern classes with no literal prefix, where only the trigram index helps
+TRIGRAM_PATTERNS = [
+    ("substring", ".*django.*", 0),
+    ("substring -i", ".*Django.*", re.IGNORECASE),
+    ("two literals", ".*pytest.*plugin.*", 0),
+    ("suffix", ".*-sdk", 0),
+    ("alternation", ".*(flask|django)-utils", 0),
+    ("short literal", ".*py.*", 0),
+]
+
+
+class TestTrigramIndex:
+    def test_trigram_vs_mmap_scan(self, corpus, capsys):
+        t0 = time.perf_counter()
+        write_trigram_index(corpus, 0, 0)
+        build_t = time.perf_counter() - t0
+        CacheManager().save(corpus)
+        buf = get_names_buffer()
+        index = open_names_index(buf)
+        trigrams = open_trigram_index(buf)
+        assert trigrams is not None
+
+        keys, _, postings, _ = trigrams
+        rows = [
+            f"build {build_t:6.2f}s  "
+            f"{len(keys):,} trigrams, {len(postings) * 4 / 2**20:6.1f} MiB of postings"
+        ]
+        for label, pattern, flags in TRIGRAM_PATTERNS:
+            regex = re.compile(f"^{pattern}$", flags)
+            expected = [pkg for pkg in corpus if regex.search(pkg)]
+            candidates = trigram_candidates(trigrams, pattern, flags)
+            mmap_t = best_of(lambda: search_names_buffer(buf, pattern, flags))
+            if candidates is None:
+                rows.append(f"{label:14} {pattern!r:26} no trigram -> mmap {mmap_t * 1000:7.1f} ms")
+                continue
+            result = search_names_trigram(buf, index, trigrams, pattern, flags)
+            if result is None:
+                rows.append(
+                    f"{label:14} {pattern!r:26} {len(candidates):8,} candidates: too many -> mmap"
+                )
+                continue
+            assert result == expected
+            trigram_t = best_of(lambda: search_names_trigram(buf, index, trigrams, pattern, flags))
+            rows.append(
+                f"{label:14} {pattern!r:26} {len(expected):7,} hits / {len(candidates):8,} candidates "
+                f"({100 * (1 - len(candidates) / len(corpus)):5.1f}% pruned)  "
+                f"mmap {mmap_t * 1000:7.1f} ms  trigram {trigram_t * 1000:7.1f} ms  ({mmap_t / trigram_t:5.1f}x)"
+            )
+        report(capsys, "name search: trigram index vs mmap scan", rows)
+
+
+# Patterns the indexed engines cannot help with and that are slow per name
+EXPENSIVE_PATTERNS = [
+    ("backreference", r"(.)(.).*\2\1.*", 0),
+    ("alternation", r".*(utils|client|sdk|plugin|core|api|tools|cli|lib|kit)[._-]?[0-9a-f]{2,}.*", 0),
+    ("unicode -i", r".*(\u00e9|\u00df|pl\u00fcgin|client).*", re.IGNORECASE),
+]
+
+
+class TestParallelScan:
+    def test_scaling_with_jobs(self, corpus, capsys):
+        buf = ("\n".join(corpus) + "\n").encode()
+        cpus = available_cpus()
+        job_counts = sorted({1, 2, 4, cpus} | ({8} if cpus >= 8 else set()))
+        startup = best_of(lambda: search_names_parallel(b"a\n", "a", 0, 4), repeat=3)
+
+        rows = [f"{cpus} CPUs available; 4-worker pool startup {startup * 1000:6.1f} ms"]
+        for label, pattern, flags in EXPENSIVE_PATTERNS:
+            regex = re.compile(f"^{pattern}$", flags)
+            expected = [pkg for pkg in corpus if regex.search(pkg)]
+            serial_t = best_of(lambda: [pkg for pkg in corpus if regex.search(pkg)], repeat=3)
+            auto = plan_scan_jobs(corpus[:: max(1, len(corpus) // 256)], len(corpus), regex)
+            cells = []
+            for jobs in job_counts:
+                assert search_names_parallel(buf, pattern, flags, jobs) == expected
+                t = best_of(lambda: search_names_parallel(buf, pattern, flags, jobs), repeat=3)
+                cells.append(f"j{jobs} {t * 1000:6.0f} ms ({serial_t / t:4.1f}x)")
+            rows.append(
+                f"{label:14} in-process {serial_t * 1000:6.0f} ms  " + "  ".join(cells) + f"  auto -> {auto} job(s)"
+            )
+        report(capsys, "parallel per-name scan: shared-memory shards vs in-process", rows)
+
+
+DETAILS_ENTRIES = 2000  # cached project details in the LMDB store
+
+
+class TestLMDBDetailsCache:
+    def test_shared_env_vs_open_per_lookup(self, capsys):
+        from src.pypi_search_caching.pypi_search_caching import (
+            init_lmdb_env,
+            store_package_data,
+            retrieve_package_data,
+            fetch_project_details,
+        )
+        data = json.dumps({"info": {"version": "1.0", "summary": "x" * 200, "description": "y" * 4000}})
+        names = [f"pkg-{i}" for i in range(DETAILS_ENTRIES)]
+        env = CacheManager.shared_env()
+        with CacheManager.batch():
+            for name in names:
+                store_package_data(env, name, {"timestamp": time.time()}, data)
+        lookups = names[:: max(1, DETAILS_ENTRIES // 500)]
+        CacheManager.close_shared_env()
+
+        def open_per_lookup():
+            # What every details/description lookup used to do
+            for name in lookups:
+                env = init_lmdb_env()
+                assert retrieve_package_data(env, name)
+                env.close()
+
+        def shared_env():
+            env = CacheManager.shared_env()
+            for name in lookups:
+                assert retrieve_package_data(env, name)
+
+        before = best_of(open_per_lookup, repeat=3) / len(lookups)
+        after = best_of(shared_env, repeat=3) / len(lookups)
+        details = best_of(lambda: [fetch_project_details(n) for n in lookups], repeat=3) / len(lookups)
+        report(capsys, f"warm details lookup, {DETAILS_ENTRIES:,} cached projects", [
+            f"open/retrieve/close per lookup {before * 1e6:8.1f} us",
+            f"shared environment             {after * 1e6:8.1f} us  ({before / after:5.1f}x)",
+            f"fetch_project_details (hit)    {details * 1e6:8.1f} us",
+        ])
+
+    def test_write_batching_commits_per_second(self, capsys, tmp_path, monkeypatch):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        data = json.dumps({"info": {"version": "1.0", "summary": "x" * 200, "description": "y" * 4000}})
+        n = 2000
+        rows = [f"{n:,} store_package_data calls, LMDB on {tmp_path}"]
+        base = None
+        for label, batch, sync in [("commit per record, sync", False, True),
+                                   ("commit per record, --no-sync", False, False),
+                                   ("batch(), sync", True, True),
+                                   ("batch(), --no-sync", True, False)]:
+            monkeypatch.setattr(CacheManager, "sync", sync)
+            monkeypatch.setattr(psc, "LMDB_DIR", tmp_path / label.replace(" ", "_"))
+            env = CacheManager.shared_env()
+            t0 = time.perf_counter()
+            with CacheManager.batch() if batch else contextlib.nullcontext():
+                for i in range(n):
+                    psc.store_package_data(env, f"pkg-{i}", {"timestamp": time.time()}, data)
+            if not sync and not batch:
+                env.sync(True)  # what the end of the run does
+            elapsed = time.perf_counter() - t0
+            commits = -(-n // psc.LMDB_WRITE_BATCH_SIZE) if batch else n
+            base = base or elapsed
+            rows.append(f"{label:30} {n / elapsed:8,.0f} records/s  {commits / elapsed:8,.0f} commits/s "
+                        f"({commits:,} commits)  {base / elapsed:5.1f}x")
+            CacheManager.close_shared_env()
+        report(capsys, "details cache: write batching and sync", rows)
+
+    def test_environment_settings(self, capsys, tmp_path, monkeypatch):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        rnd = random.Random(3)
+        words = ["async", "http", "client", "server", "fast", "plugin", "data", "the", "a", "with"]
+        docs = [json.dumps({"info": {"version": "1.0", "summary": "A package",
+                                     "description": " ".join(rnd.choice(words) for _ in range(rnd.randint(200, 1500)))}})
+                for _ in range(50)]
+        n = 20000
+        rows = [f"{n:,} stores (batch()) then {n:,} description reads; LMDB on {tmp_path}"]
+        for label, env_vars in [("defaults (64 MiB, grows)", {}),
+                                ("map_size 10G (preallocated)", {"MAP_SIZE": "10G"}),
+                                ("map_size 1M (many grows)", {"MAP_SIZE": "1M"}),
+                                ("writemap", {"WRITEMAP": "1"}),
+                                ("readahead", {"READAHEAD": "1"}),
+                                ("max_readers 1024", {"MAX_READERS": "1024"})]:
+            for var in LMDB_SETTING_VARS:
+                monkeypatch.delenv(var, raising=False)
+            for name, value in env_vars.items():
+                monkeypatch.setenv(f"PYPI_SEARCH_LMDB_{name}", value)
+            monkeypatch.setattr(psc, "LMDB_DIR", tmp_path / label.split()[0] / env_vars.get("MAP_SIZE", ""))
+            env = CacheManager.shared_env()
+            with patch.object(psc, "grow_map_size", wraps=psc.grow_map_size) as grow:
+                t0 = time.perf_counter()
+                with CacheManager.batch():
+                    for i in range(n):
+                        psc.store_package_data(env, f"pkg-{i}", {"timestamp": time.time()}, docs[i % len(docs)])
+                store = time.perf_counter() - t0
+            names = [f"pkg-{rnd.randrange(n)}" for _ in range(n)]
+            read = best_of(lambda: [psc.retrieve_package_data(env, name, parts=("desc",)) for name in names], repeat=3)
+            rows.append(f"{label:28} {n / store:8,.0f} stores/s  {n / read:9,.0f} reads/s  "
+                        f"{grow.call_count:2} grows, map {env.info()['map_size'] / 2**20:8,.0f} MiB")
+            CacheManager.close_shared_env()
+        report(capsys, "details cache: LMDB environment settings", rows)
+
+    def test_concurrent_processes(self, capsys, tmp_path):
+        from src.test.stress_lmdb import run_stress
+        seconds = 3.0
+        rows = [f"writer and reader processes for {seconds:.0f} s each (see src/test/stress_lmdb.py), "
+                f"{os.cpu_count()} CPUs; LMDB on {tmp_path}"]
+        for readers, writers in [(0, 1), (1, 1), (4, 1), (4, 4), (8, 2)]:
+            stats = run_stress(tmp_path / f"{readers}r{writers}w", readers, writers, seconds)
+            rows.append(f"{readers} readers {writers} writers  {stats['writes'] / seconds:8,.0f} writes/s  "
+                        f"{stats['reads'] / seconds:9,.0f} reads/s  {stats['bad_reads']} bad reads, "
+                        f"{len(stats['problems'])} integrity problems")
+            assert not stats["bad_reads"] and not stats["problems"]
+        report(capsys, "details cache: concurrent processes", rows)
+
+    def test_indexed_prune_vs_full_scan(self, capsys):
+        from src.pypi_search_caching.pypi_search_caching import (
+            store_package_data,
+            retrieve_package_data,
+            fetch_project_details,
+            prune_lmdb_cache,
+            decode_details_meta,
+            LMDB_CACHE_MAX_AGE_SECONDS,
+            LMDB_META_DB,
+        )
+        entries = 100_000
+        now = time.time()
+        data = json.dumps({"info": {"version": "1.0", "summary": "x" * 200}})
+        env = CacheManager.shared_env()
+        with CacheManager.batch(size=5000):
+            for i in range(entries):
+                # 1% expired
+                ts = now - LMDB_CACHE_MAX_AGE_SECONDS - 60 if i % 100 == 0 else now - i
+                store_package_data(env, f"pkg-{i}", {"timestamp": ts}, data)
+
+        def full_scan_prune():
+            # The pre-index prune: decode every entry's headers in a write transaction
+            expired = []
+            with env.begin(write=True) as txn:
+                for key, value in txn.cursor(db=CacheManager.details_dbs(env)[LMDB_META_DB]):
+                    headers = decode_details_meta(value)["headers"]
+                    if now - headers["timestamp"] > LMDB_CACHE_MAX_AGE_SECONDS:
+                        expired.append(key)
+            return expired
+
+        assert len(full_scan_prune()) == entries // 100
+        pruned, index_prune, _ = measure(prune_lmdb_cache, env)
+        assert pruned == entries // 100
+        lookups = [f"pkg-{i}" for i in range(1, entries, entries // 200) if i % 100]
+        scan = best_of(full_scan_prune, repeat=3)
+        lookup = best_of(lambda: [retrieve_package_data(env, n) for n in lookups], repeat=3) / len(lookups)
+        details = best_of(lambda: [fetch_project_details(n) for n in lookups], repeat=3) / len(lookups)
+        report(capsys, f"details-cache pruning, {entries:,} cached projects (1% expired)", [
+            f"full-scan prune (was run per lookup) {scan * 1000:8.1f} ms",
+            f"indexed prune of the expired 1%      {index_prune * 1000:8.1f} ms (once per process)",
+            f"warm lookup before: scan + retrieve  {(scan + lookup) * 1e6:8.0f} us",
+            f"fetch_project_details hit now        {details * 1e6:8.0f} us",
+        ])
+
+
+def pypi_json(rnd, releases=60):
+    """A PyPI JSON API document of typical shape: long description, many release files."""
+    words = ["async", "http", "client", "server", "fast", "plugin", "data", "the", "a", "with"]
+    desc = " ".join(rnd.choice(words) for _ in range(1500))
+
+    def files(v):
+        return [{"filename": f"pkg-{v}-py3-none-any.whl", "digests": {"sha256": "%064x" % rnd.getrandbits(256)},
+                 "size": rnd.randint(10**4, 10**6), "upload_time": "2024-01-01T00:00:00",
+                 "url": f"https://files.pythonhosted.org/packages/{v}/pkg-{v}.whl"} for _ in range(3)]
+
+    versions = [f"1.{i}.0" for i in range(releases)]
+    return {
+        "info": {"name": "pkg", "version": versions[-1], "summary": "A package", "description": desc,
+                 "requires_python": ">=3.8", "home_page": "https://example.org",
+                 "classifiers": [f"Topic :: {w}" for w in words], "project_urls": {"Source": "https://x"}},
+        "releases": {v: files(v) for v in versions},
+        "urls": files(versions[-1]),
+    }
+
+
+class TestDetailsLayout:
+    def test_bytes_read_per_lookup(self, capsys):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        rnd = random.Random(7)
+        data = json.dumps(pypi_json(rnd))
+        md = "## pkg\n\n" + json.loads(data)["info"]["description"]
+        env = CacheManager.shared_env()
+        psc.store_package_data(env, "pkg", {"timestamp": time.time(), "etag": '"x"'}, data, md)
+        with env.begin() as txn:
+            dbs = CacheManager.details_dbs(env)
+            stored = {name: len(txn.get(b"pkg", db=dbs[db]) or b"")
+                      for name, db in [("meta", psc.LMDB_META_DB), ("json", psc.LMDB_JSON_DB),
+                                       ("md", psc.LMDB_MD_DB), ("desc", psc.LMDB_DESC_DB)]}
+        import msgpack
+        import struct
+        headers = msgpack.packb({"timestamp": time.time(), "etag": '"x"', "last_modified": None})
+        blobs = [headers, zlib.compress(data.encode()), zlib.compress(md.encode())]
+        legacy_value = b"".join(struct.pack(">I", len(b)) + b for b in blobs)
+        legacy = len(legacy_value)
+
+        def legacy_description():
+            # Old description filter: the whole value, both blobs inflated, JSON parsed
+            entry = psc.decode_legacy_details(legacy_value)
+            return json.loads(entry["json"])["info"]["description"]
+
+        def read(fn):
+            sizes = []
+            real = CacheManager.get.__func__
+
+            def counting(cls, *args, **kwargs):
+                value = real(cls, *args, **kwargs)
+                sizes.append(len(value or b""))
+                return value
+
+            with patch.object(CacheManager, 'get', classmethod(counting)):
+                fn()
+            return sum(sizes)
+
+        paths = [
+            ("freshness check", lambda: psc.retrieve_package_data(env, "pkg", parts=())),
+            ("description filter", lambda: psc.get_package_long_description("pkg")),
+            ("details (no -f)", lambda: psc.fetch_project_details("pkg")),
+            ("details -f", lambda: psc.fetch_project_details("pkg", include_desc=True)),
+        ]
+        rows = [f"stored: meta {stored['meta']} B, json {stored['json']:,} B, md {stored['md']:,} B, "
+                f"desc {stored['desc']:,} B; legacy single value {legacy:,} B",
+                f"legacy description decode {best_of(legacy_description) * 1e6:7.1f} us"]
+        for label, fn in paths:
+            t = best_of(lambda: [fn() for _ in range(100)], repeat=3) / 100
+            rows.append(f"{label:20} reads {read(fn):7,} B (legacy {legacy:,} B)  {t * 1e6:7.1f} us")
+        report(capsys, "details cache: bytes read per lookup by path", rows)
+
+    def test_projection_vs_full_document(self, capsys):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        rnd = random.Random(7)
+        env = CacheManager.shared_env()
+        rows = []
+        for releases in (10, 60, 400):
+            data = pypi_json(rnd, releases=releases)
+            for label, full in (("full", True), ("projection", False)):
+                with patch.object(CacheManager, "full_json", full):
+                    name = f"pkg-{releases}-{label}"
+                    store = best_of(lambda: psc.store_package_data(
+                        env, name, {"timestamp": time.time()}, psc.details_json(data)), repeat=3)
+                stored = len(CacheManager.get(psc.normalize_name(name).encode(), db=psc.LMDB_JSON_DB))
+                raw = len(psc.retrieve_package_data(env, name)["json"])
+                hit = best_of(lambda: [psc.fetch_project_details(name) for _ in range(20)], repeat=3) / 20
+                rows.append(f"{releases:3} releases {label:10}  json {raw:9,} B raw {stored:8,} B stored  "
+                            f"store {store * 1e3:6.2f} ms  details hit {hit * 1e6:7.1f} us")
+        report(capsys, "details cache: slim JSON projection vs full document", rows)
+
+
+@pytest.fixture(scope="module")
+def details_docs(corpus):
+    """BENCH_DOCS PyPI JSON documents: fetched live with PYPI_SEARCH_BENCH_CORPUS=pypi, else synthetic."""
+    rnd = random.Random(11)
+    if BENCH_CORPUS == "pypi":
+        import concurrent.futures
+        import requests
+
+        def fetch(name):
+            try:
+                resp = requests.get(f"https://pypi.org/pypi/{name}/json", timeout=10)
+                return resp.text if resp.status_code == 200 else None
+            except requests.RequestException:
+                return None
+
+        with concurrent.futures.ThreadPoolExecutor(16) as pool:
+            docs = list(pool.map(fetch, rnd.sample(corpus, BENCH_DOCS)))
+        return [d for d in docs if d]
+    docs = []
+    for i in range(BENCH_DOCS):
+        doc = pypi_json(rnd, releases=rnd.randint(1, 40))
+        doc["info"]["name"] = corpus[i]
+        doc["info"]["description"] = doc["info"]["description"][: rnd.randint(200, 8000)]
+        docs.append(json.dumps(doc))
+    return docs
+
+
+class TestDetailsCodecs:
+    def test_dictionary_vs_zlib(self, details_docs, capsys):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        if zstandard is None:
+            pytest.skip("needs zstandard")
+        env = CacheManager.shared_env()
+        with CacheManager.batch(size=1000):
+            for i, doc in enumerate(details_docs):
+                key = psc.normalize_name(json.loads(doc)["info"]["name"] or f"p{i}").encode()
+                CacheManager.put_many(psc._details_items(key, {"timestamp": time.time()}, doc, codec=CODEC_ZLIB))
+        _, train, _ = measure(psc.train_details_dictionary, env)
+        _, dictionary = CacheManager.details_codec(env)
+        raw = [doc.encode() for doc in details_docs]
+        total = sum(map(len, raw))
+        rows = [f"{len(raw):,} JSON documents, {total / 1e6:.1f} MB raw; "
+                f"{len(dictionary.as_bytes()) // 1024} KiB dictionary trained in {train * 1e3:.0f} ms"]
+        for label, codec, zdict in [("zlib", CODEC_ZLIB, None), ("zstd", CODEC_ZSTD, None),
+                                    ("zstd + dictionary", psc.CODEC_ZSTD_DICT, dictionary)]:
+            blobs = [psc.compress_blob(b, codec, zdict, psc.DETAILS_ZSTD_LEVEL) for b in raw]
+            size = sum(map(len, blobs))
+            t = best_of(lambda: [psc.decompress_blob(b, codec, zdict) for b in blobs], repeat=3)
+            median = sorted(map(len, blobs))[len(blobs) // 2]
+            rows.append(f"{label:18} {size / 1e6:6.2f} MB ({total / size:4.1f}x, median doc {median:6,} B)  "
+                        f"decompress {total / t / 1e6:6.0f} MB/s  {t / len(blobs) * 1e6:5.1f} us/doc")
+        stats, elapsed, _ = measure(psc.recompress_details_cache, env, train=False)
+        rows.append(f"--recompress of the zlib cache (json + desc parts): {stats['bytes_before'] / 1e6:.2f} MB -> "
+                    f"{stats['bytes_after'] / 1e6:.2f} MB in {elapsed:.2f} s")
+        report(capsys, "details cache: codec size and decompression throughput", rows)
+
+
+RST_DESCRIPTION = """.. image:: https://img.shields.io/pypi/v/pkg.svg
+   :target: https://pypi.org/project/pkg
+   :alt: version
+
+.. list-table::
+   :header-rows: 1
+
+   * - Component
+     - Description
+   * - `core <https://example.org/core>`_
+     - The core
+
+.. raw:: html
+
+    <p align="center"><b>pkg</b> does things</p>
+
+#. first step
+#. second step
+
+.. _docs: https://example.org/docs
+"""
+
+
+class TestRenderedDetails:
+    def test_warm_details_run(self, details_docs, capsys):
+        import io
+        import src.pypi_search_caching.pypi_search_caching as psc
+        n = 50
+        env = CacheManager.shared_env()
+        names = []
+        for doc in details_docs[:n]:
+            data = json.loads(doc)
+            data["info"]["description"] = RST_DESCRIPTION + (data["info"]["description"] or "")
+            name = data["info"]["name"]
+            names.append(name)
+            md = psc.details_markdown(name, data["info"], include_desc=True)
+            psc.store_package_data(env, name, {"timestamp": time.time()}, json.dumps(data), md)
+        argv = ["pypi_search", ".*", "-d", "-f", "-m", str(n), "--no-daemon", "-c"]
+
+        def run():
+            with patch.object(sys, "argv", argv), patch.object(psc, "get_names_buffer", return_value=None), \
+                    patch.object(psc, "get_packages", return_value=names), \
+                    patch("sys.stdout", io.StringIO()), patch("sys.stderr", io.StringIO()):
+                psc.main()
+
+        def details_stage(rendered):
+            for name in names:
+                if rendered:
+                    psc.load_rendered_details(name, True)
+                else:
+                    psc.clean_details_markdown(psc.fetch_project_details(name, include_desc=True))
+
+        def run_without_rendered_cache():
+            with patch.object(psc, "load_rendered_details", return_value=None), \
+                    patch.object(psc, "store_rendered_details"):
+                run()
+
+        run()  # fills the rendered cache
+        before = after = float("inf")
+        for _ in range(5):  # interleaved: rich's rendering time drifts over a long process
+            before = min(before, best_of(run_without_rendered_cache, repeat=1))
+            after = min(after, best_of(run, repeat=1))
+        stage_before = best_of(lambda: details_stage(False), repeat=5)
+        stage_after = best_of(lambda: details_stage(True), repeat=5)
+        report(capsys, "details: rendered Markdown cache, warm `-d -f -m 50` run", [
+            f"{n} cached projects with RST descriptions",
+            f"whole run (incl. rich rendering)  before {before * 1e3:8.1f} ms  after {after * 1e3:8.1f} ms  "
+            f"({before / after:4.2f}x)",
+            f"details Markdown per project      before {stage_before / n * 1e6:8.1f} us  "
+            f"after {stage_after / n * 1e6:8.1f} us  ({stage_before / stage_after:4.1f}x)",
+        ])
+
+
+STANDIN_LATENCY = 0.05  # seconds the local PyPI stand-in waits before each answer
+
+
+class TestConcurrentDetails:
+    def test_cold_desc_runs(self, tmp_path, capsys):
+        import io
+        import src.pypi_search_caching.pypi_search_caching as psc
+        from src.test.pypi_standin import PyPIStandIn
+        rnd = random.Random(7)
+        projects = {}
+        for i in range(200):
+            doc = pypi_json(rnd, releases=10)
+            doc["info"]["name"] = f"pkg{i:03}"
+            projects[doc["info"]["name"]] = doc
+        names = sorted(projects)
+
+        def cold_run(server, shown, concurrency):
+            CacheManager.close_shared_env()
+            lmdb_dir = tmp_path / f"lmdb-{shown}-{concurrency}"
+            argv = ["pypi_search", "pkg.*", "-d", "-m", str(shown), "--no-daemon", "-c",
+                    "--concurrency", str(concurrency)]
+            with patch.object(sys, "argv", argv), patch.object(psc, "LMDB_DIR", lmdb_dir), \
+                    patch.object(psc, "PYPI_JSON_URL", server.json_url), \
+                    patch.object(psc, "get_names_buffer", return_value=None), \
+                    patch.object(psc, "get_packages", return_value=names), \
+                    patch("sys.stdout", io.StringIO()), patch("sys.stderr", io.StringIO()):
+                t0 = time.perf_counter()
+                psc.main()
+                elapsed = time.perf_counter() - t0
+            CacheManager.close_shared_env()
+            return elapsed
+
+        rows = [f"local stand-in server, {STANDIN_LATENCY * 1000:.0f} ms injected latency per request"]
+        with PyPIStandIn(projects, latency=STANDIN_LATENCY) as server:
+            for shown in (10, 50, 200):
+                times = {c: cold_run(server, shown, c) for c in (1, 8, 16)}
+                rows.append(f"-m {shown:<3}  " + "  ".join(
+                    f"--concurrency {c:<2} {t * 1000:7.0f} ms" for c, t in times.items()
+                ) + f"  ({times[1] / times[8]:4.1f}x at 8)")
+        report(capsys, "details: cold-cache `-d` runs, concurrent fetching", rows)
+
+
+class TestDescriptionPipeline:
+    def search_run(self, tmp_path, server, names, argv, lmdb_name):
+        import io
+        import src.pypi_search_caching.pypi_search_caching as psc
+        argv = ["pypi_search", "pkg.*", "--count-only", "--no-daemon", "-c"] + argv
+        with patch.object(sys, "argv", argv), patch.object(psc, "LMDB_DIR", tmp_path / lmdb_name), \
+                patch.object(psc, "PYPI_JSON_URL", server.json_url), \
+                patch.object(psc, "get_names_buffer", return_value=None), \
+                patch.object(psc, "get_packages", return_value=names), \
+                patch("sys.stdout", io.StringIO()), patch("sys.stderr", io.StringIO()):
+            t0 = time.perf_counter()
+            psc.main()
+            elapsed = time.perf_counter() - t0
+        CacheManager.close_shared_env()
+        return elapsed
+
+    def test_search_filter(self, tmp_path, capsys):
+        from src.test.pypi_standin import PyPIStandIn
+        rnd = random.Random(11)
+        projects = {}
+        for i in range(400):
+            doc = pypi_json(rnd, releases=10)
+            doc["info"]["name"] = f"pkg{i:03}"
+            projects[doc["info"]["name"]] = doc
+        names = sorted(projects)
+        # Bounded backtracking at every word of each description: ~15 ms per project
+        costly = r"(?:\w+\s+){1,6}zzz"
+        CacheManager.close_shared_env()
+        rows = [f"{len(names)} names, local stand-in server with {STANDIN_LATENCY * 1000:.0f} ms latency, "
+                f"{available_cpus()} CPU(s)"]
+        with PyPIStandIn(projects, latency=STANDIN_LATENCY) as server:
+            cold = {c: self.search_run(tmp_path, server, names, ["--search", "async", "--concurrency", str(c)],
+                                       f"cold-{c}") for c in (1, 8, 16)}
+            rows.append("cold  --search async   " + "  ".join(
+                f"--concurrency {c:<2} {t:6.2f} s" for c, t in cold.items()
+            ) + f"  ({cold[1] / cold[8]:4.1f}x at 8)")
+            warm = {j: self.search_run(tmp_path, server, names, ["--search", costly, "--jobs", str(j)], "cold-8")
+                    for j in (1, 2, 4, 0)}
+            rows.append("warm  costly regex     " + "  ".join(
+                f"--jobs {j} {t:6.2f} s" for j, t in warm.items()) + "  (0: auto)")
+        report(capsys, "--search: pipelined description filter", rows)
+
+
+STANDIN_HANDSHAKE = 0.04  # seconds per new connection: TCP plus TLS 1.3 set-up, two round trips
+
+
+class TestHTTPSession:
+    def test_sequential_fetches(self, tmp_path, capsys):
+        import requests
+        import src.pypi_search_caching.pypi_search_caching as psc
+        from src.test.pypi_standin import PyPIStandIn
+        rnd = random.Random(5)
+        projects = {}
+        for i in range(100):
+            doc = pypi_json(rnd, releases=10)
+            doc["info"]["name"] = f"pkg{i:03}"
+            projects[doc["info"]["name"]] = doc
+
+        def fetch_all(url, names, bare):
+            psc.close_http_session()
+            CacheManager.close_shared_env()
+            # Before: requests.get, a new connection (and TLS handshake) per request
+            with patch.object(psc, "PYPI_JSON_URL", url), patch.object(psc, "LMDB_DIR", tmp_path / f"{url[:8]}-{bare}"), \
+                    patch.object(psc, "http_session", return_value=requests) if bare else contextlib.nullcontext():
+                t0 = time.perf_counter()
+                for name in names:
+                    psc.fetch_project_details(name)
+                elapsed = time.perf_counter() - t0
+            CacheManager.close_shared_env()
+            return elapsed
+
+        rows = []
+        with PyPIStandIn(projects, latency=STANDIN_LATENCY / 2, handshake=STANDIN_HANDSHAKE) as server:
+            for bare in (True, False):
+                conns = server.connections
+                elapsed = fetch_all(server.json_url, sorted(projects), bare)
+                rows.append(f"stand-in ({STANDIN_LATENCY * 500:.0f} ms latency, {STANDIN_HANDSHAKE * 1000:.0f} ms handshake) "
+                            f"{'requests.get' if bare else 'shared Session':<15} {elapsed:6.2f} s  "
+                            f"{server.connections - conns:3} connections for {len(projects)} fetches")
+        if BENCH_CORPUS == "pypi":
+            names = ["requests", "numpy", "rich", "lmdb", "msgpack", "tqdm", "pytest", "flask", "django", "attrs",
+                     "click", "jinja2", "urllib3", "idna", "certifi", "six", "packaging", "pyyaml", "boto3", "httpx"]
+            for bare in (True, False):
+                elapsed = fetch_all(psc.PYPI_JSON_URL, names, bare)
+                rows.append(f"pypi.org {'requests.get' if bare else 'shared Session':<15} {elapsed:6.2f} s "
+                            f"for {len(names)} fetches")
+        psc.close_http_session()
+        report(capsys, "HTTP: shared keep-alive session vs a connection per request", rows)
+
+
+class TestRateLimiting:
+    def test_throttling_server(self, capsys):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        from src.test.pypi_standin import PyPIStandIn
+        names = [f"pkg{i:03}" for i in range(400)]
+        projects = {n: {"info": {"name": n, "summary": "x" * 200}} for n in names}
+        server_rate = 50
+
+        def crawl(concurrency, rate=0.0, limiter=True):
+            psc.rate_limiter.configure(rate)
+            # Before: a 429 was the final answer (an error and an empty description)
+            statuses = psc.HTTP_THROTTLE_STATUSES if limiter else ()
+            with PyPIStandIn(projects, latency=0.02, rate=server_rate, burst=10, retry_after="1") as server, \
+                    patch.object(psc, "HTTP_THROTTLE_STATUSES", statuses):
+                url = server.json_url
+                t0 = time.perf_counter()
+                results = list(psc.map_prefetched(
+                    lambda n: psc.http_get("http.json", url.format(package_name=n)).status_code, names, concurrency
+                ))
+                elapsed = time.perf_counter() - t0
+            ok = results.count(200)
+            return (f"{ok:4} ok {len(names) - ok:4} failed {server.throttled:5} 429s  {elapsed:6.2f} s  "
+                    f"{ok / elapsed:6.1f} ok/s")
+
+        rows = [f"{len(names)} fetches, stand-in allowing {server_rate} requests/s (burst 10, Retry-After: 1)"]
+        for concurrency in (8, 16):
+            rows.append(f"--concurrency {concurrency:<2} no limiter      " + crawl(concurrency, limiter=False))
+            rows.append(f"--concurrency {concurrency:<2} adaptive        " + crawl(concurrency))
+            rows.append(f"--concurrency {concurrency:<2} --rate {server_rate}       " + crawl(concurrency, server_rate))
+        psc.rate_limiter.configure()
+        report(capsys, "HTTP: client-side rate limiting against a throttling server", rows)
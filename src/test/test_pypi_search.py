@@ -6,6 +6,7 @@ import time
 import json
 import logging
 import os
+import re
 from textwrap import dedent
 import sys
 from pathlib import Path
@@ -39,9 +40,29 @@ from rich.table import Table
 from rich.console import Console
 
 
+def psc_attr(name):
+    return getattr(sys.modules['src.pypi_search_caching.pypi_search_caching'], name)
+
+
+def committed(env, key):
+    """Whether `key` has a committed details meta record (ignores pending batch puts)."""
+    with env.begin() as txn:
+        return txn.get(key, db=CacheManager.details_dbs(env)[psc_attr("LMDB_META_DB")]) is not None
+
+
+def legacy_entry(timestamp, json_data='{"info": {"version": "0.9", "description": "Old"}}', md_data=None):
+    """A details entry in the pre-sub-database length-prefixed format."""
+    import struct
+    import msgpack
+    import zlib
+    headers = msgpack.packb({"timestamp": timestamp, "etag": '"e"'})
+    json_compressed = zlib.compress(json_data.encode())
+    md_compressed = zlib.compress(md_data.encode()) if md_data else b""
+    return (struct.pack(">I", len(headers)) + headers + struct.pack(">I", len(json_compressed)) + json_compressed
+            + struct.pack(">I", len(md_compressed)) + md_compressed)
+
 
 def strip_ansi(text):
-    import re
     return re.sub(r'\x1B\[[0-?]*[ -/]*[@-~]', '', text)
 
 @pytest.fixture
@@ -55,6 +76,25 @@ def mock_home(tmp_path, monkeypatch):
     def mock_home(cls):
         return tmp_path
     monkeypatch.setattr('pathlib.Path.home', classmethod(mock_home))
+    # Cache paths are computed at import time, so redirect them as well
+    cache_dir = tmp_path / ".cache" / "pypi_search"
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.CACHE_DIR', cache_dir)
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.CACHE_FILE', cache_dir / "pypi_search.cache")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.NAMES_BUFFER_FILE', cache_dir / "pypi_names.buf")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.NAMES_INDEX_FILE', cache_dir / "pypi_names.idx")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.TRIGRAM_INDEX_FILE', cache_dir / "pypi_names.tri")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.NAMES_NORM_FILE', cache_dir / "pypi_names.norm")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.DAEMON_SOCKET', cache_dir / "pypi_search.sock")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', cache_dir / "lmdb")
+    monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.CONFIG_FILE',
+                        tmp_path / ".config" / "pypi_search" / "config.toml")
+    for var in [v for v in os.environ if v.startswith("PYPI_SEARCH_LMDB_")]:
+        monkeypatch.delenv(var)
+    # The shared LMDB environment belongs to whichever LMDB_DIR opened it
+    CacheManager.close_shared_env()
+    psc_attr("rate_limiter").configure()  # no pause left over from a throttling test
+    yield
+    CacheManager.close_shared_env()
 
 class TestCacheUtils:
     def test_ensure_cache_dir(self, tmp_path, monkeypatch):
@@ -152,12 +192,12 @@ class TestCacheUtils:
 class TestFetch100PackageNames:
     def test_success(self):
         html = '<html><a href="testpkg/">testpkg</a><a href="testpkg2/">testpkg2</a></html>'
-        with patch('requests.get', return_value=MagicMock(text=html, status_code=200, raise_for_status=lambda: None)):
+        with patch('requests.Session.get', return_value=MagicMock(text=html, status_code=200, raise_for_status=lambda: None)):
             pkgs = fetch_all_package_names(limit=2)
         assert pkgs == ["testpkg", "testpkg2"]
 
     def test_network_error(self, capfd):
-        with patch('requests.get', side_effect=RequestException("network")):
+        with patch('requests.Session.get', side_effect=RequestException("network")):
             with pytest.raises(SystemExit, match="1"):
                 fetch_all_package_names()
         captured = capfd.readouterr()
@@ -170,11 +210,1912 @@ class TestFetch100PackageNames:
         assert len(pkgs) == pkg_cnt
         assert all(isinstance(p, str) and p.strip() for p in pkgs)
 
+
+class TestStreamingPackageNames:
+    @staticmethod
+    def make_stream_resp(html, chunk_size):
+        chunks = [html[i:i + chunk_size].encode() for i in range(0, len(html), chunk_size)]
+        resp = MagicMock(status_code=200, raise_for_status=lambda: None)
+        resp.headers = {"Content-Type": "text/html"}
+        resp.iter_content.return_value = iter(chunks)
+        return resp
+
+    def test_names_split_across_chunks(self):
+        from src.pypi_search_caching.pypi_search_caching import iter_simple_index_names
+        html = ('<html><body><a href="/simple/aiohttp/">aiohttp</a>\n'
+                '<a href="/simple/flask/">flask</a>\n<a href="/simple/a-b/">a&#45;b</a></body></html>')
+        for chunk_size in (1, 3, 7, 64):
+            resp = self.make_stream_resp(html, chunk_size)
+            assert list(iter_simple_index_names(resp)) == ["aiohttp", "flask", "a-b"]
+
+    def test_limit_stops_reading(self):
+        from src.pypi_search_caching.pypi_search_caching import iter_simple_index_names
+        html = "".join(f'<a href="/simple/p{i}/">p{i}</a>' for i in range(100))
+        chunks = iter([html[i:i + 10].encode() for i in range(0, len(html), 10)])
+        resp = MagicMock()
+        resp.iter_content.return_value = chunks
+        assert list(iter_simple_index_names(resp, limit=2)) == ["p0", "p1"]
+        assert next(chunks, None) is not None  # rest of the document left unread
+
+    def test_fetch_stream_mode(self, capfd):
+        html = '<html><a href="testpkg/">testpkg</a><a href="testpkg2/">testpkg2</a></html>'
+        resp = self.make_stream_resp(html, 5)
+        with patch('requests.Session.get', return_value=resp) as mock_get:
+            pkgs = fetch_all_package_names(stream=True)
+            assert not isinstance(pkgs, list)
+            assert list(pkgs) == ["testpkg", "testpkg2"]
+        assert mock_get.call_args.kwargs["stream"] is True
+        resp.close.assert_called_once()
+        assert "Found 2 package names." in capfd.readouterr().err
+
+    def test_get_packages_streams_into_save(self):
+        html = '<a href="/simple/x/">x</a><a href="/simple/y/">y</a>'
+        resp = self.make_stream_resp(html, 4)
+        with patch('requests.Session.get', return_value=resp), patch.object(CacheManager, '_get_env') as mock_env:
+            pkgs = get_packages(refresh_cache=True)
+        assert pkgs == ["x", "y"]
+        mock_env.return_value.begin.return_value.__enter__.return_value.put.assert_called_once()
+
+
+class TestSimpleIndexJSON:
+    index = {
+        "meta": {"api-version": "1.1", "_last-serial": 900},
+        "projects": [
+            {"name": "aiohttp", "_last-serial": 800},
+            {"name": "Flask", "_last-serial": 900},
+            {"name": "old-pkg"},
+        ],
+    }
+
+    def make_json_resp(self):
+        resp = MagicMock(status_code=200, raise_for_status=lambda: None)
+        resp.headers = {"Content-Type": "application/vnd.pypi.simple.v1+json"}
+        resp.content = json.dumps(self.index).encode()
+        return resp
+
+    def test_parse_simple_index_json(self):
+        from src.pypi_search_caching.pypi_search_caching import parse_simple_index_json
+        index = parse_simple_index_json(json.dumps(self.index).encode())
+        assert index["names"] == ["aiohttp", "Flask", "old-pkg"]
+        assert index["serials"] == {"aiohttp": 800, "Flask": 900}
+        assert index["last_serial"] == 900
+        assert parse_simple_index_json(json.dumps(self.index).encode(), limit=1)["names"] == ["aiohttp"]
+
+    def test_fetch_package_index_negotiates_json(self):
+        from src.pypi_search_caching.pypi_search_caching import fetch_package_index, PYPI_SIMPLE_JSON_TYPE
+        with patch('requests.Session.get', return_value=self.make_json_resp()) as mock_get:
+            index = fetch_package_index()
+        assert PYPI_SIMPLE_JSON_TYPE in mock_get.call_args.kwargs["headers"]["Accept"]
+        assert index["names"] == ["aiohttp", "Flask", "old-pkg"]
+        assert index["last_serial"] == 900
+
+    def test_fetch_package_index_html_fallback(self):
+        from src.pypi_search_caching.pypi_search_caching import fetch_package_index
+        resp = TestStreamingPackageNames.make_stream_resp('<a href="/simple/x/">x</a>', 4)
+        with patch('requests.Session.get', return_value=resp):
+            index = fetch_package_index()
+            assert list(index["names"]) == ["x"]
+        assert index["serials"] is None
+
+    def test_fetch_all_package_names_negotiate(self):
+        with patch('requests.Session.get', return_value=self.make_json_resp()):
+            assert fetch_all_package_names(negotiate=True, limit=2) == ["aiohttp", "Flask"]
+
+    def test_get_packages_stores_serials(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "lmdb")
+        with patch('requests.Session.get', return_value=self.make_json_resp()):
+            pkgs = get_packages(refresh_cache=True)
+        assert pkgs == ["Flask", "aiohttp", "old-pkg"]  # stored sorted
+        cm = CacheManager()
+        assert cm.load() == pkgs
+        assert cm.load_serials() == {"aiohttp": 800, "Flask": 900}
+        assert cm.load_last_serial() == 900
+
+    def test_load_serials_absent(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "lmdb")
+        cm = CacheManager()
+        cm.save(["a", "b"])
+        assert cm.load_serials() is None
+        assert cm.load_last_serial() is None
+
+
+class TestIncrementalRefresh:
+    @pytest.fixture
+    def changelog_server(self, monkeypatch):
+        """Local stand-in for PyPI's XML-RPC changelog endpoint."""
+        import threading
+        from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+        class Handler(SimpleXMLRPCRequestHandler):
+            rpc_paths = ("/pypi",)
+
+        state = {"events": [], "calls": [], "fault": False}
+
+        def changelog_since_serial(serial):
+            state["calls"].append(serial)
+            if state["fault"]:
+                raise ValueError("changelog disabled")
+            return [e for e in state["events"] if e[4] > serial]
+
+        server = SimpleXMLRPCServer(("127.0.0.1", 0), requestHandler=Handler,
+                                    logRequests=False, allow_none=True)
+        server.register_function(changelog_since_serial)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.PYPI_XMLRPC_URL',
+                            f"http://127.0.0.1:{server.server_address[1]}/pypi")
+        yield state
+        server.shutdown()
+        server.server_close()
+
+    @pytest.fixture
+    def stale_cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "lmdb")
+        real_time = time.time
+        monkeypatch.setattr('time.time', lambda: real_time() - CACHE_MAX_AGE_SECONDS * 2)
+        CacheManager().save(["aiohttp", "flask", "gone"],
+                            serials={"aiohttp": 10, "flask": 20, "gone": 5}, last_serial=100)
+        monkeypatch.setattr('time.time', real_time)
+
+    def test_apply_changelog(self):
+        from src.pypi_search_caching.pypi_search_caching import apply_changelog
+        packages = ["a", "b", "c"]
+        serials = {"a": 1, "b": 2, "c": 3}
+        events = [
+            ["new", None, 0, "create", 11],
+            ["b", "1.0", 0, "new release", 12],
+            ["c", None, 0, "remove project", 13],
+            ["a2", None, 0, "rename from a", 14],
+            ["tmp", None, 0, "create", 15],
+            ["tmp", None, 0, "remove project", 16],
+        ]
+        delta = apply_changelog(packages, serials, events)
+        assert packages == ["b", "new", "a2"]
+        assert serials == {"b": 12, "new": 11, "a2": 14}
+        assert delta == {"added": 2, "removed": 2, "last_serial": 16}
+
+    def test_incremental_refresh_applies_delta(self, stale_cache, changelog_server):
+        changelog_server["events"] = [
+            ["newpkg", None, 0, "create", 101],
+            ["gone", None, 0, "remove project", 102],
+            ["flask", "3.0", 0, "new release", 103],
+        ]
+        with patch('src.pypi_search_caching.pypi_search_caching.fetch_package_index') as mock_full:
+            pkgs = get_packages(refresh_cache=False)
+        mock_full.assert_not_called()
+        assert changelog_server["calls"] == [100]
+        assert pkgs == ["aiohttp", "flask", "newpkg"]
+        cm = CacheManager()
+        assert cm.load() == pkgs  # fresh again
+        assert cm.load_last_serial() == 103
+        assert cm.load_serials() == {"aiohttp": 10, "flask": 103, "newpkg": 101}
+
+    def test_no_changes_keeps_serial(self, stale_cache, changelog_server):
+        pkgs = get_packages(refresh_cache=True)
+        assert pkgs == ["aiohttp", "flask", "gone"]
+        assert CacheManager().load_last_serial() == 100
+
+    def test_delta_unavailable_full_refetch(self, stale_cache, changelog_server):
+        changelog_server["fault"] = True
+        index = {"names": ["x"], "serials": {"x": 200}, "last_serial": 200}
+        with patch('src.pypi_search_caching.pypi_search_caching.fetch_package_index', return_value=index) as mock_full:
+            pkgs = get_packages(refresh_cache=False)
+        mock_full.assert_called_once()
+        assert changelog_server["calls"] == [100]
+        assert pkgs == ["x"]
+        assert CacheManager().load_last_serial() == 200
+
+    def test_no_recorded_serial_full_refetch(self, tmp_path, monkeypatch, changelog_server):
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "lmdb")
+        index = {"names": ["x"], "serials": None, "last_serial": None}
+        with patch('src.pypi_search_caching.pypi_search_caching.fetch_package_index', return_value=index):
+            assert get_packages(refresh_cache=True) == ["x"]
+        assert changelog_server["calls"] == []
+
+
+class TestConditionalIndexRefresh:
+    @pytest.fixture
+    def stale_cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "lmdb")
+        real_time = time.time
+        monkeypatch.setattr('time.time', lambda: real_time() - CACHE_MAX_AGE_SECONDS * 2)
+        CacheManager().save(["aiohttp", "flask"],
+                            validators={"etag": '"idx-1"', "last_modified": "Wed, 01 Jan 2025 00:00:00 GMT"})
+        monkeypatch.setattr('time.time', real_time)
+
+    def test_304_bumps_timestamp_only(self, stale_cache):
+        assert CacheManager().load() is None  # expired
+        resp = MagicMock(status_code=304)
+        with patch('requests.Session.get', return_value=resp) as mock_get:
+            pkgs = get_packages(refresh_cache=False)
+        headers = mock_get.call_args.kwargs["headers"]
+        assert headers["If-None-Match"] == '"idx-1"'
+        assert headers["If-Modified-Since"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+        resp.iter_content.assert_not_called()
+        assert pkgs == ["aiohttp", "flask"]
+        cm = CacheManager()
+        assert cm.load() == pkgs  # fresh again
+        assert cm.load_validators()["etag"] == '"idx-1"'
+
+    def test_200_stores_new_validators(self, stale_cache):
+        resp = TestStreamingPackageNames.make_stream_resp('<a href="/simple/x/">x</a>', 8)
+        resp.headers = {"Content-Type": "text/html", "ETag": '"idx-2"', "X-PyPI-Last-Serial": "77"}
+        with patch('requests.Session.get', return_value=resp):
+            pkgs = get_packages(refresh_cache=True)
+        assert pkgs == ["x"]
+        cm = CacheManager()
+        assert cm.load_validators() == {"etag": '"idx-2"', "last_modified": None}
+        assert cm.load_last_serial() == 77
+
+    def test_304_without_cached_record_refetches(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "lmdb")
+        not_modified = {"names": None, "serials": None, "last_serial": None, "not_modified": True}
+        full = {"names": ["y"], "serials": None, "last_serial": None, "not_modified": False}
+        with patch('src.pypi_search_caching.pypi_search_caching.fetch_package_index',
+                   side_effect=[not_modified, full]) as mock_fetch:
+            assert get_packages(refresh_cache=True) == ["y"]
+        assert mock_fetch.call_count == 2
+
+    def test_unsolicited_304_without_validators(self):
+        from src.pypi_search_caching.pypi_search_caching import fetch_package_index
+        with patch('requests.Session.get', return_value=MagicMock(status_code=304)) as mock_get:
+            index = fetch_package_index()
+        assert "If-None-Match" not in mock_get.call_args.kwargs["headers"]
+        assert index["not_modified"] is True
+        assert index["etag"] is None and index["last_modified"] is None
+
+
+class TestNamesRecordFormat:
+    @pytest.fixture
+    def lmdb_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "lmdb")
+
+    @staticmethod
+    def legacy_value(names, timestamp, serials=None, **extra):
+        import base64
+        import zlib
+        entry = {"data": base64.b64encode(zlib.compress(json.dumps(names).encode())).decode(),
+                 "timestamp": timestamp, **extra}
+        if serials:
+            entry["serials"] = base64.b64encode(zlib.compress(
+                json.dumps([serials.get(n) for n in names]).encode())).decode()
+        return json.dumps(entry).encode()
+
+    def test_encode_decode_roundtrip(self):
+        from src.pypi_search_caching.pypi_search_caching import (
+            encode_names_record, decode_names_record, NAMES_RECORD_MAGIC, CODEC_NONE, CODEC_ZLIB)
+        names = ["aiohttp", "Flask", "zope.interface"]
+        for codec in (CODEC_NONE, CODEC_ZLIB):
+            value = encode_names_record(names, 123.5, serials={"Flask": 7}, meta={"etag": '"e"'}, codec=codec)
+            assert value.startswith(NAMES_RECORD_MAGIC)
+            header = decode_names_record(value, with_names=False)
+            assert header["count"] == 3 and header["timestamp"] == 123.5 and header["codec"] == codec
+            assert header["names"] is None
+            record = decode_names_record(value)
+            assert record["names"] == names
+            assert record["names_blob"] == b"aiohttp\nFlask\nzope.interface"
+            assert record["serials"] == {"Flask": 7}
+            assert record["etag"] == '"e"'
+
+    def test_empty_record(self):
+        from src.pypi_search_caching.pypi_search_caching import encode_names_record, decode_names_record
+        assert decode_names_record(encode_names_record([], 1.0))["names"] == []
+
+    def test_zstd_codec(self):
+        pytest.importorskip("zstandard")
+        from src.pypi_search_caching.pypi_search_caching import encode_names_record, decode_names_record, CODEC_ZSTD
+        value = encode_names_record(["a", "b"], 1.0, codec=CODEC_ZSTD)
+        assert decode_names_record(value)["names"] == ["a", "b"]
+
+    def test_unsupported_version(self):
+        from src.pypi_search_caching.pypi_search_caching import encode_names_record, decode_names_record
+        value = bytearray(encode_names_record(["a"], 1.0))
+        value[4] = 99
+        with pytest.raises(ValueError, match="version 99"):
+            decode_names_record(bytes(value))
+
+    def test_migrates_legacy_record(self, lmdb_dir):
+        from src.pypi_search_caching.pypi_search_caching import NAMES_RECORD_MAGIC
+        cm = CacheManager()
+        ts = time.time() - 100
+        value = self.legacy_value(["a", "b"], ts, serials={"a": 3}, etag='"x"', last_serial=3)
+        with cm._get_env().begin(write=True) as txn:
+            txn.put(b"all_packages", value)
+        assert cm.load() == ["a", "b"]
+        raw = cm._read_raw()
+        assert raw.startswith(NAMES_RECORD_MAGIC)
+        record = cm._read_entry(with_names=True)
+        assert record["timestamp"] == ts  # age preserved by the migration
+        assert record["serials"] == {"a": 3}
+        assert cm.load_validators() == {"etag": '"x"', "last_modified": None}
+        assert cm.load_last_serial() == 3
+
+    def test_legacy_cache_file_migrates_to_binary(self, lmdb_dir, tmp_path, monkeypatch):
+        from src.pypi_search_caching.pypi_search_caching import NAMES_RECORD_MAGIC
+        legacy_file = tmp_path / "legacy.cache"
+        legacy_file.write_text("pkg1\npkg2\n")
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.CACHE_FILE', legacy_file)
+        cm = CacheManager()
+        assert cm.load() == ["pkg1", "pkg2"]
+        assert not legacy_file.exists()
+        assert cm._read_raw().startswith(NAMES_RECORD_MAGIC)
+
+    def test_touch_patches_timestamp_only(self, lmdb_dir, monkeypatch):
+        cm = CacheManager()
+        cm.save(["a", "b"], last_serial=9)
+        before = cm._read_raw()
+        later = time.time() + 1000
+        monkeypatch.setattr('time.time', lambda: later)
+        assert cm.touch()
+        after = cm._read_raw()
+        assert len(after) == len(before)
+        assert cm._read_entry()["timestamp"] == later
+        assert cm.load() == ["a", "b"]
+
+    def test_load_blob(self, lmdb_dir):
+        cm = CacheManager()
+        assert cm.load_blob() is None
+        cm.save(["a", "b"])
+        assert cm.load_blob() == b"a\nb"
+
+
+class TestNamesBufferEngine:
+    names = ["aiohttp", "aiofiles", "django", "django-rest", "my-django", "Flask", "flask-login", "zope.interface"]
+
+    @pytest.mark.parametrize("pattern, flags", [
+        ("aio.*", 0),
+        (".*django.*", 0),
+        ("flask|django", 0),  # ^flask|django$ -- prefix OR suffix
+        ("flask.*", re.IGNORECASE),
+        ("zope\\..*", 0),
+        ("(a|d)[a-z]+", 0),
+        ("nomatch", 0),
+    ])
+    def test_matches_per_name_scan(self, pattern, flags):
+        from src.pypi_search_caching.pypi_search_caching import search_names_buffer
+        buf = ("\n".join(self.names) + "\n").encode()
+        regex = re.compile(f"^{pattern}$", flags)
+        assert search_names_buffer(buf, pattern, flags) == [n for n in self.names if regex.search(n)]
+
+    @pytest.mark.parametrize("engine", ["auto", "prefix", "trigram", "mmap"])
+    @pytest.mark.parametrize("pattern", ["a*", "x?", "(ab)*", ""])
+    def test_empty_matching_pattern_has_no_phantom_name(self, pattern, engine):
+        from src.pypi_search_caching.pypi_search_caching import search_names, search_names_buffer
+        CacheManager().save(self.names)
+        buf = psc_attr("get_names_buffer")()
+        regex = re.compile(f"^{pattern}$")
+        expected = [n for n in sorted(self.names) if regex.search(n)]
+        assert search_names_buffer(buf, pattern) == expected
+        assert search_names(buf, pattern, engine=engine) in (None, expected)
+
+    @pytest.mark.parametrize("engine", ["auto", "prefix", "trigram", "mmap"])
+    @pytest.mark.parametrize("pattern, flags", [
+        ("caf.", 0),
+        ("caf..", 0),
+        ("\\w+", 0),
+        ("stra\\w+", 0),
+        (".*\\bdu", 0),
+        ("(?i:FLASK)", 0),
+        ("flask", re.IGNORECASE),
+        ("caf.", re.IGNORECASE),
+    ])
+    def test_non_ascii_names_match_like_scan(self, pattern, flags, engine):
+        from src.pypi_search_caching.pypi_search_caching import search_names, search_names_buffer, scan_names
+        names = ["cafe", "caff", "café", "CAFÉ", "flask", "flaſk", "nandu", "strasse", "straße", "ñandu"]
+        CacheManager().save(names)
+        buf = psc_attr("get_names_buffer")()
+        expected = scan_names(sorted(names), pattern, flags)
+        assert search_names(buf, pattern, flags, engine=engine) == expected
+        assert search_names_buffer(buf, pattern, flags) == expected
+
+    def test_non_ascii_names_pinned(self):
+        from src.pypi_search_caching.pypi_search_caching import search_names
+        CacheManager().save(["cafe", "café", "straße", "ñandu"])
+        buf = psc_attr("get_names_buffer")()
+        assert search_names(buf, "caf.") == ["cafe", "café"]
+        assert search_names(buf, "caf..") == []
+        assert search_names(buf, "\\w+") == ["cafe", "café", "straße", "ñandu"]
+
+    @pytest.mark.parametrize("pattern", ["a\\s*b", "[^x]+", "(?s)a.*", "a(?=b)", "caf\u00e9", "\\x61.*", "["])
+    def test_unsupported_patterns_fall_back(self, pattern):
+        from src.pypi_search_caching.pypi_search_caching import search_names_buffer
+        assert search_names_buffer(b"a\nb\n", pattern) is None
+
+    def test_get_names_buffer_is_mmapped(self):
+        import mmap
+        from src.pypi_search_caching.pypi_search_caching import get_names_buffer
+        CacheManager().save(self.names)
+        buf = get_names_buffer()
+        assert isinstance(buf, mmap.mmap)
+        assert buf[:] == ("\n".join(sorted(self.names)) + "\n").encode()
+        assert get_names_buffer(refresh_cache=True) is None
+
+    def test_stale_buffer_file_is_rebuilt(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(["a", "b"])
+        psc.NAMES_BUFFER_FILE.write_bytes(b"stale\n")
+        assert psc.get_names_buffer()[:] == b"a\nb\n"
+        psc.NAMES_BUFFER_FILE.unlink()
+        assert psc.get_names_buffer()[:] == b"a\nb\n"
+        assert psc.get_names_buffer()[:] == b"a\nb\n"  # record now points at the rebuilt file
+
+    def test_expired_cache_has_no_buffer(self, monkeypatch):
+        from src.pypi_search_caching.pypi_search_caching import get_names_buffer
+        CacheManager().save(["a"])
+        later = time.time() + CACHE_MAX_AGE_SECONDS * 2
+        monkeypatch.setattr('time.time', lambda: later)
+        assert get_names_buffer() is None
+
+    def test_empty_index(self):
+        from src.pypi_search_caching.pypi_search_caching import get_names_buffer, search_names_buffer
+        CacheManager().save([])
+        buf = get_names_buffer()
+        assert buf == b""
+        assert search_names_buffer(buf, ".*") == []
+
+    def test_main_uses_buffer(self, capsys):
+        CacheManager().save(self.names)
+        sys.argv = ['script', 'aio.*']
+        with patch('src.pypi_search_caching.pypi_search_caching.get_packages') as mock_get:
+            main()
+        mock_get.assert_not_called()
+        out = strip_ansi(capsys.readouterr().out)
+        assert "1. aiofiles" in out and "2. aiohttp" in out
+        assert "Total: 2" in out
+
+    def test_main_scan_engine(self, capsys):
+        CacheManager().save(self.names)
+        sys.argv = ['script', 'aio.*', '--engine', 'scan']
+        with patch('src.pypi_search_caching.pypi_search_caching.get_packages', return_value=self.names) as mock_get:
+            main()
+        mock_get.assert_called_once_with(False)
+        assert "Total: 2" in strip_ansi(capsys.readouterr().out)
+
+
+class TestPrefixIndex:
+    names = sorted(["aiohttp", "aiofiles", "AioRedis", "aio", "django", "django-rest", "Flask",
+                    "flask-login", "flask.ext", "my-flask", "zope.interface", "a"])
+
+    @pytest.mark.parametrize("pattern, prefix", [
+        ("aio.*", "aio"),
+        ("^aio.*", "aio"),
+        ("flask-.*", "flask-"),
+        ("zope\\.interface", "zope.interface"),
+        ("flask?", "flas"),
+        ("flask.?", "flask"),
+        ("fla+sk", "fla"),
+        ("ab{2}", "a"),
+        ("aio(http|files)", "aio"),
+        ("aio\\d+", "aio"),
+        (".*django.*", ""),
+        ("flask|django", ""),
+        ("(flask|django)-.*", ""),
+        ("a[|]b", "a"),
+        ("a[]|]b", "a"),
+        ("a[^]|]b", "a"),
+        ("a[\\]|]b", "a"),
+        ("(?i)aio.*", ""),
+        ("a*", ""),
+    ])
+    def test_extract_literal_prefix(self, pattern, prefix):
+        from src.pypi_search_caching.pypi_search_caching import extract_literal_prefix
+        assert extract_literal_prefix(pattern) == prefix
+
+    @pytest.mark.parametrize("pattern, flags", [
+        ("aio.*", 0),
+        ("aio.*", re.IGNORECASE),
+        ("flask.*", 0),
+        ("FLASK.*", re.IGNORECASE),
+        ("flask\\..*", 0),
+        ("a", 0),
+        ("zzz.*", 0),
+        ("Z.*", re.IGNORECASE),
+    ])
+    def test_matches_per_name_scan(self, pattern, flags):
+        from src.pypi_search_caching.pypi_search_caching import (
+            get_names_buffer, open_names_index, search_names_prefix,
+        )
+        CacheManager().save(self.names)
+        buf = get_names_buffer()
+        regex = re.compile(f"^{pattern}$", flags)
+        expected = [n for n in self.names if regex.search(n)]
+        assert search_names_prefix(buf, open_names_index(buf), pattern, flags) == expected
+
+    def test_no_prefix_returns_none(self):
+        from src.pypi_search_caching.pypi_search_caching import (
+            get_names_buffer, open_names_index, search_names_prefix,
+        )
+        CacheManager().save(self.names)
+        buf = get_names_buffer()
+        assert search_names_prefix(buf, open_names_index(buf), ".*flask", 0) is None
+
+    def test_missing_index_is_rebuilt(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(self.names)
+        buf = psc.get_names_buffer()
+        psc.NAMES_INDEX_FILE.unlink()
+        index = psc.open_names_index(buf)
+        assert index is not None and psc.NAMES_INDEX_FILE.exists()
+        assert psc.search_names_prefix(buf, index, "flask.*", 0) == ["flask-login", "flask.ext"]
+
+    def test_unsorted_buffer_has_no_index(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        psc.NAMES_BUFFER_FILE.parent.mkdir(parents=True, exist_ok=True)
+        psc.NAMES_BUFFER_FILE.write_bytes(b"b\na\n")
+        assert psc.open_names_index(b"b\na\n") is None
+
+    def test_main_prefix_engine_skips_full_scan(self, capsys):
+        CacheManager().save(self.names)
+        sys.argv = ['script', 'flask.*', '-i']
+        with patch('src.pypi_search_caching.pypi_search_caching.search_names_buffer') as mock_scan:
+            main()
+        mock_scan.assert_not_called()
+        out = strip_ansi(capsys.readouterr().out)
+        assert "1. Flask" in out and "3. flask.ext" in out
+        assert "Total: 3" in out
+
+    def test_main_mmap_engine_skips_prefix(self, capsys):
+        CacheManager().save(self.names)
+        sys.argv = ['script', 'flask.*', '--engine', 'mmap']
+        with patch('src.pypi_search_caching.pypi_search_caching.search_names_prefix') as mock_prefix:
+            main()
+        mock_prefix.assert_not_called()
+        assert "Total: 2" in strip_ansi(capsys.readouterr().out)
+
+
+class TestTrigramIndex:
+    names = sorted(["pytest-django-plugin", "pytest-cov", "Pytest-Mock-Plugin", "django", "django-rest",
+                    "flask-login", "my-flask-plugin", "aiohttp", "zope.interface", "ab"])
+
+    @pytest.fixture(autouse=True)
+    def any_selectivity(self, monkeypatch):
+        # The corpus is tiny; let every trigram query through
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.TRIGRAM_MAX_CANDIDATE_RATIO', 1.0)
+
+    @pytest.mark.parametrize("pattern, query", [
+        ("pytest", ("and", [b"est", b"pyt", b"tes", b"yte"])),
+        (".*Flask.*", ("and", [b"ask", b"fla", b"las"])),
+        (".*py.*", None),
+        ("flask|django", ("or", [("and", [b"ask", b"fla", b"las"]), ("and", [b"ang", b"dja", b"jan", b"ngo"])])),
+        (".*(flask|dj).*", None),
+        ("a+bcd", ("and", [b"bcd"])),
+        ("x{0,3}abc", ("and", [b"abc"])),
+        ("(abc)+.*[xyz]def", ("and", [b"abc", b"def"])),
+        ("(flask|django)-ext", ("and", [("or", [("and", [b"ask", b"fla", b"las"]),
+                                                ("and", [b"ang", b"dja", b"jan", b"ngo"])]), b"-ex", b"ext"])),
+        ("[", None),
+    ])
+    def test_plan_trigram_query(self, pattern, query):
+        from src.pypi_search_caching.pypi_search_caching import plan_trigram_query
+        assert plan_trigram_query(pattern) == query
+
+    @pytest.mark.parametrize("pattern, flags", [
+        (".*pytest.*plugin.*", 0),
+        (".*pytest.*plugin.*", re.IGNORECASE),
+        (".*django.*", 0),
+        (".*flask.*|.*django", 0),
+        ("(.*)-(plugin|cov)", 0),
+        (".*interface", 0),
+        (".*(login|mock).*", re.IGNORECASE),
+        (".*nomatch.*", 0),
+    ])
+    def test_matches_per_name_scan(self, pattern, flags):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(self.names)
+        buf = psc.get_names_buffer()
+        regex = re.compile(f"^{pattern}$", flags)
+        expected = [n for n in self.names if regex.search(n)]
+        result = psc.search_names_trigram(
+            buf, psc.open_names_index(buf), psc.open_trigram_index(buf), pattern, flags
+        )
+        assert result == expected
+
+    def test_candidates_are_narrowed(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(self.names)
+        buf = psc.get_names_buffer()
+        lines = psc.trigram_candidates(psc.open_trigram_index(buf), ".*plugin", 0)
+        assert [sorted(self.names)[line] for line in lines] == [
+            "Pytest-Mock-Plugin", "my-flask-plugin", "pytest-django-plugin",
+        ]
+        assert psc.trigram_candidates(psc.open_trigram_index(buf), ".*p.*", 0) is None
+
+    def test_unselective_query_returns_none(self, monkeypatch):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        monkeypatch.setattr(psc, 'TRIGRAM_MAX_CANDIDATE_RATIO', 0.25)
+        CacheManager().save(self.names)
+        buf = psc.get_names_buffer()
+        assert psc.search_names_trigram(
+            buf, psc.open_names_index(buf), psc.open_trigram_index(buf), ".*pytest.*", 0
+        ) is None
+
+    def test_save_rebuilds_index(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(self.names)
+        CacheManager().save(["zzz-new"])
+        buf = psc.get_names_buffer()
+        assert psc.search_names_trigram(
+            buf, psc.open_names_index(buf), psc.open_trigram_index(buf), ".*new", 0
+        ) == ["zzz-new"]
+
+    def test_missing_index_is_rebuilt(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(self.names)
+        buf = psc.get_names_buffer()
+        psc.TRIGRAM_INDEX_FILE.unlink()
+        assert psc.open_trigram_index(buf) is not None
+        assert psc.TRIGRAM_INDEX_FILE.exists()
+
+    def test_main_trigram_engine_skips_full_scan(self, capsys):
+        CacheManager().save(self.names)
+        sys.argv = ['script', '.*plugin', '-i']
+        with patch('src.pypi_search_caching.pypi_search_caching.search_names_buffer') as mock_scan:
+            main()
+        mock_scan.assert_not_called()
+        out = strip_ansi(capsys.readouterr().out)
+        assert "1. Pytest-Mock-Plugin" in out and "Total: 3" in out
+
+
+class TestParallelScan:
+    names = sorted(["aiohttp", "aaa-bbb", "abab", "django", "Django-Extensions", "flask", "\u00c9clair",
+                    "\u00e9clair-utils", "xx", "zope.interface"])
+
+    @pytest.fixture(autouse=True)
+    def no_monitor_thread(self, monkeypatch):
+        # Earlier main() runs leave tqdm's monitor thread behind; with it
+        # alive the pool starts via forkserver instead of fork
+        from tqdm import tqdm
+        monkeypatch.setattr(tqdm, 'monitor_interval', 0)
+        if tqdm.monitor is not None:
+            tqdm.monitor.exit()
+            tqdm.monitor = None
+
+    @pytest.mark.parametrize("jobs", [1, 2, 3, 32])
+    @pytest.mark.parametrize("pattern, flags", [
+        ("(a+)+b.*", 0),
+        ("(ab)\\1", 0),
+        ("(.)\\1.*", 0),
+        ("\u00e9clair.*", re.IGNORECASE),
+        ("django.*", re.IGNORECASE),
+        ("nomatch", 0),
+    ])
+    def test_matches_per_name_scan_in_order(self, jobs, pattern, flags):
+        from src.pypi_search_caching.pypi_search_caching import search_names_parallel
+        buf = ("\n".join(self.names) + "\n").encode()
+        regex = re.compile(f"^{pattern}$", flags)
+        assert search_names_parallel(buf, pattern, flags, jobs) == [n for n in self.names if regex.search(n)]
+
+    def test_empty_buffer(self):
+        from src.pypi_search_caching.pypi_search_caching import search_names_parallel
+        assert search_names_parallel(b"", ".*", 0, 4) == []
+
+    def test_shared_memory_is_released(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        created = []
+        real = psc.shared_memory.SharedMemory
+
+        def tracking(*args, **kwargs):
+            shm = real(*args, **kwargs)
+            created.append(shm)
+            return shm
+
+        with patch.object(psc.shared_memory, 'SharedMemory', side_effect=tracking):
+            psc.search_names_parallel(b"a\nb\n", "a", 0, 2)
+        assert len(created) == 1
+        with pytest.raises(FileNotFoundError):
+            real(name=created[0].name)
+
+    def test_plan_scan_jobs(self, monkeypatch):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        regex = re.compile("^a.*$")
+        assert psc.plan_scan_jobs(["a"], 10, regex, jobs=3) == 3
+        assert psc.plan_scan_jobs(["a"], 10, regex, jobs=1) == 1
+        monkeypatch.setattr(psc, 'available_cpus', lambda: 1)
+        assert psc.plan_scan_jobs(["a"], 10**9, regex) == 1
+        monkeypatch.setattr(psc, 'available_cpus', lambda: 4)
+        assert psc.plan_scan_jobs(["a"] * 10, 100, regex) == 1  # cheap: stays in-process
+        assert psc.plan_scan_jobs(["a"] * 10, 10**12, regex) == 4
+
+    def test_search_names_fans_out_unsupported_pattern(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(self.names)
+        buf = psc.get_names_buffer()
+        # Non-ASCII -i: no index or buffer engine can run it
+        assert psc.search_names(buf, "\u00c9.*", re.IGNORECASE) is None
+        assert psc.search_names(buf, "\u00c9.*", re.IGNORECASE, jobs=2) == ["\u00c9clair", "\u00e9clair-utils"]
+
+    def test_main_jobs_scan_engine(self, capsys):
+        sys.argv = ['script', '.*a.*', '--engine', 'scan', '--jobs', '2']
+        with patch('src.pypi_search_caching.pypi_search_caching.get_packages', return_value=self.names), \
+                patch('src.pypi_search_caching.pypi_search_caching.search_names_parallel',
+                      wraps=__import__('src.pypi_search_caching.pypi_search_caching',
+                                       fromlist=['x']).search_names_parallel) as mock_parallel:
+            main()
+        mock_parallel.assert_called_once()
+        out = strip_ansi(capsys.readouterr().out)
+        assert "1. Django-Extensions" in out and "2. aaa-bbb" in out
+        assert "9. \u00e9clair-utils" in out and "Total: 9" in out
+
+
+class TestNormalizedNames:
+    names = sorted(["Flask-SQLAlchemy", "flask_login", "Flask.Ext.Cache", "django", "zope.interface",
+                    "Pillow", "pillow-heif", "caf\u00e9-utils"])
+
+    @pytest.mark.parametrize("name, normalized", [
+        ("Flask_SQLAlchemy", "flask-sqlalchemy"),
+        ("flask.sqlalchemy", "flask-sqlalchemy"),
+        ("Flask--_.SQLAlchemy", "flask-sqlalchemy"),
+        ("pillow", "pillow"),
+    ])
+    def test_normalize_name(self, name, normalized):
+        from src.pypi_search_caching import normalize_name
+        assert normalize_name(name) == normalized
+
+    @pytest.mark.parametrize("pattern, normalized", [
+        ("flask_sqlalchemy", "flask-sqlalchemy"),
+        ("flask\\.ext.*", "flask-ext.*"),
+        ("a-_\\-b", "a-b"),
+        ("[a_z]+_x", "[a_z]+-x"),
+        ("flask.ext", "flask.ext"),
+        ("\\d+_\\w", "\\d+-\\w"),
+    ])
+    def test_normalize_pattern(self, pattern, normalized):
+        from src.pypi_search_caching.pypi_search_caching import normalize_pattern
+        assert normalize_pattern(pattern) == normalized
+
+    def test_save_writes_parallel_normalized_names(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(self.names)
+        norm = psc.NAMES_NORM_FILE.read_text(encoding="utf-8").splitlines()
+        assert norm == [psc.normalize_name(n) for n in sorted(self.names)]
+
+    @pytest.mark.parametrize("query, found", [
+        ("flask.sqlalchemy", "Flask-SQLAlchemy"),
+        ("FLASK_SQLALCHEMY", "Flask-SQLAlchemy"),
+        ("flask-ext-cache", "Flask.Ext.Cache"),
+        ("pillow", "Pillow"),
+        ("flask", None),
+    ])
+    def test_lookup_normalized(self, query, found):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(self.names)
+        buf = psc.get_names_buffer()
+        assert psc.lookup_normalized(buf, psc.open_names_index(buf), query) == found
+
+    @pytest.mark.parametrize("pattern, expected", [
+        ("Flask_SQLAlchemy", ["Flask-SQLAlchemy"]),
+        ("flask_.*", ["Flask-SQLAlchemy", "Flask.Ext.Cache", "flask_login"]),
+        ("flask\\.ext\\..*", ["Flask.Ext.Cache"]),
+        ("pillow.*", ["Pillow", "pillow-heif"]),
+        ("caf\u00e9.*", ["caf\u00e9-utils"]),  # non-ASCII: per-name fallback
+        ("nothing", []),
+    ])
+    def test_search_matches_list_scan(self, pattern, expected):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        CacheManager().save(self.names)
+        buf = psc.get_names_buffer()
+        assert psc.search_names_normalized(buf, psc.open_names_index(buf), pattern) == expected
+        assert psc.scan_names_normalized(sorted(self.names), pattern) == expected
+
+    def test_details_cache_keyed_by_normalized_name(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "lmdb")
+        env = init_lmdb_env()
+        headers = {"timestamp": time.time(), "etag": None, "last_modified": None}
+        store_package_data(env, "Flask_SQLAlchemy", headers, '{"info": {}}')
+        for spelling in ("flask-sqlalchemy", "Flask.SQLAlchemy", "FLASK_SQLALCHEMY"):
+            assert retrieve_package_data(env, spelling)["json"] == '{"info": {}}'
+        meta = CacheManager.details_dbs(env)[psc_attr("LMDB_META_DB")]
+        with env.begin() as txn:
+            assert [bytes(k) for k, _ in txn.cursor(db=meta)] == [b"flask-sqlalchemy"]
+        env.close()
+
+    def test_main_normalized_exact(self, capsys):
+        CacheManager().save(self.names)
+        sys.argv = ['script', 'flask.sqlalchemy', '--normalized']
+        main()
+        out = strip_ansi(capsys.readouterr().out)
+        assert "1. Flask-SQLAlchemy" in out and "Total: 1" in out
+
+    def test_main_normalized_scan_fallback(self, capsys):
+        sys.argv = ['script', 'flask_.*', '-n', '--engine', 'scan']
+        with patch('src.pypi_search_caching.pypi_search_caching.get_packages', return_value=sorted(self.names)):
+            main()
+        assert "Total: 3" in strip_ansi(capsys.readouterr().out)
+
+
+class TestSharedLMDBEnv:
+    def cache_details(self, *names):
+        env = CacheManager.shared_env()
+        for name in names:
+            store_package_data(env, name, {"timestamp": time.time()}, json.dumps({"info": {"version": "1.0"}}))
+
+    def test_opened_once_per_process(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        self.cache_details("flask", "django")
+        CacheManager.close_shared_env()
+        with patch.object(psc, 'init_lmdb_env', wraps=psc.init_lmdb_env) as mock_init:
+            for name in ("flask", "django", "flask"):
+                assert "**Version:** `1.0`" in fetch_project_details(name)
+            CacheManager().load()
+        mock_init.assert_called_once()
+        assert CacheManager().shared_env() is CacheManager.shared_env()
+
+    def test_reopened_for_another_lmdb_dir(self, tmp_path, monkeypatch):
+        first = CacheManager.shared_env()
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "other")
+        second = CacheManager.shared_env()
+        assert second is not first
+        assert second.path() == str(tmp_path / "other")
+
+    def test_batch_defers_puts_until_exit(self):
+        env = CacheManager.shared_env()
+        with CacheManager.batch():
+            self.cache_details("flask")
+            assert not committed(env, b"flask")
+            # Pending puts are visible to this thread's reads
+            assert retrieve_package_data(env, "Flask")["json"] == '{"info": {"version": "1.0"}}'
+        assert retrieve_package_data(env, "flask") is not None
+        assert committed(env, b"flask")
+
+    def test_names_record_commits_inside_batch(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        env = CacheManager.shared_env()
+
+        def record():
+            with env.begin() as txn:
+                return bytes(txn.get(b"all_packages"))
+
+        with CacheManager.batch():
+            self.cache_details("flask")
+            CacheManager().save(["a", "b"])
+            # The names buffer files are on disk: their record must be too
+            header = psc.decode_names_record(record(), with_names=False)
+            assert psc.open_names_buffer(header)[:] == b"a\nb\n"
+            assert CacheManager().touch()
+            assert psc.decode_names_record(record(), with_names=False)["timestamp"] > header["timestamp"]
+            assert not committed(env, b"flask")  # details stores still wait for the batch
+        assert committed(env, b"flask")
+
+    def test_batch_commits_every_size_records(self):
+        env = CacheManager.shared_env()
+        with CacheManager.batch(size=2):
+            self.cache_details("a", "b", "c")
+            assert [committed(env, k) for k in (b"a", b"b", b"c")] == [True, True, False]
+        for name in "abc":
+            assert retrieve_package_data(env, name) is not None
+
+    def test_batch_commits_after_interval(self, monkeypatch):
+        env = CacheManager.shared_env()
+        clock = [100.0]
+        monkeypatch.setattr('time.monotonic', lambda: clock[0])
+        with CacheManager.batch(interval=0.5):
+            self.cache_details("a")
+            clock[0] += 0.4
+            self.cache_details("b")
+            assert not committed(env, b"a")
+            clock[0] += 0.2  # the oldest buffered record is now 0.6 s old
+            self.cache_details("c")
+            assert all(committed(env, k) for k in (b"a", b"b", b"c"))
+            self.cache_details("d")
+            assert not committed(env, b"d")
+
+    @pytest.mark.parametrize("exc", [ValueError, KeyboardInterrupt, SystemExit])
+    def test_batch_flushes_on_error(self, exc):
+        with pytest.raises(exc):
+            with CacheManager.batch():
+                self.cache_details("flask")
+                raise exc
+        assert committed(CacheManager.shared_env(), b"flask")
+
+    def test_no_sync_env(self, monkeypatch):
+        monkeypatch.setattr(CacheManager, "sync", False)
+        env = CacheManager.shared_env()
+        assert not env.flags()["sync"] and not env.flags()["metasync"]
+        with CacheManager.batch():
+            self.cache_details("flask")
+        assert committed(env, b"flask")
+        CacheManager.close_shared_env()
+        assert committed(CacheManager.shared_env(), b"flask")
+
+    def test_batch_is_per_thread(self):
+        import threading
+        results = []
+        with CacheManager.batch():
+            thread = threading.Thread(target=lambda: (self.cache_details("other"),
+                                                      results.append(committed(CacheManager.shared_env(),
+                                                                               b"other"))))
+            thread.start()
+            thread.join()
+        assert results == [True]  # written through, not into this thread's batch
+
+    def test_prefetch_workers_store_into_the_batch(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        names = [f"pkg{i}" for i in range(40)]
+        CacheManager.shared_env()
+
+        def fetch(name):
+            self.cache_details(name)
+            return retrieve_package_data(CacheManager.shared_env(), name) is not None  # sees its own puts
+
+        with patch.object(psc, 'write_with_growth', wraps=psc.write_with_growth) as mock_write:
+            with CacheManager.batch(interval=60):
+                assert all(psc.map_prefetched(fetch, names, concurrency=8))
+                assert mock_write.call_count == 0
+            assert mock_write.call_count == 1  # 40 stores from 8 threads, one commit
+        assert all(committed(CacheManager.shared_env(), n.encode()) for n in names)
+
+    def test_prefetch_worker_stores_kept_on_error(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+
+        def fetch(name):
+            self.cache_details(name)
+            if name == "bad":
+                raise ValueError(name)
+
+        with pytest.raises(ValueError), CacheManager.batch():
+            list(psc.map_prefetched(fetch, ["good", "bad"], concurrency=2))
+        assert committed(CacheManager.shared_env(), b"good") and committed(CacheManager.shared_env(), b"bad")
+
+    def test_get_package_long_description_keeps_env_open(self):
+        env = CacheManager.shared_env()
+        store_package_data(env, "pkg", {"timestamp": time.time()}, json.dumps({"info": {"description": "Hi"}}))
+        from src.pypi_search_caching.pypi_search_caching import get_package_long_description
+        assert get_package_long_description("pkg") == "Hi"
+        assert CacheManager.shared_env() is env
+        assert retrieve_package_data(env, "pkg") is not None  # still usable
+
+
+class TestExpiryIndex:
+    def index_keys(self, env):
+        import struct
+        with env.begin() as txn:
+            return [(struct.unpack(">d", k[:8])[0], bytes(k[8:]))
+                    for k, _ in txn.cursor(db=CacheManager.details_dbs(env)[psc_attr("LMDB_EXPIRY_DB")])]
+
+    def store(self, env, name, timestamp):
+        store_package_data(env, name, {"timestamp": timestamp}, '{"info": {}}')
+
+    def test_store_reindexes_entry(self):
+        env = CacheManager.shared_env()
+        self.store(env, "Flask", 100.0)
+        self.store(env, "flask", 200.0)
+        with CacheManager.batch():
+            self.store(env, "django", 50.0)
+        assert self.index_keys(env) == [(50.0, b"django"), (200.0, b"flask")]
+
+    def test_prune_deletes_only_expired(self):
+        from src.pypi_search_caching.pypi_search_caching import prune_lmdb_cache, LMDB_CACHE_MAX_AGE_SECONDS
+        env = CacheManager.shared_env()
+        now = time.time()
+        self.store(env, "old", now - LMDB_CACHE_MAX_AGE_SECONDS - 10)
+        self.store(env, "older", now - LMDB_CACHE_MAX_AGE_SECONDS - 20)
+        self.store(env, "new", now)
+        CacheManager().save(["new", "old"])
+        assert prune_lmdb_cache(env) == 2
+        assert [k for _, k in self.index_keys(env)] == [b"new"]
+        assert retrieve_package_data(env, "old") is None
+        assert retrieve_package_data(env, "new") is not None
+        assert CacheManager().load() == ["new", "old"]
+        assert prune_lmdb_cache(env) == 0
+
+    def test_index_built_from_existing_entries(self, tmp_path, monkeypatch):
+        from src.pypi_search_caching.pypi_search_caching import prune_lmdb_cache, LMDB_CACHE_MAX_AGE_SECONDS
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', tmp_path / "lmdb")
+        env = init_lmdb_env()
+
+        with env.begin(write=True) as txn:  # written before the index existed
+            txn.put(b"old", legacy_entry(time.time() - LMDB_CACHE_MAX_AGE_SECONDS - 1))
+            txn.put(b"fresh", legacy_entry(time.time()))
+            txn.put(b"broken", b"\x00")
+        assert prune_lmdb_cache(env) == 2
+        assert retrieve_package_data(env, "fresh") is not None
+        assert retrieve_package_data(env, "old") is None
+        with env.begin() as txn:
+            assert txn.get(b"broken") is None
+        env.close()
+
+    def test_prune_expired_runs_once_per_interval(self, monkeypatch):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        env = CacheManager.shared_env()
+        store_package_data(env, "flask", {"timestamp": time.time()}, '{"info": {"version": "1.0"}}')
+        now = time.time()
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.time.time', lambda: now)
+        with patch.object(psc, 'prune_lmdb_cache', return_value=0) as mock_prune:
+            for _ in range(3):
+                assert "1.0" in fetch_project_details("flask")
+            psc.get_package_long_description("flask")
+            assert mock_prune.call_count == 1
+            now += psc.LMDB_PRUNE_INTERVAL_SECONDS
+            fetch_project_details("flask")
+            assert mock_prune.call_count == 2
+
+
+class TestDetailsLayout:
+    info = {"info": {"version": "2.0", "summary": "S", "description": "Long text"}}
+
+    def dbs_read(self, fn):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        with patch.object(psc.CacheManager, 'get_many', wraps=psc.CacheManager.get_many) as mock_get:
+            result = fn()
+        return result, [db for c in mock_get.call_args_list for db, _ in c.args[0]]
+
+    @pytest.mark.parametrize("headers", [
+        {"timestamp": 12.5},
+        {"timestamp": 12.5, "etag": None, "last_modified": None},
+        {"timestamp": 12.5, "etag": '"abc"', "last_modified": "Wed, 21 Oct 2015 07:28:00 GMT"},
+        {"timestamp": 12.5, "etag": ""},
+    ])
+    def test_meta_roundtrip(self, headers):
+        from src.pypi_search_caching.pypi_search_caching import encode_details_meta, decode_details_meta, CODEC_ZLIB
+        meta = decode_details_meta(encode_details_meta(headers, "1.0\u00e9", CODEC_ZLIB))
+        assert meta == {"headers": headers, "version": "1.0\u00e9", "codec": CODEC_ZLIB}
+        assert decode_details_meta(encode_details_meta(headers, None, CODEC_ZLIB))["version"] is None
+
+    def test_readers_touch_only_their_parts(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        env = CacheManager.shared_env()
+        store_package_data(env, "pkg", {"timestamp": time.time()}, json.dumps(self.info), "## md")
+        cached, dbs = self.dbs_read(lambda: retrieve_package_data(env, "pkg", parts=("desc",)))
+        assert dbs == [psc.LMDB_META_DB, psc.LMDB_DESC_DB]
+        assert cached["desc"] == "Long text" and cached["version"] == "2.0" and cached["json"] is None
+        desc, dbs = self.dbs_read(lambda: psc.get_package_long_description("pkg"))
+        assert desc == "Long text" and psc.LMDB_JSON_DB not in dbs
+        md, dbs = self.dbs_read(lambda: fetch_project_details("pkg", include_desc=True))
+        assert md == "## md" and psc.LMDB_JSON_DB not in dbs
+        md, dbs = self.dbs_read(lambda: fetch_project_details("pkg"))
+        assert "**Version:** `2.0`" in md and psc.LMDB_MD_DB not in dbs
+
+    def test_entry_read_in_one_transaction(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        env = CacheManager.shared_env()
+        store_package_data(env, "pkg", {"timestamp": time.time()}, json.dumps(self.info), "## md")
+        with patch.object(psc.CacheManager, 'read_txn', wraps=psc.CacheManager.read_txn) as mock_txn:
+            cached = retrieve_package_data(env, "pkg", parts=("json", "md", "desc"))
+        assert mock_txn.call_count == 1
+        assert cached["md"] == "## md" and cached["desc"] == "Long text"
+
+    def test_details_without_stored_markdown_use_json(self):
+        env = CacheManager.shared_env()
+        store_package_data(env, "pkg", {"timestamp": time.time()}, json.dumps(self.info))
+        assert "**Summary:** S" in fetch_project_details("pkg", include_desc=True)
+
+    def test_store_without_markdown_drops_stale_one(self):
+        env = CacheManager.shared_env()
+        store_package_data(env, "pkg", {"timestamp": time.time()}, json.dumps(self.info), "## old")
+        store_package_data(env, "pkg", {"timestamp": time.time()}, json.dumps(self.info))
+        assert retrieve_package_data(env, "pkg")["md"] is None
+
+    def test_touch_replaces_headers_only(self):
+        from src.pypi_search_caching.pypi_search_caching import touch_package_data
+        env = CacheManager.shared_env()
+        assert not touch_package_data(env, "pkg", {"timestamp": 2.0})
+        store_package_data(env, "pkg", {"timestamp": 1.0, "etag": '"a"'}, json.dumps(self.info), "## md")
+        assert touch_package_data(env, "PKG", {"timestamp": 2.0, "etag": '"a"'})
+        cached = retrieve_package_data(env, "pkg", parts=("json", "md", "desc"))
+        assert cached["headers"] == {"timestamp": 2.0, "etag": '"a"'}
+        assert cached["md"] == "## md" and cached["desc"] == "Long text" and cached["version"] == "2.0"
+
+    def test_legacy_entries_migrated_on_open(self, tmp_path, monkeypatch):
+        import lmdb
+        import src.pypi_search_caching.pypi_search_caching as psc
+        path = tmp_path / "lmdb"
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', path)
+        now = time.time()
+        path.mkdir()
+        env = lmdb.open(str(path))  # a cache written before the sub-databases existed
+        with env.begin(write=True) as txn:
+            txn.put(b"Old_Pkg", legacy_entry(now, md_data="## rendered"))
+            txn.put(b"plain", legacy_entry(now - 5))
+            txn.put(b"corrupt", b"\x00\x00\x00\x01x")
+            txn.put(b"all_packages", b"names record")
+        env.close()
+
+        env = CacheManager.shared_env()
+        cached = retrieve_package_data(env, "old-pkg", parts=("json", "md", "desc"))
+        assert cached["headers"] == {"timestamp": now, "etag": '"e"'}
+        assert cached["md"] == "## rendered" and cached["desc"] == "Old" and cached["version"] == "0.9"
+        assert retrieve_package_data(env, "plain")["json"] == '{"info": {"version": "0.9", "description": "Old"}}'
+        with env.begin() as txn:
+            main = [bytes(k) for k, _ in txn.cursor() if not k.startswith(b"_")]
+            index = [bytes(k[8:]) for k, _ in txn.cursor(db=CacheManager.details_dbs(env)[psc.LMDB_EXPIRY_DB])]
+        assert main == [b"all_packages", b"corrupt"]  # unreadable entries wait for the next prune
+        assert sorted(index) == [b"corrupt", b"old-pkg", b"plain"]
+        assert psc.prune_lmdb_cache(env) == 1
+
+
+class TestLMDBSettings:
+    def write_config(self, text):
+        config = psc_attr("CONFIG_FILE")
+        config.parent.mkdir(parents=True, exist_ok=True)
+        config.write_text(text)
+
+    def test_defaults(self):
+        from src.pypi_search_caching.pypi_search_caching import lmdb_settings, LMDB_DEFAULTS
+        assert lmdb_settings() == LMDB_DEFAULTS
+
+    def test_config_file_then_environment(self, monkeypatch):
+        from src.pypi_search_caching.pypi_search_caching import lmdb_settings
+        self.write_config('[lmdb]\nmap_size = "1M"\nmax_map_size = 4194304\nwritemap = true\nmax_readers = 64\n')
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_MAX_MAP_SIZE", "2GiB")
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_READAHEAD", "yes")
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_WRITEMAP", "0")
+        assert lmdb_settings() == {"map_size": 1024**2, "max_map_size": 2 * 1024**3,
+                                   "writemap": False, "readahead": True, "max_readers": 64, "lock": True}
+
+    def test_invalid_values_ignored(self, monkeypatch, caplog):
+        from src.pypi_search_caching.pypi_search_caching import lmdb_settings, LMDB_DEFAULTS
+        self.write_config('[lmdb]\nbogus = 1\nmap_size = "lots"\n')
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_WRITEMAP", "maybe")
+        with caplog.at_level(logging.WARNING):
+            assert lmdb_settings() == LMDB_DEFAULTS
+        assert len(caplog.records) == 3
+        self.write_config("not toml [")
+        assert lmdb_settings() == LMDB_DEFAULTS
+
+    def test_env_opened_with_settings(self, monkeypatch):
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_MAP_SIZE", "2M")
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_MAX_READERS", "20")
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_WRITEMAP", "1")
+        env = CacheManager.shared_env()
+        assert env.info()["map_size"] == 2 * 1024**2 and env.info()["max_readers"] == 20
+        assert env.flags()["writemap"]
+
+    def test_map_grows_when_full(self, monkeypatch):
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_MAP_SIZE", "256K")
+        env = CacheManager.shared_env()
+        big = json.dumps({"info": {"description": os.urandom(200_000).hex()}})
+        for i in range(5):
+            store_package_data(env, f"pkg{i}", {"timestamp": time.time()}, big)
+        assert env.info()["map_size"] > 256 * 1024
+        assert all(retrieve_package_data(env, f"pkg{i}", parts=("desc",)) for i in range(5))
+
+    def test_full_at_ceiling(self, monkeypatch, caplog):
+        import lmdb
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_MAP_SIZE", "256K")
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_MAX_MAP_SIZE", "512K")
+        env = CacheManager.shared_env()
+        big = json.dumps({"info": {"description": os.urandom(200_000).hex()}})
+        with pytest.raises(lmdb.MapFullError), caplog.at_level(logging.WARNING):
+            for i in range(10):
+                store_package_data(env, f"pkg{i}", {"timestamp": time.time()}, big)
+        assert env.info()["map_size"] == 512 * 1024
+        assert "reached max_map_size (524,288 bytes)" in caplog.text
+
+    def test_map_grows_once_other_threads_transactions_end(self, monkeypatch):
+        import threading
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_MAP_SIZE", "256K")
+        env = CacheManager.shared_env()
+        store_package_data(env, "small", {"timestamp": time.time()}, json.dumps({"info": {"name": "small"}}))
+        big = json.dumps({"info": {"description": os.urandom(200_000).hex()}})
+        opened, release, seen = threading.Event(), threading.Event(), []
+
+        def reader():
+            with CacheManager.read_txn(env):
+                opened.set()
+                release.wait(5)
+                seen.append(retrieve_package_data(env, "small", parts=("json",)))
+
+        def writer():
+            for i in range(3):
+                store_package_data(env, f"pkg{i}", {"timestamp": time.time()}, big)
+
+        threads = [threading.Thread(target=reader), threading.Thread(target=writer)]
+        threads[0].start()
+        opened.wait(5)
+        threads[1].start()
+        threads[1].join(0.3)
+        assert threads[1].is_alive()  # the resize waits for the open read transaction
+        assert env.info()["map_size"] == 256 * 1024
+        release.set()
+        for thread in threads:
+            thread.join(10)
+        assert seen[0] is not None and env.info()["map_size"] > 256 * 1024
+        assert all(retrieve_package_data(env, f"pkg{i}", parts=("desc",)) for i in range(3))
+
+    def test_map_grows_under_concurrent_writers(self, monkeypatch):
+        import threading
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_MAP_SIZE", "256K")
+        env = CacheManager.shared_env()
+        big = json.dumps({"info": {"description": os.urandom(100_000).hex()}})
+        errors = []
+
+        def writer(n):
+            try:
+                for i in range(4):
+                    store_package_data(env, f"pkg{n}-{i}", {"timestamp": time.time()}, big)
+                    assert retrieve_package_data(env, f"pkg{n}-{i}", parts=("desc",))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        assert errors == []
+        assert env.info()["map_size"] > 256 * 1024
+
+
+class TestConcurrentLMDBAccess:
+    def test_readers_and_writers_in_separate_processes(self, tmp_path):
+        from src.test.stress_lmdb import run_stress
+        stats = run_stress(tmp_path / "stress", readers=2, writers=2, seconds=1.0)
+        assert stats["writes"] > 0 and stats["hits"] > 0
+        assert stats["bad_reads"] == 0
+        assert stats["problems"] == []
+
+    def test_stale_reader_slot_reclaimed(self, monkeypatch):
+        # The killed process's slot fills a two-slot reader table until a reader check frees it
+        from src.test.stress_lmdb import leave_stale_reader
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_MAX_READERS", "2")
+        env = CacheManager.shared_env()
+        store_package_data(env, "pkg", {"timestamp": time.time()}, json.dumps({"info": {"name": "pkg"}}))
+        pid = leave_stale_reader(psc_attr("LMDB_DIR"))
+        assert f" {pid} " in env.readers()
+        with CacheManager.read_txn():
+            assert retrieve_package_data(env, "pkg", parts=("json",)) is not None
+        assert f" {pid} " not in env.readers()
+
+    def test_lock_can_be_disabled(self, monkeypatch):
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_LOCK", "false")
+        env = CacheManager.shared_env()
+        store_package_data(env, "pkg", {"timestamp": time.time()}, json.dumps({"info": {"name": "pkg"}}))
+        assert retrieve_package_data(env, "pkg", parts=("json",)) is not None
+        assert not (psc_attr("LMDB_DIR") / "lock.mdb").exists()
+
+
+class TestJSONProjection:
+    data = {
+        "info": {"name": "Pkg", "version": "2.0", "summary": "S", "description": "Long", "requires_python": ">=3.9",
+                 "home_page": "https://example.org", "project_urls": {"Source": "https://src"},
+                 "classifiers": ["Topic :: Test"], "author": "Someone", "downloads": {"last_day": -1}},
+        "releases": {
+            "1.0": [{"filename": "a.whl", "upload_time": "2020-01-02T00:00:00",
+                     "upload_time_iso_8601": "2020-01-02T00:00:00.1Z"},
+                    {"filename": "a.tar.gz", "upload_time": "2020-01-01T00:00:00",
+                     "upload_time_iso_8601": "2020-01-01T00:00:00.1Z"}],
+            "1.5": [],
+            "2.0": [{"filename": "b.whl", "upload_time": "2021-01-01T00:00:00"}],
+        },
+        "urls": [{"filename": "b.whl"}],
+        "vulnerabilities": [],
+    }
+
+    def test_projection_keeps_used_fields_and_release_times(self):
+        from src.pypi_search_caching.pypi_search_caching import project_package_json, DETAILS_INFO_FIELDS
+        slim = project_package_json(self.data)
+        assert set(slim) == {"info", "release_times"}
+        assert set(slim["info"]) == set(DETAILS_INFO_FIELDS) - {"release_url"}
+        assert slim["release_times"] == {"1.0": "2020-01-01T00:00:00.1Z", "1.5": None, "2.0": "2021-01-01T00:00:00"}
+        assert list(slim["release_times"]) == ["1.0", "1.5", "2.0"]
+        assert project_package_json({}) == {"info": {}, "release_times": {}}
+
+    def fetch(self, name):
+        resp = MagicMock(status_code=200, json=lambda: self.data, raise_for_status=lambda: None, headers={})
+        with patch('requests.Session.get', return_value=resp):
+            return fetch_project_details(name)
+
+    def test_cached_projection_renders_like_the_full_document(self):
+        env = CacheManager.shared_env()
+        fresh = self.fetch("pkg")
+        stored = json.loads(retrieve_package_data(env, "pkg")["json"])
+        assert "releases" not in stored and "author" not in stored["info"]
+        with patch('requests.Session.get') as mock_get:
+            assert fetch_project_details("pkg") == fresh
+        mock_get.assert_not_called()
+        assert retrieve_package_data(env, "pkg", parts=("desc",))["desc"] == "Long"
+
+    def test_full_json_opt_out(self, monkeypatch):
+        monkeypatch.setattr(CacheManager, "full_json", False)
+        monkeypatch.setattr(sys, 'argv', ['script', '--full-json', '--no-daemon', '--count-only', 'x'])
+        with patch('src.pypi_search_caching.pypi_search_caching.get_packages', return_value=[]):
+            main()
+        assert CacheManager.full_json
+        self.fetch("pkg")
+        assert json.loads(retrieve_package_data(CacheManager.shared_env(), "pkg")["json"]) == self.data
+
+
+@pytest.mark.skipif(psc_attr("zstandard") is None, reason="needs zstandard")
+class TestZstdDictionaryCodec:
+    def fill(self, env, n=150, codec=None):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        for i in range(n):
+            doc = {"info": {"name": f"pkg{i}", "version": f"1.{i}", "description": f"Project number {i}. " * (i % 7 + 1),
+                            "classifiers": ["License :: OSI Approved :: MIT License", "Programming Language :: Python :: 3"]},
+                   "urls": [{"url": f"https://files.pythonhosted.org/packages/pkg{i}-1.{i}.tar.gz"}]}
+            if codec is None:
+                store_package_data(env, f"pkg{i}", {"timestamp": time.time()}, json.dumps(doc))
+            else:
+                items = psc._details_items(f"pkg{i}".encode(), {"timestamp": time.time()}, json.dumps(doc), codec=codec)
+                CacheManager.put_many(items, env=env)
+
+    def codec_of(self, name):
+        from src.pypi_search_caching.pypi_search_caching import decode_details_meta, LMDB_META_DB
+        return decode_details_meta(CacheManager.get(name, db=LMDB_META_DB))["codec"]
+
+    def test_recompress_converts_zlib_entries_in_place(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        env = CacheManager.shared_env()
+        self.fill(env, codec=psc.CODEC_ZLIB)
+        before = retrieve_package_data(env, "pkg42", parts=("json", "desc"))
+        stats = psc.recompress_details_cache(env)
+        assert stats["entries"] == stats["recompressed"] == 150
+        assert stats["bytes_after"] < stats["bytes_before"]
+        assert self.codec_of(b"pkg42") == psc.CODEC_ZSTD_DICT
+        assert retrieve_package_data(env, "pkg42", parts=("json", "desc")) == before
+        assert psc.recompress_details_cache(env, train=False)["recompressed"] == 0
+
+    def test_new_entries_use_current_dictionary(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        env = CacheManager.shared_env()
+        self.fill(env)
+        assert self.codec_of(b"pkg1") == psc.CODEC_ZSTD
+        dict_id = psc.train_details_dictionary(env)
+        store_package_data(env, "fresh", {"timestamp": time.time()}, json.dumps({"info": {"description": "New"}}))
+        assert self.codec_of(b"fresh") == psc.CODEC_ZSTD_DICT
+        assert psc.zstd_frame_dict_id(CacheManager.get(b"fresh", db=psc.LMDB_DESC_DB)) == dict_id
+        assert retrieve_package_data(env, "fresh", parts=("desc",))["desc"] == "New"
+
+    def test_retraining_keeps_older_entries_readable(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        env = CacheManager.shared_env()
+        self.fill(env)
+        first = psc.recompress_details_cache(env)
+        store_package_data(env, "other", {"timestamp": time.time()}, json.dumps({"info": {"description": "x" * 500}}))
+        old_id = psc.zstd_frame_dict_id(CacheManager.get(b"pkg3", db=psc.LMDB_JSON_DB))
+        new_id = psc.train_details_dictionary(env, size=16 * 1024)
+        assert new_id != old_id and first["recompressed"] == 150
+        CacheManager.close_shared_env()  # reload the dictionaries from disk
+        env = CacheManager.shared_env()
+        assert json.loads(retrieve_package_data(env, "pkg3")["json"])["info"]["version"] == "1.3"
+        assert retrieve_package_data(env, "other", parts=("desc",))["desc"] == "x" * 500
+
+    def test_too_few_entries_train_no_dictionary(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        env = CacheManager.shared_env()
+        self.fill(env, n=10)
+        assert psc.train_details_dictionary(env) is None
+        assert CacheManager.details_codec(env) == (psc.CODEC_ZSTD, None)
+
+    def test_decompression_context_is_reused(self):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        assert psc._zstd_context(False) is psc._zstd_context(False)
+        assert psc._zstd_context(True) is not psc._zstd_context(False)
+
+    def test_recompress_flag(self, monkeypatch, capsys):
+        env = CacheManager.shared_env()
+        self.fill(env)
+        monkeypatch.setattr(sys, 'argv', ['script', '--recompress'])
+        main()
+        assert "Recompressed 150 of 150 cached projects" in capsys.readouterr().out
+
+
+@pytest.mark.skipif(not hasattr(__import__('socket'), 'AF_UNIX'), reason="needs Unix sockets")
+class TestSearchDaemon:
+    names = sorted(["aiohttp", "aiofiles", "django", "Flask-SQLAlchemy", "flask", "requests"])
+
+    @pytest.fixture
+    def daemon(self, monkeypatch):
+        # tmp_path is too long for an AF_UNIX address on some systems
+        import shutil
+        import tempfile
+        import threading
+        import src.pypi_search_caching.pypi_search_caching as psc
+        sock_dir = tempfile.mkdtemp(prefix="pss", dir="/tmp")
+        sock = Path(sock_dir) / "d.sock"
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.DAEMON_SOCKET', sock)
+        CacheManager().save(self.names)
+        server = psc.make_daemon_server()
+        server.search_daemon.current()  # load before tests patch the in-process path
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        shutil.rmtree(sock_dir)
+
+    def test_search_and_count(self, daemon):
+        from src.pypi_search_caching.pypi_search_caching import daemon_request
+        assert daemon_request({"op": "ping"})["pid"] == os.getpid()
+        assert daemon_request({"op": "search", "pattern": "aio.*"})["matches"] == ["aiofiles", "aiohttp"]
+        assert daemon_request({"op": "count", "pattern": "flask.*", "ignore_case": True})["count"] == 2
+        assert daemon_request({"op": "search", "pattern": "flask_sqlalchemy",
+                               "normalized": True})["matches"] == ["Flask-SQLAlchemy"]
+        assert daemon_request({"op": "search", "pattern": ".*o.*", "engine": "scan"})["matches"] == \
+            ["aiofiles", "aiohttp", "django"]
+
+    def test_errors_return_none(self, daemon):
+        from src.pypi_search_caching.pypi_search_caching import daemon_request
+        assert daemon_request({"op": "bogus"}) is None
+        assert daemon_request({"op": "search", "pattern": "("}) is None
+        # The connection survives a failed request
+        assert daemon_request({"op": "ping"}) is not None
+
+    def test_reloads_after_cache_refresh(self, daemon):
+        from src.pypi_search_caching.pypi_search_caching import daemon_request
+        assert daemon_request({"op": "count", "pattern": "new.*"})["count"] == 0
+        CacheManager().save(self.names + ["newpkg"])
+        assert daemon_request({"op": "search", "pattern": "new.*"})["matches"] == ["newpkg"]
+
+    def test_expired_cache_is_not_served(self, daemon):
+        from src.pypi_search_caching.pypi_search_caching import daemon_request
+        with patch('src.pypi_search_caching.pypi_search_caching.time.time',
+                   return_value=time.time() + CACHE_MAX_AGE_SECONDS + 1):
+            assert daemon_request({"op": "search", "pattern": "aio.*"}) is None
+
+    def test_details(self, daemon):
+        from src.pypi_search_caching.pypi_search_caching import daemon_request
+        with patch('src.pypi_search_caching.pypi_search_caching.fetch_project_details',
+                   return_value="**flask**") as mock_fetch:
+            reply = daemon_request({"op": "details", "package": "flask", "include_desc": True})
+        assert reply["md"] == "**flask**"
+        mock_fetch.assert_called_once_with("flask", include_desc=True, validate_cache=False)
+
+    def test_refuses_second_daemon(self, daemon):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        with pytest.raises(RuntimeError, match="already listening"):
+            psc.make_daemon_server()
+
+    def test_no_daemon_or_stale_socket(self, tmp_path):
+        import socket
+        from src.pypi_search_caching.pypi_search_caching import daemon_request
+        assert daemon_request({"op": "ping"}, socket_path=tmp_path / "missing.sock") is None
+        stale = tmp_path / "s"
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(str(stale))
+        sock.close()  # file left behind, nobody listening
+        assert daemon_request({"op": "ping"}, socket_path=stale) is None
+
+    def test_main_uses_daemon(self, daemon, capsys):
+        sys.argv = ['script', 'aio.*']
+        with patch('src.pypi_search_caching.pypi_search_caching.get_names_buffer') as mock_buf, \
+                patch('src.pypi_search_caching.pypi_search_caching.get_packages') as mock_get:
+            main()
+        mock_buf.assert_not_called()
+        mock_get.assert_not_called()
+        out = strip_ansi(capsys.readouterr().out)
+        assert "1. aiofiles" in out and "Total: 2" in out
+
+    def test_main_count_only_uses_daemon(self, daemon, capsys):
+        sys.argv = ['script', 'flask.*', '-i', '--count-only']
+        with patch('src.pypi_search_caching.pypi_search_caching.get_names_buffer') as mock_buf:
+            main()
+        mock_buf.assert_not_called()
+        assert "Found 2 matching packages." in strip_ansi(capsys.readouterr().out)
+
+    def test_main_no_daemon(self, daemon, capsys):
+        sys.argv = ['script', 'aio.*', '--no-daemon']
+        with patch('src.pypi_search_caching.pypi_search_caching.daemon_request') as mock_request:
+            main()
+        mock_request.assert_not_called()
+        assert "Total: 2" in strip_ansi(capsys.readouterr().out)
+
+    def test_main_requires_pattern_without_serve(self):
+        sys.argv = ['script']
+        with pytest.raises(SystemExit):
+            main()
+
+
+class TestRunStats:
+    @pytest.fixture(autouse=True)
+    def stats(self):
+        from src.pypi_search_caching.pypi_search_caching import run_stats
+        run_stats.reset()
+        yield run_stats
+        run_stats.reset()
+
+    def test_counters_bytes_and_latency(self):
+        from src.pypi_search_caching.pypi_search_caching import RunStats
+        stats = RunStats()
+        stats.count("details", "hit", 3)
+        stats.count("details", "miss")
+        stats.add_bytes("downloaded", 1000)
+        for ms in (0.2, 3, 3, 40, 700):
+            stats.observe("http.json", ms / 1e3)
+        snap = stats.snapshot()
+        assert snap["counters"] == {"details.hit": 3, "details.miss": 1}
+        assert snap["bytes"] == {"downloaded": 1000}
+        lat = snap["latency"]["http.json"]
+        assert lat["count"] == 5 and lat["max_ms"] == 700 and lat["mean_ms"] == pytest.approx(149.24)
+        assert lat["p50_ms"] == 5 and lat["p95_ms"] == 700
+        assert lat["buckets_ms"]["0.25"] == 1 and lat["buckets_ms"]["5"] == 2 and lat["buckets_ms"]["inf"] == 0
+        text = stats.format()
+        assert re.search(r"details\s+3\s+1\s+0\s+0\s+0\s+0", text)
+        assert "http.json" in text
+
+    def test_timed_block_observed_when_raising(self, stats):
+        with pytest.raises(ValueError), stats.timed("lmdb.read"):
+            raise ValueError
+        assert stats.snapshot()["latency"]["lmdb.read"]["count"] == 1
+
+    def test_details_miss_then_hit(self, stats):
+        body = json.dumps({"info": {"version": "1.0", "summary": "Test pkg", "description": "Long text"}}).encode()
+        resp = MagicMock(status_code=200, content=body, headers={}, raise_for_status=lambda: None)
+        resp.json = lambda: json.loads(body)
+        with patch('requests.Session.get', return_value=resp):
+            fetch_project_details("testpkg")
+            fetch_project_details("testpkg")
+        missing = MagicMock(status_code=404, content=b"", headers={})
+        with patch('requests.Session.get', return_value=missing):
+            assert fetch_project_details("nopkg") is None
+        snap = stats.snapshot()
+        assert snap["counters"] == {"details.hit": 1, "details.miss": 2, "details.404": 1}
+        assert snap["bytes"]["downloaded"] == len(body)
+        assert snap["bytes"]["decompressed"] > 0
+        assert snap["latency"]["http.json"]["count"] == 2
+        assert {"lmdb.read", "lmdb.commit"} <= set(snap["latency"])
+
+    def test_description_validation_counted(self, stats):
+        from src.pypi_search_caching.pypi_search_caching import get_package_long_description
+        body = json.dumps({"info": {"description": "Long text"}}).encode()
+        resp = MagicMock(status_code=200, content=body, headers={"ETag": '"abc"'}, raise_for_status=lambda: None)
+        resp.json = lambda: json.loads(body)
+        with patch('requests.Session.get', return_value=resp):
+            get_package_long_description("testpkg")
+        with patch('requests.Session.get', return_value=MagicMock(status_code=304, content=b"")):
+            assert get_package_long_description("testpkg", validate_cache=True) == "Long text"
+        with patch('requests.Session.get', side_effect=RequestException("down")):
+            assert get_package_long_description("otherpkg") == ""
+        assert stats.snapshot()["counters"] == {
+            "description.miss": 2, "description.304": 1, "description.error": 1
+        }
+
+    def test_main_reports_stats(self, tmp_path, monkeypatch, capsys):
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.get_packages',
+                            lambda refresh: ["pkg1", "pkg2"])
+        out = tmp_path / "stats.json"
+        sys.argv = ['script', 'pkg.*', '--count-only', '--no-daemon', '--stats', '--stats-json', str(out)]
+        main()
+        assert "Run stats" in capsys.readouterr().err
+        report = json.loads(out.read_text())
+        assert set(report) == {"timestamp", "elapsed_seconds", "counters", "bytes", "latency"}
+
+
+class TestRenderedDetailsCache:
+    DOC = {"info": {"name": "pkg", "version": "1.0", "summary": "A pkg",
+                    "description": "Intro\n\n.. image:: x.png\n   :alt: x\n\nSee #. item"}}
+
+    def cache_details(self, doc=None, timestamp=None):
+        env = CacheManager.shared_env()
+        store_package_data(env, "pkg", {"timestamp": timestamp or time.time()}, json.dumps(doc or self.DOC))
+
+    def test_clean_details_markdown(self):
+        from src.pypi_search_caching.pypi_search_caching import clean_details_markdown
+        md = ("## pkg\n.. image:: x.png\n   :alt: x\n|\n#. one\n`<br>`\nfoo\\ bar\n"
+              ".. _docs: https://example.com\n:raw-html-m2r:`<b>`")
+        assert clean_details_markdown(md) == "## pkg\n* one\n\n\n\nfoo bar\n - _docs: `https://example.com`"
+
+    def test_store_and_load(self):
+        from src.pypi_search_caching.pypi_search_caching import store_rendered_details, load_rendered_details
+        assert store_rendered_details("pkg", False, "## pkg") is False  # no details cached yet
+        self.cache_details()
+        assert store_rendered_details("Pkg", False, "## pkg")
+        store_rendered_details("pkg", True, "## pkg\nfull")
+        assert load_rendered_details("PKG", False) == "## pkg"
+        assert load_rendered_details("pkg", True) == "## pkg\nfull"
+
+    def test_invalidated_by_new_version_expiry_and_renderer(self):
+        from src.pypi_search_caching.pypi_search_caching import store_rendered_details, load_rendered_details
+        self.cache_details()
+        store_rendered_details("pkg", False, "## pkg")
+        with patch('src.pypi_search_caching.pypi_search_caching._renderer_fingerprint', 1):
+            assert load_rendered_details("pkg", False) is None
+        assert load_rendered_details("pkg", False) == "## pkg"
+        self.cache_details({"info": dict(self.DOC["info"], version="2.0")})
+        assert load_rendered_details("pkg", False) is None
+        store_rendered_details("pkg", False, "## pkg 2.0")
+        assert load_rendered_details("pkg", False) == "## pkg 2.0"
+        self.cache_details({"info": dict(self.DOC["info"], version="2.0")}, timestamp=1.0)
+        assert load_rendered_details("pkg", False) is None
+
+    def test_pruned_with_details(self):
+        from src.pypi_search_caching.pypi_search_caching import (
+            store_rendered_details, prune_lmdb_cache, LMDB_RENDERED_DB,
+        )
+        self.cache_details(timestamp=1.0)
+        store_rendered_details("pkg", True, "## pkg")
+        env = CacheManager.shared_env()
+        assert prune_lmdb_cache(env) == 1
+        with env.begin() as txn:
+            assert txn.stat(CacheManager.details_dbs(env)[LMDB_RENDERED_DB])["entries"] == 0
+
+    def test_fingerprint_covers_renderer_code(self, monkeypatch):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        before = psc.renderer_fingerprint()
+        monkeypatch.setattr(psc, "_renderer_fingerprint", None)
+        monkeypatch.setattr(psc, "_DETAILS_MD_SUBS", psc._DETAILS_MD_SUBS[:-1])
+        assert psc.renderer_fingerprint() != before
+
+    @patch('src.pypi_search_caching.pypi_search_caching.get_packages', return_value=["pkg"])
+    def test_repeat_view_skips_fetch_and_render(self, mock_get, capsys):
+        body = json.dumps(self.DOC).encode()
+        resp = MagicMock(status_code=200, content=body, headers={}, raise_for_status=lambda: None)
+        resp.json = lambda: json.loads(body)
+        sys.argv = ['script', 'pkg', '-d', '-f', '--no-daemon']
+        with patch('requests.Session.get', return_value=resp):
+            main()
+        first = strip_ansi(capsys.readouterr().out)
+        assert "A pkg" in first and ".. image::" not in first and "* item" in first
+        with patch('src.pypi_search_caching.pypi_search_caching.fetch_project_details') as mock_fetch, \
+                patch('src.pypi_search_caching.pypi_search_caching.clean_details_markdown') as mock_clean:
+            main()
+        mock_fetch.assert_not_called()
+        mock_clean.assert_not_called()
+        assert strip_ansi(capsys.readouterr().out) == first
+
+
+class TestDetailsPrefetch:
+    def test_map_prefetched_keeps_order_and_bound(self):
+        import random
+        import threading
+        from src.pypi_search_caching.pypi_search_caching import map_prefetched
+        lock = threading.Lock()
+        active = [0, 0]  # running, most running at once
+
+        def fetch(n):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(random.uniform(0.001, 0.01))
+            with lock:
+                active[0] -= 1
+            return n * n
+
+        assert list(map_prefetched(fetch, range(30), concurrency=4)) == [n * n for n in range(30)]
+        assert 1 < active[1] <= 4
+
+    def test_map_prefetched_sequential_in_caller_thread(self):
+        import threading
+        from src.pypi_search_caching.pypi_search_caching import map_prefetched
+        threads = []
+        results = map_prefetched(lambda n: threads.append(threading.current_thread()) or n, [1, 2, 3], concurrency=1)
+        assert threads == []  # nothing runs before it is asked for
+        assert list(results) == [1, 2, 3]
+        assert set(threads) == {threading.current_thread()}
+
+    def test_map_prefetched_window_is_bounded(self):
+        from src.pypi_search_caching.pypi_search_caching import map_prefetched
+        calls = []
+        results = map_prefetched(lambda n: calls.append(n) or n, range(50), concurrency=2)
+        assert next(results) == 0
+        time.sleep(0.05)
+        assert len(calls) <= 4  # 2 x concurrency ahead of the consumer
+        assert list(results) == list(range(1, 50))
+
+    def test_map_prefetched_close_cancels_the_rest(self):
+        from src.pypi_search_caching.pypi_search_caching import map_prefetched
+        calls = []
+        results = map_prefetched(lambda n: calls.append(n) or time.sleep(0.01), range(50), concurrency=2)
+        next(results)
+        results.close()
+        assert len(calls) < 50
+
+    @patch('src.pypi_search_caching.pypi_search_caching.get_packages')
+    def test_desc_fetches_concurrently_in_match_order(self, mock_get, capsys):
+        from src.test.pypi_standin import PyPIStandIn
+        names = [f"pkg{i:02}" for i in range(12)]
+        mock_get.return_value = names
+        projects = {n: {"info": {"name": n, "version": "1.0", "summary": f"Summary of {n}"}} for n in names}
+        sys.argv = ['script', 'pkg.*', '-d', '--no-daemon', '--concurrency', '6']
+        with PyPIStandIn(projects, latency=0.05) as server, \
+                patch('src.pypi_search_caching.pypi_search_caching.PYPI_JSON_URL', server.json_url):
+            main()
+        out = strip_ansi(capsys.readouterr().out)
+        assert server.requests == 10 and server.max_in_flight > 1  # --max_desc 10
+        positions = [out.index(f"Summary of {n}") for n in names[:10]]
+        assert positions == sorted(positions)
+        assert "Summary of pkg10" not in out and "... and 2 more matches" in out
+
+    @patch('src.pypi_search_caching.pypi_search_caching.get_packages')
+    def test_concurrent_details_share_the_batch_commits(self, mock_get):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        from src.test.pypi_standin import PyPIStandIn
+        names = [f"pkg{i:02}" for i in range(40)]
+        mock_get.return_value = names
+        projects = {n: {"info": {"name": n, "version": "1.0", "summary": f"Summary of {n}"}} for n in names}
+        sys.argv = ['script', 'pkg.*', '-d', '--no-daemon', '--concurrency', '8', '--max_desc', '40']
+        with PyPIStandIn(projects) as server, \
+                patch('src.pypi_search_caching.pypi_search_caching.PYPI_JSON_URL', server.json_url), \
+                patch.object(psc, 'write_with_growth', wraps=psc.write_with_growth) as mock_write:
+            main()
+        assert server.requests == 40
+        # Opening the cache, one prune, then 80 records (details and rendered
+        # Markdown) in a commit per 64 plus the final one, not one per record
+        assert mock_write.call_count <= 4
+        assert all(psc.load_rendered_details(n, False) for n in names)
+
+    @patch('src.pypi_search_caching.pypi_search_caching.get_packages', return_value=["a", "b", "c"])
+    @patch('src.pypi_search_caching.pypi_search_caching.map_prefetched')
+    def test_unlocked_cache_fetches_one_at_a_time(self, mock_map, mock_get, monkeypatch):
+        mock_map.return_value = (md for md in ["## a", "## b", "## c"])
+        monkeypatch.setenv("PYPI_SEARCH_LMDB_LOCK", "0")
+        sys.argv = ['script', '.', '-d', '--no-daemon', '--concurrency', '8']
+        main()
+        assert mock_map.call_args.args[1:] == (["a", "b", "c"], 1)
+
+
+class TestDescriptionPipeline:
+    DESCS = {f"pkg{i:03}": ("uses torch" if i % 3 == 0 else "plain") for i in range(150)}
+
+    @pytest.mark.parametrize("concurrency,jobs", [(1, 1), (8, 1), (4, 2)])
+    def test_match_descriptions_in_order(self, concurrency, jobs):
+        from src.pypi_search_caching.pypi_search_caching import match_descriptions
+        names = list(self.DESCS)
+        hits = match_descriptions(self.DESCS.get, names, re.compile("torch"), concurrency, jobs)
+        assert list(hits) == ["torch" in self.DESCS[n] for n in names]
+
+    def test_missing_descriptions_do_not_match(self):
+        from src.pypi_search_caching.pypi_search_caching import match_descriptions
+        assert list(match_descriptions(lambda n: None, ["a", "b"], re.compile(".*"))) == [True, True]
+        assert list(match_descriptions(lambda n: None, ["a"], re.compile("x"))) == [False]
+
+    @patch('src.pypi_search_caching.pypi_search_caching.get_packages')
+    def test_search_fetches_concurrently(self, mock_get, capsys):
+        from src.test.pypi_standin import PyPIStandIn
+        names = list(self.DESCS)[:30]
+        mock_get.return_value = names
+        projects = {n: {"info": {"name": n, "version": "1.0", "description": self.DESCS[n]}} for n in names}
+        sys.argv = ['script', 'pkg.*', '--search', 'torch', '--no-daemon', '--concurrency', '8']
+        with PyPIStandIn(projects, latency=0.02) as server, \
+                patch('src.pypi_search_caching.pypi_search_caching.PYPI_JSON_URL', server.json_url):
+            main()
+        out = strip_ansi(capsys.readouterr().out)
+        assert server.requests == 30 and server.max_in_flight > 1
+        shown = re.findall(r"pkg\d{3}", out)
+        assert shown == [n for n in names if "torch" in self.DESCS[n]]
+
+    @patch('src.pypi_search_caching.pypi_search_caching.get_packages')
+    def test_search_stores_share_the_batch_commits(self, mock_get):
+        import src.pypi_search_caching.pypi_search_caching as psc
+        from src.test.pypi_standin import PyPIStandIn
+        names = list(self.DESCS)[:40]
+        mock_get.return_value = names
+        projects = {n: {"info": {"name": n, "version": "1.0", "description": self.DESCS[n]}} for n in names}
+        sys.argv = ['script', 'pkg.*', '--search', 'torch', '--no-daemon', '--concurrency', '8']
+        with PyPIStandIn(projects) as server, \
+                patch('src.pypi_search_caching.pypi_search_caching.PYPI_JSON_URL', server.json_url), \
+                patch.object(psc, 'write_with_growth', wraps=psc.write_with_growth) as mock_write:
+            main()
+        assert server.requests == 40
+        # Opening the cache, one prune, then the 40 description stores in the final commit
+        assert mock_write.call_count <= 3
+        assert all(psc.get_package_long_description(n) == self.DESCS[n] for n in names)
+
+
+class TestHTTPSession:
+    DOC = {"info": {"name": "pkg", "version": "1.0", "summary": "A pkg", "description": "Desc"}}
+
+    @pytest.fixture(autouse=True)
+    def fresh_session(self, monkeypatch):
+        from src.pypi_search_caching.pypi_search_caching import close_http_session
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.HTTP_BACKOFF_SECONDS', 0.01)
+        close_http_session()
+        yield
+        close_http_session()
+
+    def test_one_session_sized_to_concurrency(self):
+        from src.pypi_search_caching.pypi_search_caching import http_session, HTTP_RETRIES
+        session = http_session()
+        assert http_session(16) is session
+        adapter = session.get_adapter("https://pypi.org/simple")
+        assert adapter._pool_maxsize == 16
+        assert adapter.max_retries.total == HTTP_RETRIES
+        assert http_session(4).get_adapter("https://pypi.org/simple") is adapter  # never shrinks
+
+    @patch('src.pypi_search_caching.pypi_search_caching.get_packages', return_value=["pkg"])
+    def test_main_sizes_pool(self, mock_get):
+        from src.pypi_search_caching.pypi_search_caching import http_session
+        sys.argv = ['script', 'pkg', '--count-only', '--no-daemon', '--concurrency', '24']
+        main()
+        assert http_session().get_adapter("https://pypi.org/simple")._pool_maxsize == 24
+
+    def test_connections_reused(self):
+        from src.test.pypi_standin import PyPIStandIn
+        with PyPIStandIn({"pkg": self.DOC}) as server, \
+                patch('src.pypi_search_caching.pypi_search_caching.PYPI_JSON_URL', server.json_url):
+            for _ in range(5):
+                assert "A pkg" in fetch_project_details("pkg", validate_cache=True)
+                CacheManager.close_shared_env()
+        assert server.requests == 5 and server.connections == 1
+
+    def test_server_errors_retried(self):
+        from src.test.pypi_standin import PyPIStandIn
+        with PyPIStandIn({"pkg": self.DOC}, errors=[502, 500]) as server, \
+                patch('src.pypi_search_caching.pypi_search_caching.PYPI_JSON_URL', server.json_url):
+            assert "A pkg" in fetch_project_details("pkg")
+        assert server.requests == 3
+
+    def test_exhausted_retries_return_last_answer(self):
+        from src.pypi_search_caching.pypi_search_caching import http_get, HTTP_RETRIES
+        from src.test.pypi_standin import PyPIStandIn
+        with PyPIStandIn({"pkg": self.DOC}, errors=[502] * 10) as server:
+            resp = http_get("http.json", server.json_url.format(package_name="pkg"))
+        assert resp.status_code == 502
+        assert server.requests == HTTP_RETRIES + 1
+
+
+class TestRateLimiter:
+    def test_bucket_paces_requests(self):
+        from src.pypi_search_caching.pypi_search_caching import RateLimiter
+        limiter = RateLimiter(rate=50, burst=5)
+        t0 = time.monotonic()
+        waits = [limiter.acquire() for _ in range(20)]
+        assert waits[:5] == [0.0] * 5
+        assert 0.25 < time.monotonic() - t0 < 0.6  # 15 tokens at 50/s
+
+    def test_unlimited_until_throttled(self):
+        from src.pypi_search_caching.pypi_search_caching import RateLimiter
+        limiter = RateLimiter()
+        assert sum(limiter.acquire() for _ in range(100)) == 0.0
+        limiter.throttled(0.1)
+        assert limiter.rate == pytest.approx(500)  # half of 100 sent in (at least) 0.1 s
+        limiter.throttled(5.0)  # in flight before the pause: no further cut
+        assert limiter.rate == pytest.approx(500)
+        assert limiter.paused_until - time.monotonic() > 4.5
+        limiter.configure()
+        limiter.throttled(0.1)
+        assert 0.08 < limiter.acquire() < 0.3
+
+    def test_backoff_without_retry_after_and_recovery(self, monkeypatch):
+        from src.pypi_search_caching.pypi_search_caching import RateLimiter
+        monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.HTTP_THROTTLE_PAUSE', 0.01)
+        limiter = RateLimiter(rate=20)
+        limiter.throttled()
+        first = limiter.paused_until
+        limiter.throttled()
+        assert limiter.strikes == 2 and limiter.paused_until > first
+        assert limiter.rate == 0.5  # HTTP_RATE_MIN
+        for _ in range(10):
+            limiter.succeeded()
+        assert limiter.strikes == 0 and 4 < limiter.rate < 20
+
+    def test_parse_retry_after(self):
+        from email.utils import formatdate
+        from src.pypi_search_caching.pypi_search_caching import parse_retry_after
+        assert parse_retry_after("3") == 3.0
+        assert parse_retry_after(None) is None and parse_retry_after("soon") is None
+        assert 25 < parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+        assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
+
+    def test_settles_at_server_limit(self):
+        from src.pypi_search_caching.pypi_search_caching import http_get, map_prefetched, run_stats
+        from src.test.pypi_standin import PyPIStandIn
+        names = [f"pkg{i}" for i in range(60)]
+        projects = {n: {"info": {"name": n}} for n in names}
+        run_stats.reset()
+        with PyPIStandIn(projects, rate=40, burst=5, retry_after="0.2") as server:
+            url = server.json_url
+            t0 = time.monotonic()
+            statuses = list(map_prefetched(lambda n: http_get("http.json", url.format(package_name=n)).status_code,
+                                           names, concurrency=8))
+            elapsed = time.monotonic() - t0
+        assert statuses == [200] * 60
+        assert server.throttled < 20 and server.requests == 60 + server.throttled
+        assert run_stats.snapshot()["counters"].get("http.429", 0) == server.throttled
+        assert elapsed < 4.0  # ~1.4 s at the server's 40 requests/s
+
+    def test_gives_up_after_throttle_retries(self, monkeypatch):
+        from src.pypi_search_caching.pypi_search_caching import http_get, HTTP_THROTTLE_RETRIES
+        from src.test.pypi_standin import PyPIStandIn
+        with PyPIStandIn({"pkg": {"info": {}}}, errors=[503] * 10) as server:
+            monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.HTTP_THROTTLE_PAUSE', 0.001)
+            resp = http_get("http.json", server.json_url.format(package_name="pkg"))
+        assert resp.status_code == 503
+        assert server.requests == HTTP_THROTTLE_RETRIES + 1
+
+    @patch('src.pypi_search_caching.pypi_search_caching.get_packages', return_value=["pkg"])
+    def test_rate_and_burst_flags(self, mock_get):
+        limiter = psc_attr("rate_limiter")
+        sys.argv = ['script', 'pkg', '--count-only', '--no-daemon', '--rate', '5', '--burst', '2']
+        main()
+        assert limiter.max_rate == 5 and limiter.burst == 2
+
 class TestFetchProjectDetails:
     def test_success(self):
         json_data = {"info": {"version": "1.0", "requires_python": ">=3.10", "home_page": "https://example.com", "project_urls": {"Download URL": "https://files.example", "Bug Tracker": "https://issues.example"}, "classifiers": ["License :: OSI Approved"], "summary": "Test pkg", "description": "Test desc"}}
         resp = MagicMock(status_code=200, json=lambda: json_data, raise_for_status=lambda: None)
-        with patch('requests.get', return_value=resp):
+        with patch('requests.Session.get', return_value=resp):
             md = fetch_project_details("testpkg", include_desc=True)
         assert "## testpkg" in md
         assert "**Version:** `1.0`" in md
@@ -197,7 +2138,7 @@ class TestFetchProjectDetails:
             'md': "## testpkg\n**Version:** `1.0`\n**Summary:** Test pkg"
         }
         with patch('src.pypi_search_caching.pypi_search_caching.retrieve_package_data', return_value=cached_data):
-            with patch('requests.get') as mock_get:
+            with patch('requests.Session.get') as mock_get:
                 md = fetch_project_details("testpkg", include_desc=True)
                 mock_get.assert_not_called()  # No request made
                 assert md == cached_data['md']
@@ -216,7 +2157,7 @@ class TestFetchProjectDetails:
             mock_resp.status_code = 200
             mock_resp.raise_for_status.return_value = None
             mock_resp.json.return_value = {"info": {"version": "1.0", "summary": "Test pkg"}}
-            with patch('requests.get', return_value=mock_resp):
+            with patch('requests.Session.get', return_value=mock_resp):
                 md = fetch_project_details("testpkg", include_desc=False)
                 assert "**Version:** `1.0`" in md
 
@@ -231,7 +2172,7 @@ class TestFetchProjectDetails:
         resp = MagicMock(status_code=200, json=lambda: json_data, raise_for_status=lambda: None)
 
         with patch('src.pypi_search_caching.pypi_search_caching.retrieve_package_data', return_value=None):
-            with patch('requests.get', return_value=resp):
+            with patch('requests.Session.get', return_value=resp):
                 with patch('src.pypi_search_caching.pypi_search_caching.init_lmdb_env') as mock_init:
                     with patch('src.pypi_search_caching.pypi_search_caching.store_package_data') as mock_store:
                         md = fetch_project_details("testpkg", include_desc=True)
@@ -250,7 +2191,7 @@ class TestFetchProjectDetails:
         resp = MagicMock(status_code=200, json=lambda: json_data, raise_for_status=lambda: None)
 
         with patch('src.pypi_search_caching.pypi_search_caching.retrieve_package_data', return_value=cached_data):
-            with patch('requests.get', return_value=resp):
+            with patch('requests.Session.get', return_value=resp):
                 with patch('src.pypi_search_caching.pypi_search_caching.store_package_data') as mock_store:
                     md = fetch_project_details("testpkg", include_desc=False, verbose=True, test_mode=True)
                     mock_store.assert_called_once()  # Treats as miss and stores
@@ -263,7 +2204,7 @@ class TestFetchProjectDetails:
         resp = MagicMock(status_code=200, json=lambda: json_data, raise_for_status=lambda: None)
 
         with patch('src.pypi_search_caching.pypi_search_caching.init_lmdb_env', side_effect=Exception("LMDB error")):
-            with patch('requests.get', return_value=resp):
+            with patch('requests.Session.get', return_value=resp):
                 md = fetch_project_details("testpkg", include_desc=False)
                 assert "**Version:** `1.0`" in md  # Fallback to direct fetch succeeds
 
@@ -274,7 +2215,7 @@ class TestFetchProjectDetails:
         resp = MagicMock(status_code=404)
 
         with patch('src.pypi_search_caching.pypi_search_caching.retrieve_package_data', return_value=None):
-            with patch('requests.get', return_value=resp):
+            with patch('requests.Session.get', return_value=resp):
                 with patch('src.pypi_search_caching.pypi_search_caching.store_package_data') as mock_store:
                     result = fetch_project_details("nonexistent", include_desc=False)
                     assert result is None
@@ -291,7 +2232,7 @@ class TestFetchProjectDetails:
         resp = MagicMock(status_code=200, json=lambda: json_data, raise_for_status=lambda: None)
 
         with patch('src.pypi_search_caching.pypi_search_caching.retrieve_package_data', return_value=None):
-            with patch('requests.get', return_value=resp):
+            with patch('requests.Session.get', return_value=resp):
                 with patch('src.pypi_search_caching.pypi_search_caching.store_package_data') as mock_store:
                     md = fetch_project_details("testpkg", include_desc=False)
                     mock_store.assert_called_once()
@@ -355,7 +2296,7 @@ class TestFetchProjectDetails:
                     "classifiers": ["License :: OSI Approved :: MIT", "Programming Language :: Python :: 3"]
                 }
             }
-            with patch('requests.get', return_value=mock_resp):
+            with patch('requests.Session.get', return_value=mock_resp):
                 md = fetch_project_details("testpkg", include_desc=False)
                 assert "**Version:** `1.0`" in md
                 assert "**Summary:** Test summary" in md
@@ -376,7 +2317,7 @@ class TestFetchProjectDetails:
         monkeypatch.setattr('time.time', lambda: 1234567890.0)
 
         # Cache hit (mock cached data)
-        def mock_retrieve(env, pkg):
+        def mock_retrieve(env, pkg, parts=("json", "md")):
             return {'headers': {'timestamp': 1234567890.0 - 100}, 'json': json.dumps({'info': {'version': '1.0'}}), 'md': None}
         monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.retrieve_package_data', mock_retrieve)
         with caplog.at_level(logging.INFO):
@@ -386,11 +2327,11 @@ class TestFetchProjectDetails:
 
     def test_404(self):
         resp = MagicMock(status_code=404)
-        with patch('requests.get', return_value=resp):
+        with patch('requests.Session.get', return_value=resp):
             assert fetch_project_details("nonexistent") is None
 
     def test_exception(self):
-        with patch('requests.get', side_effect=RequestException()):
+        with patch('requests.Session.get', side_effect=RequestException()):
             assert fetch_project_details("test") is None
 
 class TestGetPackages:
@@ -401,7 +2342,10 @@ class TestGetPackages:
 
     @pytest.mark.refresh_cache
     def test_cache_invalid_refresh(self):
-        with patch('src.pypi_search_caching.pypi_search_caching.is_cache_valid', return_value=False), patch('src.pypi_search_caching.pypi_search_caching.fetch_all_package_names', return_value=["pkg1"]), patch('src.pypi_search_caching.pypi_search_caching.save_packages_to_cache'):
+        index = {"names": ["pkg1"], "serials": None, "last_serial": None}
+        with patch('src.pypi_search_caching.pypi_search_caching.is_cache_valid', return_value=False), \
+                patch('src.pypi_search_caching.pypi_search_caching.fetch_package_index', return_value=index), \
+                patch('src.pypi_search_caching.pypi_search_caching.save_packages_to_cache'):
             pkgs = get_packages(refresh_cache=True)
         assert pkgs == ["pkg1"]
 
@@ -445,6 +2389,18 @@ class TestTestModeAndProgress:
         mock_args.max_desc = 10
         mock_args.verbose = False
         mock_args.test_mode = True
+        mock_args.jobs = 0
+        mock_args.normalized = False
+        mock_args.serve = False
+        mock_args.no_daemon = False
+        mock_args.recompress = False
+        mock_args.full_json = False
+        mock_args.no_sync = False
+        mock_args.stats = False
+        mock_args.stats_json = None
+        mock_args.concurrency = 8
+        mock_args.rate = 0.0
+        mock_args.burst = 10
         mock_argparser.parse_args.return_value = mock_args
         monkeypatch.setattr(sys, 'argv', ['script', 'pattern', '--test_mode'])
         main()
@@ -1086,9 +3042,9 @@ class TestLMDBCache:
         monkeypatch.setattr('src.pypi_search_caching.pypi_search_caching.LMDB_DIR', lmdb_path)
 
         env = init_lmdb_env()
-        # Verify map_size
+        # Verify map_size: starts small and grows on demand up to max_map_size
         info = env.info()
-        assert info['map_size'] == 10 * 1024**3  # 10GB
+        assert info['map_size'] == 64 * 1024**2
         # Other options are set at open, tested indirectly by successful init
         with env.begin(write=True) as txn:  # Verify not readonly
             pass
@@ -1222,7 +3178,7 @@ class TestLMDBCache:
         # Mock LMDB init to raise exception (warning case)
         with caplog.at_level(logging.WARNING):
             with patch('src.pypi_search_caching.pypi_search_caching.init_lmdb_env', side_effect=Exception("LMDB error")):
-                with patch('requests.get', return_value=resp):
+                with patch('requests.Session.get', return_value=resp):
                     md = fetch_project_details("testpkg", include_desc=False)
                     assert "**Version:** `1.0`" in md  # Fallback to direct fetch succeeds
                     assert 'Failed to store testpkg in LMDB cache' in caplog.text